@@ -0,0 +1,358 @@
+# admission.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from lazy import lazy_import
+
+openai = lazy_import("openai")
+log = logging.getLogger("aroma_bot.admission")
+
+# Приоритеты очереди: меньше — раньше
+INTERACTIVE = 0  # короткие запросы внутри /р (например, голосом надиктованное масло)
+NORMAL = 1       # вопросы ассистенту, обычная транскрипция
+
+
+class RateLimited(Exception):
+    """
+    Запрос не допущен к OpenAI: scope="user" — пользователь исчерпал свой лимит,
+    scope="global" — общая очередь не успела дойти до запроса за max_wait.
+    retry_after — через сколько секунд имеет смысл попробовать снова.
+    """
+    def __init__(self, retry_after, scope):
+        self.retry_after = retry_after
+        self.scope = scope
+        super().__init__(f"превышен лимит запросов ({scope}), повторите через {retry_after:.0f} с")
+
+
+class TokenBucket:
+    """
+    Ведро токенов: capacity токенов, пополнение rate токенов в секунду.
+    Время передаётся снаружи, поэтому поведение полностью определяется часами вызывающего.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def take(self, now, cost=1) -> bool:
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def wait_time(self, now, cost=1) -> float:
+        """
+        Через сколько секунд в ведре наберётся cost токенов.
+        """
+        self._refill(now)
+        missing = cost - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+    def full_at(self) -> float:
+        return self.updated + (self.capacity - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class Ticket:
+    """
+    Заявка на один запрос к OpenAI. granted=True — запрос допущен и занимает слот in-flight.
+    """
+    __slots__ = ("user_id", "priority", "cost", "enqueued_at", "granted", "cancelled")
+
+    def __init__(self, user_id, priority, cost, enqueued_at):
+        self.user_id = user_id
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = enqueued_at
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+    """
+    Допуск запросов к OpenAI (run ассистента, Whisper).
+
+    - Ведро на пользователя (user_rate / user_burst): превысивший лимит получает
+      RateLimited сразу, его запросы не занимают общую очередь.
+    - Общее ведро (global_rate / global_burst) и не больше max_in_flight запросов
+      одновременно; ожидающие допускаются по приоритету (INTERACTIVE раньше NORMAL),
+      внутри приоритета — по порядку поступления. Не дождавшиеся за max_wait — RateLimited.
+    - Ответ 429 (release с ошибкой или throttle) останавливает допуск на Retry-After
+      и вдвое снижает скорость общего ведра; каждый успешный запрос возвращает
+      по recovery доли исходной скорости.
+
+    Решения зависят только от clock, поэтому с поддельными часами поведение
+    воспроизводимо: submit() + poll() не блокируют, wait()/admit() — блокирующая обёртка.
+    """
+    def __init__(self, user_rate=0.2, user_burst=5, global_rate=3.0, global_burst=10,
+                 max_in_flight=8, max_wait=60.0, recovery=0.1, min_rate_factor=0.1,
+                 clock=time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.base_rate = global_rate
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.recovery = recovery
+        self.min_rate = global_rate * min_rate_factor
+        self.clock = clock
+
+        self._users = {}  # user_id -> TokenBucket
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._queue = []  # куча (приоритет, порядковый номер, Ticket)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+        # Счётчики
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+
+    # --- Неблокирующая часть ---
+
+    def charge_user(self, user_id, cost=1):
+        """
+        Списывает cost из лимита пользователя; если лимит исчерпан — RateLimited.
+        Отдельно от submit() — для обращений, которые с точки зрения пользователя
+        один запрос, а к OpenAI уходят несколькими (куски длинного голосового).
+        """
+        with self._cond:
+            self._charge_user(self.clock(), user_id, cost)
+
+    def submit(self, user_id, priority=NORMAL, cost=1) -> Ticket:
+        """
+        Ставит заявку в очередь. Если пользователь исчерпал свой лимит — RateLimited.
+        user_id=None — запрос уже учтён в лимите пользователя (charge_user),
+        заявка проходит только общие ограничения.
+        """
+        with self._cond:
+            now = self.clock()
+            if user_id is not None:
+                self._charge_user(now, user_id, cost)
+            ticket = Ticket(user_id, priority, cost, now)
+            heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+            self._dispatch(now)
+            return ticket
+
+    def poll(self, ticket) -> bool:
+        """
+        Пытается допустить ожидающие заявки; возвращает, допущена ли ticket.
+        """
+        with self._cond:
+            self._dispatch(self.clock())
+            return ticket.granted
+
+    def cancel(self, ticket):
+        with self._cond:
+            if ticket.granted:
+                self._release(ticket, None)
+            else:
+                ticket.cancelled = True
+
+    def release(self, ticket, error=None):
+        """
+        Запрос завершён: освобождает слот. error с ответом 429 тормозит допуск.
+        """
+        with self._cond:
+            self._release(ticket, error)
+
+    def throttle(self, retry_after):
+        """
+        OpenAI ответил 429: пауза на retry_after секунд и снижение общей скорости.
+        """
+        with self._cond:
+            self._throttle(self.clock(), retry_after)
+
+    def _charge_user(self, now, user_id, cost):
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            if len(self._users) >= 10000:
+                self._prune_users(now)
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, now)
+        if not bucket.take(now, cost):
+            self.rejected += 1
+            raise RateLimited(bucket.wait_time(now, cost), "user")
+
+    def _release(self, ticket, error):
+        if not ticket.granted:
+            return
+        ticket.granted = False
+        self._in_flight -= 1
+        now = self.clock()
+        retry_after = retry_after_of(error) if error is not None else None
+        if retry_after is not None:
+            self._throttle(now, retry_after)
+        elif error is None and self._global.rate < self.base_rate:
+            self._global._refill(now)
+            self._global.rate = min(self.base_rate, self._global.rate + self.base_rate * self.recovery)
+        self._dispatch(now)
+
+    def _throttle(self, now, retry_after):
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, now + retry_after)
+        self._global._refill(now)
+        self._global.tokens = 0.0
+        self._global.rate = max(self.min_rate, self._global.rate / 2)
+        log.warning("OpenAI ответил 429: пауза %.1f с, скорость допуска %.2f запр/с",
+                    retry_after, self._global.rate)
+
+    def _dispatch(self, now):
+        granted = False
+        while self._queue and self._in_flight < self.max_in_flight and now >= self._paused_until:
+            ticket = self._queue[0][2]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if not self._global.take(now, ticket.cost):
+                break
+            heapq.heappop(self._queue)
+            ticket.granted = True
+            self._in_flight += 1
+            self.admitted += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _next_event(self, now):
+        """
+        Через сколько секунд очередь может сдвинуться сама (без release).
+        """
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._queue and self._in_flight < self.max_in_flight:
+            return self._global.wait_time(now, self._queue[0][2].cost)
+        return None
+
+    def _prune_users(self, now):
+        # Полные ведра ничего не помнят — их можно забыть
+        for user_id in [user_id for user_id, bucket in self._users.items() if bucket.full_at() <= now]:
+            del self._users[user_id]
+
+    # --- Блокирующая обёртка ---
+
+    def wait(self, ticket, timeout=None):
+        """
+        Ждёт допуска заявки не дольше timeout (по умолчанию max_wait) секунд,
+        иначе отменяет её и выбрасывает RateLimited.
+        """
+        deadline = self.clock() + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            while True:
+                now = self.clock()
+                self._dispatch(now)
+                if ticket.granted:
+                    return
+                if now >= deadline:
+                    ticket.cancelled = True
+                    self.timed_out += 1
+                    raise RateLimited(self._next_event(now) or 1.0, "global")
+                delay = deadline - now
+                next_event = self._next_event(now)
+                if next_event is not None:
+                    delay = min(delay, max(next_event, 0.001))
+                self._cond.wait(delay)
+
+    @contextmanager
+    def admit(self, user_id, priority=NORMAL, cost=1, timeout=None):
+        """
+        with controller.admit(user_id): ... — запрос к OpenAI внутри блока.
+        Исключение из блока с ответом 429 передаётся в ограничитель.
+        """
+        ticket = self.submit(user_id, priority, cost)
+        try:
+            self.wait(ticket, timeout)
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        except BaseException as e:
+            self.release(ticket, e)
+            raise
+        self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": sum(1 for _, _, ticket in self._queue if not ticket.cancelled),
+                "users": len(self._users),
+                "rate": self._global.rate,
+                "paused_for": max(0.0, self._paused_until - self.clock()),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "throttled": self.throttled,
+            }
+
+
+def retry_after_of(error, default=5.0):
+    """
+    Сколько секунд ждать после ошибки лимитов OpenAI (HTTP 429 или run с
+    last_error.code == "rate_limit_exceeded"). Для прочих ошибок — None.
+    """
+    last_error = getattr(error, "last_error", None)
+    code = last_error.get("code") if isinstance(last_error, dict) else getattr(last_error, "code", None)
+    if getattr(error, "status_code", None) != 429 and code != "rate_limit_exceeded":
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return default
+
+
+def is_retryable(error) -> bool:
+    """
+    Временная ошибка OpenAI, после которой запрос стоит повторить (те же, что повторяет
+    сам клиент openai): 408, 409, 429, 5xx, обрыв соединения и таймаут.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+def call_with_retries(func, *args, retries=2, backoff=0.5, on_throttle=None, sleep=time.sleep, **kwargs):
+    """
+    func(*args, **kwargs) с повторами временных ошибок OpenAI вместо повторов самого
+    клиента (openai.max_retries = 0): клиент молча пережидает 429, и ограничитель о них
+    не узнаёт. Здесь перед повтором после 429 вызывается on_throttle(retry_after)
+    (AdmissionController.throttle), пауза берётся из Retry-After; прочие временные
+    ошибки повторяются через backoff * 2^попытка секунд. Ошибка последней попытки
+    выбрасывается как есть — её 429 учтёт admit().
+    """
+    for attempt in itertools.count():
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            retry_after = retry_after_of(e)
+            if retry_after is not None:
+                if on_throttle is not None:
+                    on_throttle(retry_after)
+                delay = retry_after
+            else:
+                delay = backoff * 2 ** attempt
+            log.warning("Запрос к OpenAI не удался (попытка %d), повтор через %.1f с: %s", attempt + 1, delay, e)
+            sleep(delay)
@@ -0,0 +1,228 @@
+# answer_cache.py
+
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from catalog import normalize_name, stem_word
+
+# Слова, которые не меняют смысла вопроса («подскажите, пожалуйста, что такое лаванда»)
+_FILLER_WORDS = {
+    "пожалуйста", "подскажите", "подскажи", "скажите", "скажи", "расскажите", "расскажи",
+    "а", "и", "вот", "ну", "мне", "привет", "здравствуйте",
+}
+
+
+# Переспросы, местоимения и связки: без предыдущей реплики вопрос из них непонятен
+# («а подробнее?», «почему?», «а что насчёт него?»)
+_FOLLOW_UP_WORDS = {
+    "подробнее", "почему", "зачем", "да", "нет", "ок", "спасибо", "еще", "это", "этого", "этом",
+    "этот", "эта", "эти", "так", "тогда", "дальше", "продолжи", "продолжай", "насчет", "если",
+    "его", "ее", "их", "него", "нее", "них", "он", "она", "оно", "они", "там", "тут", "такое",
+    "можно", "пример", "например", "для", "что", "как", "какие", "какой", "какое",
+}
+
+# Сколько слов по существу нужно, чтобы вопрос считался самостоятельным
+MIN_TOPIC_WORDS = 2
+
+# Предметы, о которых вопрос из одного слова понятен и без контекста («что такое диффузор»).
+# Названия масел добавляются из монографий: AnswerCache.add_topics
+_TOPIC_WORDS = {stem_word(word) for word in (
+    "масло", "масла", "диффузор", "аромалампа", "массаж", "смесь", "ингаляция",
+)}
+
+
+def normalize_question(text: str) -> str:
+    """
+    Ключ точного уровня кеша: нормализованный текст без слов-паразитов.
+    """
+    return " ".join(word for word in normalize_name(text).split() if word not in _FILLER_WORDS)
+
+
+def is_self_contained(question: str, topics=frozenset()) -> bool:
+    """
+    Грубая проверка, что вопрос понятен без предыдущих реплик: кроме слов-паразитов,
+    переспросов и местоимений в нём есть хотя бы MIN_TOPIC_WORDS слов по существу
+    («противопоказания мяты перечной» — да, «а подробнее?» и «а с лимоном?» — нет)
+    или есть известный предмет — масло из topics (основы слов) или общий вроде диффузора
+    («что такое лаванда», «для чего мята» — да).
+    """
+    words = [
+        word for word in normalize_question(question).split()
+        if len(word) >= 3 and word not in _FOLLOW_UP_WORDS
+    ]
+    if len(words) >= MIN_TOPIC_WORDS:
+        return True
+    return any(stem_word(word) in _TOPIC_WORDS or stem_word(word) in topics for word in words)
+
+
+class _CacheEntry:
+    __slots__ = ("answer", "expires_at", "size", "terms")
+
+    def __init__(self, answer, expires_at, size, terms):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.size = size
+        self.terms = terms
+
+
+class AnswerCache:
+    """
+    Кеш ответов ассистента, не зависящий от контекста диалога. Что можно класть в кеш
+    (только самостоятельные вопросы, см. is_self_contained), решает вызывающий код.
+
+    - Точный уровень: ключ — нормализованный текст вопроса.
+    - Похожие вопросы (если задан similarity): косинусная близость TF-IDF векторов
+      по основам слов; кандидаты отбираются через инвертированный индекс терм -> ключи.
+    - Вытеснение LRU, TTL на запись и ограничение общего размера в байтах (max_bytes).
+    """
+    def __init__(self, max_bytes=5 * 1024 * 1024, ttl=24 * 3600, similarity=None, clock=time.monotonic,
+                 topics=()):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity = similarity
+        self.clock = clock
+        # Основы названий масел для is_self_contained
+        self.topics = frozenset(topics)
+
+        self._entries = OrderedDict()  # ключ -> _CacheEntry, от давно использованных к свежим
+        self._postings = {}            # терм -> множество ключей
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        # Метрики
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.miss_seconds = 0.0  # суммарное время ответов ассистента на промахах
+
+    # --- Публичный интерфейс ---
+
+    def get(self, question: str):
+        """
+        Возвращает сохранённый ответ или None.
+        """
+        key = normalize_question(question)
+        if not key:
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry.answer
+            if self.similarity is not None:
+                entry = self._lookup_similar(key, now)
+                if entry is not None:
+                    self.similar_hits += 1
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, elapsed: float = 0.0):
+        """
+        Сохраняет ответ. elapsed — сколько секунд занял ответ ассистента
+        (по нему оценивается сэкономленное время).
+        """
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        size = len(key.encode("utf-8")) + len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        terms = Counter(stem_word(word) for word in key.split())
+        with self._lock:
+            self.miss_seconds += elapsed
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(answer, self.clock() + self.ttl, size, terms)
+            self.bytes += size
+            for term in terms:
+                self._postings.setdefault(term, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def add_topics(self, topics):
+        """
+        Добавляет основы названий масел, по которым короткий вопрос считается самостоятельным.
+        """
+        self.topics = self.topics | frozenset(topics)
+
+    def is_self_contained(self, question: str) -> bool:
+        return is_self_contained(question, self.topics)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            answered = self.misses or 1
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                # Каждое попадание экономит в среднем столько, сколько длится промах
+                "saved_seconds": (self.hits + self.similar_hits) * self.miss_seconds / answered,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # --- Внутренняя кухня (вызывается под self._lock) ---
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for term in entry.terms:
+            keys = self._postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[term]
+
+    def _idf(self, term):
+        return math.log(1 + len(self._entries) / (1 + len(self._postings.get(term, ()))))
+
+    def _vector(self, terms):
+        vector = {term: count * self._idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return vector, norm
+
+    def _lookup_similar(self, key, now):
+        terms = Counter(stem_word(word) for word in key.split())
+        candidates = set()
+        for term in terms:
+            candidates |= self._postings.get(term, set())
+        if not candidates:
+            return None
+        query, query_norm = self._vector(terms)
+        best_key, best_score = None, self.similarity
+        for candidate in candidates:
+            vector, norm = self._vector(self._entries[candidate].terms)
+            if not norm or not query_norm:
+                continue
+            score = sum(value * vector.get(term, 0.0) for term, value in query.items()) / (norm * query_norm)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        if best_key is None:
+            return None
+        return self._lookup(best_key, now)
@@ -1,9 +1,19 @@
 # assistent.py
 
 import os
+import threading
 import time
-import openai
+from collections import OrderedDict
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from lazy import lazy_import
+from run_poller import RunFailedError, RunPoller, RunTimeoutError
+from thread_store import MemoryThreadStore, ThreadSweeper
+from metrics import span
+from admission import call_with_retries
+
+# openai импортируется при первом запросе (или фоновым прогревом бота)
+openai = lazy_import("openai")
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -14,14 +24,106 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 assistant_id = 'asst_gDfpe4WMzW9bUUaN3IfyivY8'
 
 class AssistantDialogManager:
-    def __init__(self, time_limit=1200):
+    def __init__(self, time_limit=1200, run_deadline=120.0, poller=None, store=None, cache=None,
+                 admission=None):
         """
         time_limit = 1200 секунд (20 минут) - 
         по истечении этого времени тред считается «протухшим» 
         и при новом сообщении создаётся заново.
+        run_deadline - сколько секунд ждём завершения одного run, после чего он отменяется.
+        poller - общий RunPoller; если не передан, создаётся свой.
+        store - хранилище user_id -> (thread_id, last_access) из thread_store.py;
+        по умолчанию LRU в памяти процесса.
+        cache - AnswerCache из answer_cache.py; если задан, одинаковые вопросы
+        отвечаются из кеша без сообщения в тред и run. В кеш попадают и из него
+        отвечаются только самостоятельные вопросы, с которых начинается диалог
+        (нет живого треда), — уточнения вроде «а подробнее?» всегда идут ассистенту.
+        admission - AdmissionController из admission.py; если задан, каждое обращение
+        к ассистенту (после промаха кеша) проходит через лимиты и может выбросить RateLimited.
         """
-        self.threads = {}  # user_id -> (thread_id, last_access_time)
+        self.store = store or MemoryThreadStore()
+        self.cache = cache
+        self.admission = admission
         self.time_limit = time_limit
+        self.run_deadline = run_deadline
+        self.poller = poller or RunPoller(
+            deadline=run_deadline, on_throttle=admission.throttle if admission is not None else None
+        )
+        self.sweeper = None
+        # Ответы из кеша, которых ещё нет в треде пользователя:
+        # user_id -> (время последнего, [(вопрос, ответ)]). Переносятся в тред перед следующим
+        # сообщением, чтобы уточняющий вопрос после ответа из кеша не потерял контекст
+        self._cached_exchanges = OrderedDict()
+        self._cached_lock = threading.Lock()
+
+    def start_sweeper(self, interval=60.0, batch_size=50):
+        """
+        Запускает фоновое удаление протухших тредов (в том числе тех, чьи пользователи
+        больше не пишут).
+        """
+        if self.sweeper is None:
+            self.sweeper = ThreadSweeper(
+                self.store, self.time_limit, interval=interval, batch_size=batch_size,
+                on_throttle=self.admission.throttle if self.admission is not None else None,
+            )
+            self.sweeper.start()
+        return self.sweeper
+
+    def _admit(self, user_id):
+        if self.admission is None:
+            return nullcontext()
+        return self.admission.admit(user_id)
+
+    def _has_context(self, user_id: int) -> bool:
+        """
+        Есть ли у пользователя живой диалог: непротухший тред
+        или ответы из кеша, которые ещё не перенесены в тред.
+        """
+        now = time.time()
+        entry = self.store.get(user_id)
+        if entry is not None and now - entry[1] <= self.time_limit:
+            return True
+        with self._cached_lock:
+            pending = self._cached_exchanges.get(user_id)
+        return pending is not None and now - pending[0] <= self.time_limit
+
+    def _cacheable(self, user_id: int, text: str) -> bool:
+        """
+        Можно ли ответить на вопрос из кеша и положить ответ в кеш: вопрос понятен
+        без предыдущих реплик и начинает новый диалог.
+        """
+        return self.cache is not None and self.cache.is_self_contained(text) and not self._has_context(user_id)
+
+    def _remember_cached(self, user_id: int, text: str, answer: str, max_users=10000):
+        """
+        Запоминает ответ из кеша, чтобы перенести его в тред перед следующим сообщением.
+        """
+        now = time.time()
+        with self._cached_lock:
+            _, exchanges = self._cached_exchanges.pop(user_id, (now, []))
+            exchanges.append((text, answer))
+            self._cached_exchanges[user_id] = (now, exchanges)
+            while len(self._cached_exchanges) > max_users:
+                self._cached_exchanges.popitem(last=False)
+
+    def _replay_cached(self, user_id: int, thread_id: str):
+        """
+        Дописывает в тред ответы из кеша, выданные пользователю после последнего run.
+        """
+        with self._cached_lock:
+            pending = self._cached_exchanges.pop(user_id, None)
+        if pending is None or time.time() - pending[0] > self.time_limit:
+            return
+        for question, answer in pending[1]:
+            self._call(openai.beta.threads.messages.create, thread_id=thread_id, role="user", content=question)
+            self._call(openai.beta.threads.messages.create, thread_id=thread_id, role="assistant", content=answer)
+
+    def _call(self, func, **kwargs):
+        """
+        Запрос к OpenAI с повторами временных ошибок; 429 тормозят admission.
+        """
+        on_throttle = self.admission.throttle if self.admission is not None else None
+        return call_with_retries(func, on_throttle=on_throttle, **kwargs)
 
     def _parse_content_to_str(self, content):
         """
@@ -46,26 +148,30 @@ class AssistantDialogManager:
         """
         current_time = time.time()
         # Проверяем, есть ли уже тред для этого пользователя
-        if user_id not in self.threads:
+        entry = self.store.get(user_id)
+        if entry is None:
             # Создаём новый тред
-            thread = openai.beta.threads.create()
-            self.threads[user_id] = (thread.id, current_time)
-        else:
-            thread_id, last_access = self.threads[user_id]
-            # Если пользователь молчал дольше, чем time_limit, 
-            # закрываем старый тред и создаём новый
-            if current_time - last_access > self.time_limit:
-                try:
-                    openai.beta.threads.delete(thread_id=thread_id)
-                except:
-                    pass
-                # Создаём новый тред
-                thread = openai.beta.threads.create()
-                self.threads[user_id] = (thread.id, current_time)
+            thread = self._call(openai.beta.threads.create)
+            self.store.put(user_id, thread.id, current_time)
+            return thread.id
+
+        thread_id, last_access = entry
+        # Если пользователь молчал дольше, чем time_limit, 
+        # закрываем старый тред и создаём новый
+        if current_time - last_access > self.time_limit:
+            try:
+                openai.beta.threads.delete(thread_id=thread_id)
+            except Exception:
+                # Не получилось сейчас — удалит sweeper, иначе тред останется на стороне OpenAI
+                if self.sweeper is not None:
+                    self.sweeper.retry_later(thread_id)
+            # Создаём новый тред
+            thread = self._call(openai.beta.threads.create)
+            self.store.put(user_id, thread.id, current_time)
+            return thread.id
 
         # Обновляем время последнего доступа для пользователя
-        thread_id, _ = self.threads[user_id]
-        self.threads[user_id] = (thread_id, current_time)
+        self.store.touch(user_id, current_time)
         return thread_id
 
     def add_user_message(self, user_id: int, content: str):
@@ -73,32 +179,34 @@ class AssistantDialogManager:
         Добавляет в диалог сообщение от пользователя (role='user').
         """
         thread_id = self._get_thread_id(user_id)
-        openai.beta.threads.messages.create(
+        self._replay_cached(user_id, thread_id)
+        self._call(
+            openai.beta.threads.messages.create,
             thread_id=thread_id,
             role="user",
             content=content
         )
-        self.threads[user_id] = (thread_id, time.time())
+        self.store.touch(user_id, time.time())
 
     def run_assistant(self, user_id: int) -> str:
         """
         Запускает ассистента (создаёт run) и дожидается ответа,
         затем возвращает текст ответа ассистента.
+        Если run завершился ошибкой или не уложился в run_deadline,
+        выбрасывается RunFailedError / RunTimeoutError.
         """
         thread_id = self._get_thread_id(user_id)
-        run = openai.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
-        # Ждём завершения run
-        while True:
-            run_status = openai.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            if run_status.status == "completed":
-                break
-            time.sleep(1)
+        with span("assistant.run"):
+            run = self._call(
+                openai.beta.threads.runs.create,
+                thread_id=thread_id,
+                assistant_id=assistant_id
+            )
+            # Ждём завершения run: опросом занимается общий планировщик с backoff и дедлайном
+            self.poller.wait(thread_id, run.id, deadline=self.run_deadline)
 
         # Получаем самый свежий ответ ассистента (не pinned)
-        messages = openai.beta.threads.messages.list(thread_id=thread_id)
+        messages = self._call(openai.beta.threads.messages.list, thread_id=thread_id)
         sorted_msgs = sorted(messages.data, key=lambda m: m.created_at, reverse=True)
         for msg in sorted_msgs:
             if msg.role == "assistant":
@@ -108,9 +216,111 @@ class AssistantDialogManager:
                     return self._parse_content_to_str(msg.content)
         return ""
 
+    def stream_assistant(self, user_id: int):
+        """
+        Запускает ассистента в потоковом режиме (stream=True) и отдаёт кусочки текста ответа
+        по мере их генерации. Ошибки run и превышение run_deadline выбрасываются
+        как RunFailedError / RunTimeoutError.
+        """
+        thread_id = self._get_thread_id(user_id)
+        run_id = None
+        expired = threading.Event()
+
+        def expire(stream):
+            # Зависший поток событий сам не закончится: закрываем его, и итерация прерывается
+            expired.set()
+            stream.close()
+
+        # timeout= ограничивает ожидание каждого куска потока, таймер — весь run целиком.
+        # Поток — контекстный менеджер: HTTP-соединение закрывается при любом выходе,
+        # в том числе по исключению или если потребитель бросил генератор
+        with self._call(
+            openai.beta.threads.runs.create,
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            stream=True,
+            timeout=self.run_deadline
+        ) as stream:
+            timer = threading.Timer(self.run_deadline, expire, args=(stream,))
+            timer.daemon = True
+            timer.start()
+            try:
+                for event in stream:
+                    if expired.is_set():
+                        break
+                    kind = event.event
+                    if kind == "thread.run.created":
+                        run_id = event.data.id
+                    elif kind == "thread.message.delta":
+                        for block in event.data.delta.content or []:
+                            text = getattr(block, "text", None)
+                            if text is not None and text.value:
+                                yield text.value
+                    elif kind == "thread.run.completed":
+                        return
+                    elif kind in ("thread.run.failed", "thread.run.expired",
+                                  "thread.run.cancelled", "thread.run.incomplete"):
+                        raise RunFailedError(event.data.id, event.data.status, getattr(event.data, "last_error", None))
+                    elif kind == "thread.run.requires_action":
+                        # Инструменты ассистенту не подключены — такой run сам не завершится
+                        openai.beta.threads.runs.cancel(thread_id=thread_id, run_id=event.data.id)
+                        raise RunFailedError(event.data.id, "requires_action", "инструменты не поддерживаются")
+                    elif kind == "error":
+                        raise RunFailedError(run_id, "error", event.data)
+            except Exception:
+                # Ошибка чтения закрытого таймером потока — это истёкший дедлайн
+                if not expired.is_set():
+                    raise
+            finally:
+                timer.cancel()
+
+        if expired.is_set():
+            if run_id is not None:
+                try:
+                    openai.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+                except Exception:
+                    pass
+            raise RunTimeoutError(run_id)
+
+    def ask_assistant_stream(self, user_id: int, text: str):
+        """
+        Потоковый аналог ask_assistant: добавляет сообщение пользователя
+        и отдаёт ответ ассистента кусочками.
+        """
+        cacheable = self._cacheable(user_id, text)
+        if cacheable:
+            cached = self.cache.get(text)
+            if cached is not None:
+                self._remember_cached(user_id, text, cached)
+                yield cached
+                return
+        started = time.monotonic()
+        chunks = []
+        with self._admit(user_id):
+            with span("assistant.message"):
+                self.add_user_message(user_id, text)
+            with span("assistant.stream"):
+                for chunk in self.stream_assistant(user_id):
+                    chunks.append(chunk)
+                    yield chunk
+        if cacheable:
+            self.cache.put(text, self._parse_content_to_str("".join(chunks)), time.monotonic() - started)
+
     def ask_assistant(self, user_id: int, text: str) -> str:
         """
         Удобная обёртка: добавляет сообщение пользователя и сразу возвращает ответ ассистента.
         """
-        self.add_user_message(user_id, text)
-        return self.run_assistant(user_id)
+        cacheable = self._cacheable(user_id, text)
+        if cacheable:
+            cached = self.cache.get(text)
+            if cached is not None:
+                self._remember_cached(user_id, text, cached)
+                return cached
+        started = time.monotonic()
+        with self._admit(user_id):
+            with span("assistant.message"):
+                self.add_user_message(user_id, text)
+            reply = self.run_assistant(user_id)
+        if cacheable:
+            self.cache.put(text, reply, time.monotonic() - started)
+        return reply
@@ -0,0 +1,130 @@
+# audio.py
+
+import io
+import subprocess
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError, CouldntEncodeError
+
+# Whisper обучен на 16 кГц моно — больше ему не нужно
+TARGET_RATE = 16000
+
+
+def _ffmpeg(args, data: bytes, error) -> bytes:
+    """
+    Прогоняет data через ffmpeg: вход — stdin, выход — stdout, без временных файлов.
+    Путь к ffmpeg — тот же, что настроен у pydub (AudioSegment.converter).
+    """
+    process = subprocess.run(
+        [AudioSegment.converter, "-nostdin", "-loglevel", "error", *args],
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if process.returncode != 0:
+        raise error(f"ffmpeg завершился с кодом {process.returncode}: "
+                    f"{process.stderr.decode('utf-8', 'replace').strip()}")
+    return process.stdout
+
+
+class PreparedAudio:
+    """
+    Результат подготовки голосового сообщения к распознаванию.
+    """
+    __slots__ = ("segment", "speech", "duration_ms")
+
+    def __init__(self, segment, speech, duration_ms):
+        self.segment = segment          # AudioSegment 16 кГц моно, обрезанный по речи
+        self.speech = speech            # [(start_ms, end_ms)] участков речи внутри segment
+        self.duration_ms = duration_ms  # длительность исходного сообщения
+
+    def export(self, segment=None, format="ogg", codec="libopus", bitrate="24k"):
+        """
+        Кодирует аудио в компактный формат (по умолчанию OGG/Opus) и возвращает BytesIO
+        с подходящим name — его можно сразу отдавать в openai.audio.transcriptions.create.
+        PCM подаётся в ffmpeg через stdin, результат читается из stdout: в отличие от
+        AudioSegment.export, временные файлы не создаются.
+        """
+        if segment is None:
+            segment = self.segment
+        encoded = _ffmpeg(
+            ["-f", "s16le", "-ar", str(segment.frame_rate), "-ac", str(segment.channels), "-i", "pipe:0",
+             "-c:a", codec, "-b:a", bitrate, "-f", format, "pipe:1"],
+            segment.raw_data, CouldntEncodeError
+        )
+        buffer = io.BytesIO(encoded)
+        buffer.name = f"audio.{format}"
+        return buffer
+
+
+def decode_audio(data: bytes, format="ogg") -> AudioSegment:
+    """
+    Декодирует аудио прямо из памяти, без временного файла. Понижение до 16 кГц моно
+    16 бит делает сам ffmpeg при декодировании (-ac 1 -ar 16000), так что 48 кГц
+    от Telegram не разворачиваются в Python целиком.
+    """
+    raw = _ffmpeg(
+        ["-f", format, "-i", "pipe:0", "-vn", "-ac", "1", "-ar", str(TARGET_RATE), "-f", "s16le", "pipe:1"],
+        data, CouldntDecodeError
+    )
+    return AudioSegment(raw, frame_rate=TARGET_RATE, sample_width=2, channels=1)
+
+
+def frame_levels(segment: AudioSegment, frame_ms=20) -> np.ndarray:
+    """
+    Громкость (dBFS) каждого кадра длиной frame_ms, посчитанная векторно через NumPy.
+    """
+    samples = np.frombuffer(segment.raw_data, dtype=np.int16).astype(np.float32)
+    frame_len = max(1, segment.frame_rate * frame_ms // 1000)
+    count = len(samples) // frame_len
+    if count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:count * frame_len].reshape(count, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(rms / 32768.0)
+
+
+def detect_speech(levels: np.ndarray, frame_ms=20, silence_thresh=-40.0, min_silence_len=1000):
+    """
+    Участки речи [(start_ms, end_ms)] по громкости кадров: кадр «звучит», если он громче
+    silence_thresh; паузы короче min_silence_len не разрывают участок (как в
+    pydub.silence.detect_nonsilent, но без посэмпловых циклов на Python).
+    """
+    voiced = levels > silence_thresh
+    if not voiced.any():
+        return []
+    # Границы непрерывных звучащих отрезков
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_gap = max(1, min_silence_len // frame_ms)
+    segments = []
+    for start, end in zip(starts, ends):
+        if segments and start - segments[-1][1] < min_gap:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    return [(int(start) * frame_ms, int(end) * frame_ms) for start, end in segments]
+
+
+def prepare_audio(data: bytes, format="ogg", silence_thresh=-40.0, min_silence_len=1000,
+                  frame_ms=20, padding_ms=200):
+    """
+    Полный конвейер: декодирование из памяти -> 16 кГц моно -> поиск речи ->
+    обрезка тишины в начале и в конце. Возвращает PreparedAudio или None,
+    если в сообщении нет ничего, кроме тишины.
+    """
+    segment = decode_audio(data, format=format)
+    duration_ms = len(segment)
+    if duration_ms == 0:
+        return None
+    speech = detect_speech(frame_levels(segment, frame_ms), frame_ms, silence_thresh, min_silence_len)
+    if not speech:
+        return None
+
+    trim_start = max(0, speech[0][0] - padding_ms)
+    trim_end = min(duration_ms, speech[-1][1] + padding_ms)
+    trimmed = segment[trim_start:trim_end]
+    speech = [(start - trim_start, end - trim_start) for start, end in speech]
+    return PreparedAudio(trimmed, speech, duration_ms)
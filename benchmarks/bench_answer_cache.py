@@ -0,0 +1,83 @@
+# benchmarks/bench_answer_cache.py
+#
+# Прогон журнала вопросов через AssistantDialogManager.ask_assistant с AnswerCache —
+# с тем же отбором, что в боте: в кеш попадают и из него отвечаются только самостоятельные
+# вопросы (is_self_contained с названиями масел из монографий) от пользователей без живого
+# треда. Ассистент — заглушка OpenAI из benchmarks/fakes.py (треды, run'ы, опрос).
+#
+# В журнале нет автора вопроса: --users N раскладывает вопросы по N пользователям по кругу
+# (0 — каждый вопрос от нового пользователя, верхняя оценка). Чем меньше пользователей,
+# тем чаще у автора уже есть живой тред, и вопрос идёт ассистенту мимо кеша.
+# Сэкономленное время считается по --assistant-seconds на каждое попадание.
+#
+# Запуск: python benchmarks/bench_answer_cache.py [--log benchmarks/data/questions_log.txt]
+#         [--assistant-seconds 12] [--similarity 0.8] [--users 0]
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeOpenAI  # noqa: E402
+
+
+def replay(questions, manager, users):
+    gated = {"не самостоятельный": 0, "живой тред": 0}
+    started = time.perf_counter()
+    for index, question in enumerate(questions):
+        user_id = 1000 + (index % users if users else index)
+        if not manager.cache.is_self_contained(question):
+            gated["не самостоятельный"] += 1
+        elif manager._has_context(user_id):
+            gated["живой тред"] += 1
+        manager.ask_assistant(user_id, question)
+    return gated, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--log", default=os.path.join(ROOT, "benchmarks", "data", "questions_log.txt"))
+    parser.add_argument("--assistant-seconds", type=float, default=12.0,
+                        help="сколько в среднем длится ответ ассистента (сообщение + run + опрос)")
+    parser.add_argument("--similarity", type=float, default=0.8)
+    parser.add_argument("--users", type=int, default=0,
+                        help="сколько пользователей задают вопросы журнала (0 — каждый вопрос новый)")
+    args = parser.parse_args()
+
+    with open(args.log, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    total_without_cache = len(questions) * args.assistant_seconds
+
+    with FakeOpenAI(run_seconds=0.01, run_jitter=0.0) as openai_fake:
+        os.environ["OPENAI_API_KEY"] = "sk-bench"
+        os.environ["OPENAI_BASE_URL"] = openai_fake.api_base
+
+        from answer_cache import AnswerCache
+        from assistent import AssistantDialogManager
+        from oil_knowledge import OilKnowledgeBase
+        from run_poller import RunPoller
+
+        topics = OilKnowledgeBase.from_file().name_terms
+        poller = RunPoller(initial_delay=0.01, max_delay=0.05)
+        try:
+            for label, similarity in (("только точный ключ", None), (f"+ похожие (>= {args.similarity})", args.similarity)):
+                cache = AnswerCache(similarity=similarity, topics=topics)
+                manager = AssistantDialogManager(poller=poller, cache=cache)
+                gated, elapsed = replay(questions, manager, args.users)
+                m = cache.metrics()
+                saved = (m["hits"] + m["similar_hits"]) * args.assistant_seconds
+                print(f"{label}: вопросов {len(questions)}, точных попаданий {m['hits']}, "
+                      f"похожих {m['similar_hits']}, промахов {m['misses']}, "
+                      f"hit rate {(m['hits'] + m['similar_hits']) / len(questions):.0%} от всех вопросов")
+                print("  мимо кеша: " + ", ".join(f"{reason} {count}" for reason, count in gated.items()))
+                print(f"  сэкономлено {saved:.0f} с из {total_without_cache:.0f} с "
+                      f"({saved / total_without_cache:.0%}), прогон {elapsed:.1f} с, размер {m['bytes']} байт")
+        finally:
+            poller.shutdown()
+
+
+if __name__ == "__main__":
+    main()
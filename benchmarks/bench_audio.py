@@ -0,0 +1,109 @@
+# benchmarks/bench_audio.py
+#
+# Сравнение прежней подготовки голосового сообщения (временный файл -> AudioSegment.from_file ->
+# silence.detect_nonsilent -> WAV) с конвейером audio.prepare_audio (декодирование из памяти,
+# NumPy-VAD, обрезка тишины, 16 кГц моно, OGG/Opus) на синтетических клипах 5 с, 60 с и 10 мин.
+# Нужны numpy, pydub и ffmpeg с libopus; без ffmpeg бенчмарк пропускается, без ffprobe
+# (им пользуется AudioSegment.from_file в прежнем пути) — пропускается только прежний путь.
+# Запуск: python benchmarks/bench_audio.py [--durations 5 60 600] [--legacy-limit 600]
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from pydub import AudioSegment, silence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import prepare_audio  # noqa: E402
+
+SOURCE_RATE = 48000  # так Telegram кодирует голосовые сообщения
+
+
+def synthetic_voice(seconds, seed=0):
+    """
+    «Речь» — тональные всплески с огибающей, между фразами паузы 0.3–2 с,
+    в начале и в конце по 1.5 с тишины с лёгким шумом.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SOURCE_RATE)
+    signal = rng.normal(0, 30, total)  # фоновый шум ~ -60 dBFS
+    position = int(1.5 * SOURCE_RATE)
+    while position < total - int(1.5 * SOURCE_RATE):
+        length = int(rng.uniform(0.5, 3.0) * SOURCE_RATE)
+        length = min(length, total - int(1.5 * SOURCE_RATE) - position)
+        t = np.arange(length) / SOURCE_RATE
+        envelope = np.sin(np.pi * t / t[-1]) if length > 1 else 1
+        tone = np.sin(2 * np.pi * rng.uniform(120, 300) * t) * 8000 * envelope
+        signal[position:position + length] += tone
+        position += length + int(rng.uniform(0.3, 2.0) * SOURCE_RATE)
+    samples = np.clip(signal, -32768, 32767).astype(np.int16)
+    segment = AudioSegment(samples.tobytes(), frame_rate=SOURCE_RATE, sample_width=2, channels=1)
+    buffer = io.BytesIO()
+    segment.export(buffer, format="ogg", codec="libopus", bitrate="32k")
+    return buffer.getvalue()
+
+
+def legacy_pipeline(data):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_audio:
+        temp_audio.write(data)
+        path = temp_audio.name
+    try:
+        audio = AudioSegment.from_file(path)
+        segments = silence.detect_nonsilent(audio, min_silence_len=1000, silence_thresh=-40.0)
+        audio = audio.set_channels(1)
+        wav_io = io.BytesIO()
+        audio.export(wav_io, format="wav")
+        return len(segments), len(wav_io.getvalue())
+    finally:
+        os.remove(path)
+
+
+def new_pipeline(data):
+    prepared = prepare_audio(data)
+    upload = prepared.export()
+    return len(prepared.speech), len(upload.getvalue())
+
+
+def timed(func, data):
+    started = time.perf_counter()
+    result = func(data)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 60, 600])
+    parser.add_argument("--legacy-limit", type=float, default=600,
+                        help="не гонять прежний путь на клипах длиннее, с (он очень медленный)")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg не найден — бенчмарк подготовки аудио пропущен")
+        return
+    legacy = shutil.which("ffprobe") is not None
+    if not legacy:
+        print("ffprobe не найден — прежний путь пропущен")
+
+    for seconds in args.durations:
+        data = synthetic_voice(seconds)
+        print(f"Клип {seconds:.0f} с, OGG от Telegram: {len(data) / 1024:.0f} КБ")
+        if legacy and seconds <= args.legacy_limit:
+            elapsed, (segments, size) = timed(legacy_pipeline, data)
+            print(f"  прежний путь: {elapsed:7.2f} с, участков речи {segments}, "
+                  f"загрузка WAV {size / 1024:.0f} КБ")
+        else:
+            size = None
+        elapsed_new, (segments, size_new) = timed(new_pipeline, data)
+        print(f"  конвейер:     {elapsed_new:7.2f} с, участков речи {segments}, "
+              f"загрузка OGG/Opus {size_new / 1024:.0f} КБ"
+              + (f" (в {size / size_new:.0f} раз меньше)" if size else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_catalog.py
+#
+# Сравнение OilCatalog с прежним путём через pandas (membership по df['Name'].values
+# и две булевы маски df.loc[...] для Price и Vol) на синтетическом прайсе из 10 000 строк.
+# Запуск: python benchmarks/bench_catalog.py [--rows 10000] [--queries 2000]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import OilCatalog  # noqa: E402
+
+SYLLABLES = ["ла", "ва", "нда", "ли", "мон", "мя", "та", "ро", "за", "ке", "др", "ми", "рра", "ба", "зи", "лик"]
+
+
+def make_rows(count):
+    names = set()
+    while len(names) < count:
+        names.add("".join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))).capitalize())
+    return [(name, random.choice([5, 10, 15]), random.randint(500, 9000)) for name in sorted(names)]
+
+
+def typo(name):
+    chars = list(name.lower())
+    i = random.randrange(len(chars) - 1)
+    chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def bench(label, func, queries):
+    started = time.perf_counter()
+    found = sum(func(q) is not None for q in queries)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1e6 / len(queries):9.1f} мкс/запрос, найдено {found}/{len(queries)}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows = make_rows(args.rows)
+    exact = [random.choice(rows)[0].lower() for _ in range(args.queries)]
+    typos = [typo(random.choice(rows)[0]) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    catalog = OilCatalog.from_rows(rows)
+    print(f"Построение OilCatalog на {len(catalog)} строк: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    catalog_time = bench("OilCatalog.find (точно)", lambda q: catalog.find(q), exact)
+    bench("OilCatalog.find (опечатки)", lambda q: catalog.find(q), typos)
+
+    try:
+        import pandas as pd
+    except ImportError:
+        print("pandas не установлен — сравнение с прежним путём пропущено")
+        return
+
+    df = pd.DataFrame(rows, columns=["Name", "Vol", "Price"])
+
+    def pandas_lookup(query):
+        # Ровно то, что делал handle_input: проверка в WAITING_NEXT_OIL и расчёт в WAITING_DROPS
+        name = query.capitalize()
+        if name not in df["Name"].values:
+            return None
+        price = df.loc[df["Name"] == name, "Price"].values[0]
+        volume = df.loc[df["Name"] == name, "Vol"].values[0]
+        return price / (volume * 25)
+
+    pandas_time = bench("pandas (прежний путь, точно)", pandas_lookup, exact)
+    bench("pandas (прежний путь, опечатки)", pandas_lookup, typos)
+    print(f"Ускорение точного поиска: x{pandas_time / catalog_time:.0f}")
+
+
+if __name__ == "__main__":
+    main()
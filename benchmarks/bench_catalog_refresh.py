@@ -0,0 +1,108 @@
+# benchmarks/bench_catalog_refresh.py
+#
+# Проверка CatalogRefresher против локального HTTP-сервера, изображающего
+# экспорт Google Sheets (ETag, 304 Not Modified, сбои). Печатает время старта
+# из снимка и время обновления по сети.
+# Запуск: python benchmarks/bench_catalog_refresh.py [--rows 2000]
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_refresher import CatalogRefresher  # noqa: E402
+
+
+class FakeSheet:
+    """
+    Содержимое «таблицы» и режим сбоя, общие для всех запросов к серверу.
+    """
+    def __init__(self, rows):
+        self.fail = False
+        self.requests = 0
+        self.not_modified = 0
+        self.set_rows(rows)
+
+    def set_rows(self, rows):
+        self.body = "\n".join(f"{name},{volume},{price}" for name, volume, price in rows).encode("utf-8")
+        self.etag = '"%s"' % hashlib.md5(self.body).hexdigest()
+
+
+def make_handler(sheet):
+    class SheetHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            sheet.requests += 1
+            if sheet.fail:
+                self.send_error(500)
+                return
+            if self.headers.get("If-None-Match") == sheet.etag:
+                sheet.not_modified += 1
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=utf-8")
+            self.send_header("ETag", sheet.etag)
+            self.send_header("Content-Length", str(len(sheet.body)))
+            self.end_headers()
+            self.wfile.write(sheet.body)
+
+        def log_message(self, *args):
+            pass
+
+    return SheetHandler
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<45} {(time.perf_counter() - started) * 1000:8.1f} мс -> {result}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = [(f"Масло {i}", 15, 1000 + i) for i in range(args.rows)]
+    sheet = FakeSheet(rows)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(sheet))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/export?format=csv"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "oils_snapshot.csv")
+
+        first = CatalogRefresher(url, snapshot_path=snapshot, interval=3600)
+        timed("Старт без снимка (load_snapshot)", first.load_snapshot)
+        timed("Первая загрузка по сети", first.refresh)
+        timed("Повторный запрос (ожидаем 304)", first.refresh)
+
+        sheet.set_rows(rows + [("Лаванда", 15, 2500)])
+        timed("Таблица изменилась", first.refresh)
+        assert first.catalog.get("лаванда") is not None
+
+        sheet.fail = True
+        version = first.version
+        timed("Сбой сервера (версия должна сохраниться)", first.refresh)
+        assert first.version == version and first.catalog.get("лаванда") is not None
+        sheet.fail = False
+
+        second = CatalogRefresher(url, snapshot_path=snapshot, interval=3600)
+        timed("Старт нового процесса из снимка", second.load_snapshot)
+        assert len(second.catalog) == len(first.catalog)
+        timed("Первый запрос после старта из снимка (304)", second.refresh)
+
+    server.shutdown()
+    print(f"Запросов к серверу: {sheet.requests}, из них 304: {sheet.not_modified}")
+
+
+if __name__ == "__main__":
+    main()
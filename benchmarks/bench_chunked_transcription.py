@@ -0,0 +1,125 @@
+# benchmarks/bench_chunked_transcription.py
+#
+# Ускорение ChunkedTranscriber в зависимости от числа кусков и воркеров.
+# Вместо Whisper — фейковый бэкенд: задержка = накладные расходы запроса
+# + время, пропорциональное длительности куска; часть запросов падает и повторяется.
+# Аудио не декодируется, поэтому numpy/pydub не нужны.
+# Запуск: python benchmarks/bench_chunked_transcription.py [--minutes 5] [--speed 100]
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcription import ChunkedTranscriber, plan_chunks  # noqa: E402
+
+
+class FakeSegment:
+    """
+    Заменяет AudioSegment: хранит только границы и поддерживает срез.
+    """
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, item):
+        return FakeSegment(self.start + item.start, self.start + item.stop)
+
+
+class FakeUpload:
+    def __init__(self, segment):
+        self.segment = segment
+
+    def seek(self, offset):
+        pass
+
+
+class FakePrepared:
+    def __init__(self, total_ms, speech):
+        self.segment = FakeSegment(0, total_ms)
+        self.speech = speech
+
+    def export(self, segment=None):
+        return FakeUpload(segment or self.segment)
+
+
+class FakeWhisper:
+    """
+    Распознаёт кусок за overhead + длительность / speed секунд, с вероятностью fail_rate падает.
+    Возвращает «текст» с границами куска, чтобы проверить порядок склейки.
+    """
+    def __init__(self, overhead, speed, fail_rate):
+        self.overhead = overhead
+        self.speed = speed
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, upload):
+        with self._lock:
+            self.calls += 1
+            fail = random.random() < self.fail_rate
+            self.failures += fail
+        time.sleep(self.overhead + len(upload.segment) / 1000 / self.speed)
+        if fail:
+            raise RuntimeError("503 Service Unavailable")
+        return f"[{upload.segment.start}-{upload.segment.end}]"
+
+
+def synthetic_speech(total_ms, seed=0):
+    rng = random.Random(seed)
+    speech, position = [], 500
+    while position < total_ms - 500:
+        length = rng.randint(2000, 12000)
+        end = min(position + length, total_ms - 500)
+        speech.append((position, end))
+        position = end + rng.randint(1000, 2500)
+    return speech
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--speed", type=float, default=100,
+                        help="во сколько раз фейковый Whisper быстрее реального времени")
+    parser.add_argument("--overhead", type=float, default=0.3, help="накладные расходы запроса, с")
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    random.seed(1)
+    total_ms = int(args.minutes * 60000)
+    prepared = FakePrepared(total_ms, synthetic_speech(total_ms))
+
+    whisper = FakeWhisper(args.overhead, args.speed, 0.0)
+    started = time.perf_counter()
+    whisper(FakeUpload(prepared.segment))
+    baseline = time.perf_counter() - started
+    print(f"Сообщение {args.minutes:.0f} мин, {len(prepared.speech)} участков речи; "
+          f"одним запросом: {baseline:.2f} с")
+
+    for chunk_seconds in (60, 30, 15):
+        for workers in (1, 4, 8):
+            whisper = FakeWhisper(args.overhead, args.speed, args.fail_rate)
+            transcriber = ChunkedTranscriber(whisper, workers=workers, retry_delay=0.05,
+                                             max_chunk_ms=chunk_seconds * 1000, min_chunked_ms=0)
+            chunks = plan_chunks(prepared.speech, total_ms, chunk_seconds * 1000)
+            started = time.perf_counter()
+            text = transcriber.transcribe(prepared)
+            elapsed = time.perf_counter() - started
+            transcriber.shutdown()
+            starts = [int(part[1:].split("-")[0]) for part in text.split()]
+            print(f"  куски по {chunk_seconds:2d} с ({len(chunks):2d} шт.), воркеров {workers}: "
+                  f"{elapsed:.2f} с, ускорение x{baseline / elapsed:.1f}, "
+                  f"повторов {whisper.failures}, порядок сохранён: {starts == sorted(starts)}")
+
+
+if __name__ == "__main__":
+    main()
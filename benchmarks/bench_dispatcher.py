@@ -0,0 +1,109 @@
+# benchmarks/bench_dispatcher.py
+#
+# Нагрузочная проверка ChatDispatcher: синтетические обновления прогоняются через
+# заглушку telebot (тот же контракт process_new_updates / message_handlers / last_update_id),
+# обработчики имитируют сетевые задержки. Сравнивается последовательная обработка
+# и диспетчер, проверяется порядок сообщений внутри каждого чата.
+# Запуск: python benchmarks/bench_dispatcher.py [--chats 50] [--messages 10] [--workers 8]
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import install_dispatcher  # noqa: E402
+
+
+class StubBot:
+    """
+    Минимальная заглушка telebot.TeleBot(threaded=False): хранит обработчики
+    в message_handlers и вызывает их синхронно из process_new_updates.
+    """
+    def __init__(self):
+        self.message_handlers = []
+        self.last_update_id = 0
+
+    def message_handler(self, func):
+        self.message_handlers.append({"function": func, "filters": {}})
+        return func
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            for handler in self.message_handlers:
+                handler["function"](update.message)
+
+
+def make_updates(chats, messages):
+    updates = []
+    update_id = 0
+    for seq in range(messages):
+        for chat_id in range(chats):
+            update_id += 1
+            message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=str(seq))
+            updates.append(SimpleNamespace(update_id=update_id, message=message))
+    return updates
+
+
+def build_bot(min_delay, max_delay):
+    bot = StubBot()
+    seen = {}
+    lock = threading.Lock()
+
+    @bot.message_handler
+    def handle_input(message):
+        time.sleep(random.uniform(min_delay, max_delay))  # Telegram / OpenAI I/O
+        with lock:
+            seen.setdefault(message.chat.id, []).append(int(message.text))
+
+    return bot, seen
+
+
+def check_order(seen, messages):
+    return all(values == list(range(messages)) for values in seen.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--min-delay", type=float, default=0.005)
+    parser.add_argument("--max-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    updates = make_updates(args.chats, args.messages)
+    total = len(updates)
+
+    bot, seen = build_bot(args.min_delay, args.max_delay)
+    started = time.monotonic()
+    bot.process_new_updates(updates)
+    serial_time = time.monotonic() - started
+    print(f"Последовательно: {total} обновлений за {serial_time:.2f} с "
+          f"({total / serial_time:.0f} upd/с), порядок сохранён: {check_order(seen, args.messages)}")
+
+    bot, seen = build_bot(args.min_delay, args.max_delay)
+    dispatcher = install_dispatcher(bot, workers=args.workers, max_pending_per_chat=args.messages)
+    started = time.monotonic()
+    for i in range(0, total, 100):  # long polling отдаёт обновления пачками до 100 штук
+        bot.process_new_updates(updates[i:i + 100])
+    dispatcher.shutdown(wait=True)
+    dispatched_time = time.monotonic() - started
+    stats = dispatcher.stats()
+    print(f"Диспетчер ({args.workers} воркеров): {total} обновлений за {dispatched_time:.2f} с "
+          f"({total / dispatched_time:.0f} upd/с), порядок сохранён: {check_order(seen, args.messages)}")
+    print(f"Ускорение: x{serial_time / dispatched_time:.1f}; max_depth={stats['max_depth']}, "
+          f"dropped={stats['dropped']}, avg_queue_wait={stats['avg_queue_wait'] * 1000:.1f} мс")
+    for name, handler in stats["handlers"].items():
+        print(f"  {name}: count={handler['count']}, avg={handler['avg'] * 1000:.1f} мс, "
+              f"max={handler['max'] * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
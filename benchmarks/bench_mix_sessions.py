@@ -0,0 +1,106 @@
+# benchmarks/bench_mix_sessions.py
+#
+# Нагрузка режима /р на хранилище сессий: много пользователей одновременно собирают смеси.
+# Сравнивается синхронная запись каждого шага в SQLite с отложенной записью
+# (WriteBehindSessionStore с write_through=False — так пишется хранилище одного процесса),
+# проверяется восстановление смесей после «перезапуска» и общий доступ двух «реплик»
+# к одному файлу: для общего хранилища запись сквозная, и реплика видит шаг сразу.
+# Запуск: python benchmarks/bench_mix_sessions.py [--users 500] [--oils 8]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mix_session import (  # noqa: E402
+    WAITING_DROPS, WAITING_NEXT_OIL, MixSession, SQLiteSessionStore, WriteBehindSessionStore
+)
+
+OILS = ["Лаванда", "Лимон", "Мята перечная", "Эвкалипт", "Чайное дерево", "Розмарин", "Апельсин", "Бергамот"]
+
+
+def simulate(store, users, oils):
+    """Диалоги /р вперемешку: у каждого пользователя oils пар «масло -> капли»."""
+    steps = 0
+    for user_id in range(users):
+        store.put(MixSession(user_id))
+    for step in range(oils):
+        for user_id in range(users):
+            session = store.get(user_id)
+            session.current_oil = OILS[step % len(OILS)]
+            session.state = WAITING_DROPS
+            store.put(session)
+            session = store.get(user_id)
+            session.add(session.current_oil, 5, 5 * 0.8)
+            session.current_oil = None
+            session.state = WAITING_NEXT_OIL
+            store.put(session)
+            steps += 2
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--oils", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_store = SQLiteSessionStore(os.path.join(tmp, "sync.sqlite3"))
+        started = time.perf_counter()
+        steps = simulate(sync_store, args.users, args.oils)
+        sync_seconds = time.perf_counter() - started
+        print(f"SQLite, запись на каждом шаге: {steps} шагов за {sync_seconds:.2f} с "
+              f"({sync_seconds / steps * 1e6:.0f} мкс/шаг)")
+
+        path = os.path.join(tmp, "sessions.sqlite3")
+        store = WriteBehindSessionStore(SQLiteSessionStore(path), flush_interval=0.5, write_through=False)
+        store.start()
+        started = time.perf_counter()
+        steps = simulate(store, args.users, args.oils)
+        handler_seconds = time.perf_counter() - started
+        store.stop()
+        print(f"SQLite + отложенная запись: {steps} шагов за {handler_seconds:.2f} с "
+              f"({handler_seconds / steps * 1e6:.0f} мкс/шаг), ускорение x{sync_seconds / handler_seconds:.1f}")
+
+        # «Перезапуск»: новый процесс открывает тот же файл и продолжает смеси
+        restarted = WriteBehindSessionStore(SQLiteSessionStore(path))
+        recovered = [restarted.get(user_id) for user_id in range(args.users)]
+        intact = sum(1 for session in recovered
+                     if session is not None and len(session.entries) == args.oils
+                     and session.state == WAITING_NEXT_OIL)
+        print(f"После перезапуска восстановлено смесей: {intact} из {args.users}")
+
+        # Вторая «реплика» видит шаг первой сразу, без ожидания flush
+        replica = WriteBehindSessionStore(SQLiteSessionStore(path))
+        session = restarted.get(0)
+        before = len(session.entries)
+        session.add("Бергамот", 2, 1.6)
+        started = time.perf_counter()
+        restarted.put(session)
+        put_ms = (time.perf_counter() - started) * 1000
+        seen = len(replica.get(0).entries)
+        print(f"Реплика видит шаг сразу: было {before} масел, стало {seen} (сквозная запись {put_ms:.1f} мс)")
+        if seen != before + 1:
+            raise SystemExit("реплика прочитала устаревшую сессию")
+
+        # Шаг на реплике продолжает ту же смесь, а не затирает её
+        session = replica.get(0)
+        session.add("Лимон", 1, 0.5)
+        replica.put(session)
+        print(f"Шаг на реплике: у первой {len(restarted.get(0).entries)} масел (ожидается {before + 2})")
+
+        # Простаивающие сессии удаляются
+        evicted = restarted.evict_idle(time.time() + 1)
+        print(f"Удалено простаивающих сессий: {evicted}, осталось {len(restarted)}")
+
+        session = recovered[0]
+        print(f"Размер сессии из {len(session.entries)} масел: {len(session.dumps().encode('utf-8'))} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# benchmarks/bench_mysql_pool.py
+#
+# Запросы в секунду до и после пула соединений в mysql.py.
+#
+# «До» — новое соединение на каждый запрос, как раньше делал get_connection(); «после» —
+# функции mysql.py (пул, ожидание свободного соединения, повторы, пачки execute_many).
+# Дополнительно --threads потоков (больше MYSQL_POOL_SIZE) читают одновременно — проверка,
+# что при занятом пуле запросы ждут соединения, а не теряются.
+#
+# --backend mysql: настоящий MySQL из переменных MYSQL_* (.env).
+# --backend sqlite (по умолчанию): без сервера. pooling.MySQLConnectionPool подменяется
+#   пулом поверх sqlite с теми же правилами (pool_size соединений, get_connection() не ждёт
+#   и при исчерпании выбрасывает PoolError), так что выполняется настоящий код mysql.py.
+#   Стоимость TCP-рукопожатия и авторизации MySQL имитируется задержкой --connect-ms
+#   при каждом открытии соединения. В этом режиме также проверяются повторы: обрыв
+#   до commit() повторяется, обрыв во время commit() — нет.
+#
+# Запуск: python benchmarks/bench_mysql_pool.py [--backend sqlite] [--queries 500] [--rows 10000]
+
+import argparse
+import importlib.util
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_repo_mysql():
+    # mysql.py нельзя импортировать как «mysql»: имя совпадает с пакетом mysql-connector
+    spec = importlib.util.spec_from_file_location("aroma_mysql", os.path.join(ROOT, "mysql.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def rate(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<50} {count / elapsed:10.0f} оп/с  ({elapsed:.2f} с)")
+    return count / elapsed
+
+
+class SQLiteCursor:
+    """
+    Курсор в духе mysql-connector поверх sqlite3: плейсхолдеры %s, dictionary=True.
+    """
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._dictionary = dictionary
+        self._cursor = connection.raw.cursor()
+
+    def execute(self, query, params=None):
+        self._connection.fail("execute")
+        self._cursor.execute(query.replace("%s", "?"), params or ())
+
+    def executemany(self, query, rows):
+        self._connection.fail("execute")
+        self._cursor.executemany(query.replace("%s", "?"), rows)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _rows(self, rows):
+        if not self._dictionary or self._cursor.description is None:
+            return rows
+        names = [column[0] for column in self._cursor.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def fetchmany(self, size=1):
+        return self._rows(self._cursor.fetchmany(size))
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    Соединение в духе mysql-connector. Из пула close() возвращает соединение в пул.
+    faults[stage] — сколько следующих вызовов stage ("execute" / "commit") оборвать
+    с OperationalError (имитация разрыва соединения).
+    """
+    faults = {"execute": 0, "commit": 0}
+    calls = {"execute": 0, "commit": 0}
+
+    def __init__(self, path, delay, pool=None):
+        time.sleep(delay)
+        self.raw = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._pool = pool
+
+    def fail(self, stage):
+        from mysql.connector.errors import OperationalError
+        SQLiteConnection.calls[stage] += 1
+        if SQLiteConnection.faults[stage]:
+            SQLiteConnection.faults[stage] -= 1
+            raise OperationalError(f"имитация обрыва соединения ({stage})")
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, dictionary=False, buffered=None):
+        return SQLiteCursor(self, dictionary)
+
+    def commit(self):
+        self.fail("commit")
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        if self._pool is not None:
+            self.raw.rollback()
+            self._pool._release(self)
+        else:
+            self.raw.close()
+
+
+def sqlite_pool_class(path, delay):
+    from mysql.connector.errors import PoolError
+
+    class SQLitePool:
+        """
+        Замена pooling.MySQLConnectionPool: соединения открываются при создании пула,
+        get_connection() не ждёт и при исчерпании пула выбрасывает PoolError.
+        """
+        def __init__(self, pool_name=None, pool_size=5, pool_reset_session=True, **params):
+            self.pool_name = pool_name
+            self.pool_size = pool_size
+            self._free = queue.Queue()
+            for _ in range(pool_size):
+                self._free.put(SQLiteConnection(path, delay, pool=self))
+
+        def get_connection(self):
+            try:
+                return self._free.get(block=False)
+            except queue.Empty:
+                raise PoolError("Failed getting connection; pool exhausted")
+
+        def _release(self, connection):
+            self._free.put(connection)
+
+    return SQLitePool
+
+
+def check_retries(db, table):
+    count = "SELECT COUNT(*) AS n FROM " + table
+    insert = f"INSERT INTO {table} (name, volume, price) VALUES (%s, %s, %s)"
+    calls = SQLiteConnection.calls
+
+    rows = db.execute_read_query(count)[0]["n"]
+    SQLiteConnection.faults["execute"] = 1
+    db.execute_query(insert, ("повтор", 10.0, 1.0))
+    added = db.execute_read_query(count)[0]["n"] - rows
+    print(f"обрыв до commit(): запрос повторён, добавлено строк {added} (ожидается 1)")
+    assert added == 1
+
+    commits = calls["commit"]
+    SQLiteConnection.faults["commit"] = 1
+    result = db.execute_query(insert, ("обрыв на commit", 10.0, 1.0))
+    attempts = calls["commit"] - commits
+    print(f"обрыв во время commit(): попыток commit {attempts} (ожидается 1), результат {result}")
+    assert attempts == 1 and result is None
+
+    batch = [(f"пачка {i}", 10.0, 1.0) for i in range(10)]
+    executes = calls["execute"]
+    SQLiteConnection.faults["execute"] = 100  # хватит, чтобы исчерпать повторы второй пачки
+    original = SQLiteConnection.fail
+
+    def fail_after_first(self, stage):
+        # Первая пачка проходит, все следующие — обрыв
+        if stage == "execute" and calls["execute"] == executes:
+            calls["execute"] += 1
+            return
+        original(self, stage)
+
+    SQLiteConnection.fail = fail_after_first
+    try:
+        db.execute_many(insert, batch, batch_size=5, retries=1)
+        print("execute_many: частичная запись не обнаружена")
+        raise AssertionError("ожидалась PartialWriteError")
+    except db.PartialWriteError as e:
+        print(f"execute_many: вторая пачка не прошла, PartialWriteError, зафиксировано {e.committed} (ожидается 5)")
+        assert e.committed == 5
+    finally:
+        SQLiteConnection.fail = original
+        SQLiteConnection.faults["execute"] = 0
+
+
+def bench(db, args, connect, table, create):
+    db.execute_query("DROP TABLE IF EXISTS " + table)
+    db.execute_query(create)
+    rows = [(f"Масло {i}", 15.0, 1000.0 + i) for i in range(args.rows)]
+    insert = f"INSERT INTO {table} (name, volume, price) VALUES (%s, %s, %s)"
+    select = f"SELECT * FROM {table} WHERE id = %s"
+
+    def insert_per_connection():
+        for row in rows[:args.queries]:
+            conn = connect()
+            cursor = conn.cursor()
+            cursor.execute(insert, row)
+            conn.commit()
+            cursor.close()
+            conn.close()
+
+    def select_per_connection():
+        for i in range(args.queries):
+            conn = connect()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(select, (i + 1,))
+            cursor.fetchall()
+            cursor.close()
+            conn.close()
+
+    def select_pooled():
+        for i in range(args.queries):
+            db.execute_read_query(select, (i + 1,))
+
+    before = rate("INSERT, соединение на запрос (до)", args.queries, insert_per_connection)
+    after = rate("INSERT, execute_many (после)", len(rows), lambda: db.execute_many(insert, rows))
+    print(f"  ускорение x{after / before:.0f}")
+    before = rate("SELECT, соединение на запрос (до)", args.queries, select_per_connection)
+    after = rate("SELECT, execute_read_query с пулом (после)", args.queries, select_pooled)
+    print(f"  ускорение x{after / before:.0f}")
+    lost = []
+
+    def select_concurrent():
+        def worker(offset):
+            for i in range(offset, args.queries, args.threads):
+                if db.execute_read_query(select, (i + 1,)) is None:
+                    lost.append(i)
+
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    rate(f"SELECT, {args.threads} потоков на пул из {db.get_pool().pool_size}", args.queries, select_concurrent)
+    print(f"  потеряно запросов (нет свободного соединения): {len(lost)}")
+    rate("SELECT *, stream_read_query", args.rows + args.queries,
+         lambda: sum(1 for _ in db.stream_read_query("SELECT * FROM " + table)))
+    if args.backend == "sqlite":
+        check_retries(db, table)
+    db.execute_query("DROP TABLE " + table)
+    for query, stats in db.get_query_stats().items():
+        print(f"  {stats['count']:6d} x {stats['avg'] * 1000:7.2f} мс (max {stats['max'] * 1000:.1f}) {query[:60]}")
+    return len(lost)
+
+
+def bench_sqlite(args):
+    db = load_repo_mysql()
+    path = os.path.join(tempfile.mkdtemp(), "oils.sqlite3")
+    delay = args.connect_ms / 1000
+    db.pooling.MySQLConnectionPool = sqlite_pool_class(path, delay)
+    return bench(
+        db, args, lambda: SQLiteConnection(path, delay), "oils_bench",
+        "CREATE TABLE oils_bench (id INTEGER PRIMARY KEY, name TEXT NOT NULL, volume REAL, price REAL)"
+    )
+
+
+def bench_mysql(args):
+    db = load_repo_mysql()
+    import mysql.connector
+
+    return bench(
+        db, args, lambda: mysql.connector.connect(**db._connection_params()), "oils_bench",
+        "CREATE TABLE oils_bench (id INT AUTO_INCREMENT PRIMARY KEY, "
+        "name VARCHAR(255) NOT NULL, volume FLOAT, price FLOAT)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=20,
+                        help="одновременных потоков в проверке занятого пула")
+    parser.add_argument("--connect-ms", type=float, default=5.0,
+                        help="имитация рукопожатия MySQL для sqlite-замены, мс")
+    args = parser.parse_args()
+    lost = bench_mysql(args) if args.backend == "mysql" else bench_sqlite(args)
+    if lost:
+        raise SystemExit(f"потеряно запросов при занятом пуле: {lost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_oil_knowledge.py
+#
+# Покрытие парсера mono_oils.txt (сколько монографий и заполненных полей)
+# и задержка локальных ответов OilKnowledgeBase.
+# Запуск: python benchmarks/bench_oil_knowledge.py [--repeat 2000]
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oil_knowledge import MONOGRAPHS_PATH, OilKnowledgeBase, parse_monographs  # noqa: E402
+
+# Вопрос -> должен ли он отвечаться локально (False — уйти ассистенту).
+# Расхождение с ожиданием завершает бенчмарк с ошибкой.
+QUESTIONS = [
+    ("комплементарные масла к базилику", True),
+    ("с чем сочетается чёрный перец", True),
+    ("масло от тревожности", True),
+    ("что помогает при усталости", True),
+    ("как применять лаванду", True),
+    ("качество бергамота", True),
+    ("эмоции лимона", True),
+    ("привет", False),
+    ("что такое лаванда", False),
+    ("расскажи подробно как сделать смесь для сна из лаванды и ромашки пожалуйста", False),
+    # Вопросы про то, чего в монографии нет: безопасность, дозировки, недуги
+    ("можно ли применять лаванду беременным", False),
+    ("противопоказания к применению розмарина", False),
+    ("сочетается ли лаванда с лекарствами", False),
+    ("как применять лаванду детям", False),
+    ("масло от головной боли", False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(MONOGRAPHS_PATH, encoding="utf-8") as f:
+        text = f.read()
+    headers = sum(1 for line in text.splitlines() if re.match(r"^#?\s*[A-Z][A-Z' -]+\s*/", line))
+
+    started = time.perf_counter()
+    records = parse_monographs(text)
+    parse_ms = (time.perf_counter() - started) * 1000
+    print(f"Монографий: {len(records)} из {headers} заголовков, разбор {parse_ms:.1f} мс")
+    for field in ("quality", "negative", "positive", "complementary", "usage", "description"):
+        filled = sum(1 for record in records if getattr(record, field))
+        missing = [record.name_en for record in records if not getattr(record, field)]
+        print(f"  {field:<14} {filled:3d}/{len(records)}" + (f"  нет: {', '.join(missing)}" if missing else ""))
+
+    started = time.perf_counter()
+    kb = OilKnowledgeBase(records)
+    print(f"Построение индекса: {(time.perf_counter() - started) * 1000:.1f} мс, "
+          f"термов: {len(kb.index.postings)}")
+
+    wrong = []
+    for question, local in QUESTIONS:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            answer = kb.answer(question)
+        elapsed_us = (time.perf_counter() - started) * 1e6 / args.repeat
+        verdict = "локально" if answer else "ассистент"
+        mark = "" if bool(answer) == local else "  <-- ОШИБКА"
+        if mark:
+            wrong.append(question)
+        print(f"  {elapsed_us:8.1f} мкс  {verdict:<9}  {question}{mark}")
+    if wrong:
+        raise SystemExit(f"неверная маршрутизация: {len(wrong)} из {len(QUESTIONS)}")
+
+
+if __name__ == "__main__":
+    main()
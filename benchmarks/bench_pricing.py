@@ -0,0 +1,104 @@
+# benchmarks/bench_pricing.py
+#
+# Пересчёт пачки рецептов после обновления прайса: по одному маслу через
+# OilCatalog.find + OilEntry.cost (как в пошаговом /р) против RecipePricer.price_many (NumPy).
+# В конце — прогон CLI pricing.py на временных CSV.
+# Запуск: python benchmarks/bench_pricing.py [--rows 500] [--recipes 10000]
+
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import OilCatalog  # noqa: E402
+from pricing import RecipePricer, parse_recipe  # noqa: E402
+
+SYLLABLES = ["ла", "ва", "нда", "ли", "мон", "мя", "та", "ро", "за", "ке", "др", "ми", "рра", "ба", "зи", "лик"]
+
+
+def make_rows(count):
+    names = set()
+    while len(names) < count:
+        names.add("".join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))).capitalize())
+    return [(name, random.choice([5, 10, 15]), random.randint(500, 9000)) for name in sorted(names)]
+
+
+def make_recipes(rows, count):
+    recipes = []
+    for _ in range(count):
+        oils = random.sample(rows, random.randint(2, 7))
+        recipes.append(", ".join(f"{name.lower()} {random.randint(1, 15)}" for name, _, _ in oils))
+    return recipes
+
+
+def price_one_by_one(catalog, recipes):
+    totals = []
+    for items in recipes:
+        total = 0.0
+        for name, drops in items:
+            entry = catalog.find(name)
+            total += entry.cost(drops) if entry is not None else float("nan")
+        totals.append(total)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--recipes", type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows = make_rows(args.rows)
+    catalog = OilCatalog.from_rows(rows)
+    texts = make_recipes(rows, args.recipes)
+
+    started = time.perf_counter()
+    recipes = [parse_recipe(text) for text in texts]
+    parse_seconds = time.perf_counter() - started
+    oils = sum(len(items) for items in recipes)
+    print(f"Рецептов: {len(recipes)} ({oils} позиций), разбор текста: {parse_seconds * 1000:.0f} мс")
+
+    started = time.perf_counter()
+    expected = price_one_by_one(catalog, recipes)
+    loop_seconds = time.perf_counter() - started
+    print(f"По одному маслу (find + cost):  {loop_seconds * 1000:8.1f} мс")
+
+    started = time.perf_counter()
+    pricer = RecipePricer(catalog)
+    totals = pricer.price_many(recipes)
+    cold_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    totals = pricer.price_many(recipes)
+    warm_seconds = time.perf_counter() - started
+    mismatches = sum(abs(a - b) > 1e-6 for a, b in zip(expected, totals))
+    print(f"RecipePricer.price_many:        {cold_seconds * 1000:8.1f} мс (первый раз), "
+          f"{warm_seconds * 1000:.1f} мс (названия в кеше), ускорение x{loop_seconds / warm_seconds:.0f}, "
+          f"расхождений {mismatches}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog_path = os.path.join(tmp, "catalog.csv")
+        recipes_path = os.path.join(tmp, "recipes.csv")
+        output_path = os.path.join(tmp, "priced.csv")
+        with open(catalog_path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(rows)
+        with open(recipes_path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(enumerate(texts + ["роза 3", "лаванда"], start=1))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "pricing.py"), recipes_path, "-o", output_path,
+             "--catalog", catalog_path],
+            capture_output=True, text=True, check=True
+        )
+        print(f"CLI pricing.py: {(time.perf_counter() - started) * 1000:.0f} мс — {result.stderr.strip()}")
+
+
+if __name__ == "__main__":
+    main()
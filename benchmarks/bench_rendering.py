@@ -0,0 +1,68 @@
+# benchmarks/bench_rendering.py
+#
+# Сравнение старого экранирования (генератор по символам) с rendering.escape_markdown
+# (предкомпилированный re.sub) на ответах ассистента от 4 до 40 КБ, плюс стоимость split_message.
+# Запуск: python benchmarks/bench_rendering.py [--repeat 200]
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rendering import escape_markdown, split_message  # noqa: E402
+
+SAMPLE_PATH = os.path.join(ROOT, "mono_oils.txt")
+
+
+def legacy_escape_markdown(text):
+    """Прежняя реализация из bot.py."""
+    escape_chars = r"\_*[]()~`>#+-=|{}.!<>"
+    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+
+
+def make_reply(source, size_kb):
+    """Текст «ответа ассистента» заданного размера в КБ (UTF-8) из монографий."""
+    target = size_kb * 1024
+    out = []
+    size = 0
+    position = 0
+    while size < target:
+        piece = source[position:position + 512]
+        position = (position + 512) % max(1, len(source) - 512)
+        out.append(piece)
+        size += len(piece.encode("utf-8"))
+    return "".join(out)
+
+
+def timed(func, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        source = f.read()
+
+    print(f"{'ответ':>7} {'символов':>9} {'генератор':>11} {'re.sub':>11} {'ускорение':>10} "
+          f"{'split':>9} {'сообщений':>10}")
+    for size_kb in (4, 8, 16, 40):
+        text = make_reply(source, size_kb)
+        legacy = timed(legacy_escape_markdown, text, args.repeat)
+        current = timed(escape_markdown, text, args.repeat)
+        rendered = escape_markdown(text)
+        split = timed(split_message, rendered, args.repeat)
+        print(f"{size_kb:>5}КБ {len(text):>9} {legacy * 1e6:>9.0f}мкс {current * 1e6:>9.0f}мкс "
+              f"{legacy / current:>9.1f}x {split * 1e6:>7.0f}мкс {len(split_message(rendered)):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,620 @@
+# benchmarks/bench_replay.py
+#
+# Сквозной прогон бота под нагрузкой без внешних сервисов.
+#
+# Настоящий bot.py запускается отдельным процессом против заглушек из benchmarks/fakes.py:
+# Bot API (long polling), OpenAI (треды, run'ы с опросом и потоком, Whisper — с задержками
+# и внедрёнными ошибками 429/500/failed) и CSV прайса. На него проигрывается поток
+# сессий пользователей — синтетический (--mix, --rate) или записанный (--traffic):
+#   chat  — 1-3 вопроса (часть отвечается локальной справкой, часть — ассистентом);
+#   mix   — пошаговый /р: масла, капли, иногда рецепт целиком, затем «*»;
+#   quote — /р с рецептом одной командой;
+#   voice — голосовое (нужен ffmpeg: без него голосовые сессии пропускаются);
+#   start — /start.
+# Сессии приходят с заданной частотой (поток Пуассона), шаги внутри сессии идут
+# по очереди: следующий — после ответа бота на предыдущий (и паузы --think-ms).
+# Время шага — от появления обновления в getUpdates-заглушке до последнего сообщения
+# бота на этот шаг (для потоковых ответов — до финальной правки).
+#
+# Отчёт: пропускная способность, p50/p95/p99 по обработчикам, ошибки и таймауты,
+# рост памяти процесса бота (RSS), метрики самого бота (/metrics) и счётчики заглушек.
+# --json пишет всё это для сравнения прогонов, --compare сравнивает с прошлым JSON.
+# mysql.py ботом не используется — его пул меряет bench_mysql_pool.py.
+#
+# Запуск: python benchmarks/bench_replay.py [--sessions 200] [--rate 5] [--mix chat=4,mix=3,quote=1,voice=1,start=1]
+#         python benchmarks/bench_replay.py --traffic benchmarks/data/replay_traffic.jsonl --speed 2
+#         python benchmarks/bench_replay.py --run-ms 3000 --rate-limit-rate 0.05 --json run.json --compare base.json
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import (  # noqa: E402
+    ANSWER_END, FakeOpenAI, FakeSheet, FakeTelegram, catalog_csv, message_update, voice_update
+)
+
+TRAFFIC_PATH = os.path.join(ROOT, "benchmarks", "data", "replay_traffic.jsonl")
+
+CATALOG = [
+    ("Лаванда", 15, 2150), ("Лимон", 15, 1250), ("Мята перечная", 15, 1900), ("Бергамот", 15, 2400),
+    ("Чайное дерево", 15, 1950), ("Эвкалипт", 15, 1500), ("Розмарин", 15, 1700), ("Апельсин", 15, 1100),
+    ("Иланг-иланг", 15, 2900), ("Ладан", 15, 4800), ("Герань", 15, 3100), ("Грейпфрут", 15, 1600),
+]
+
+# Первые три отвечаются локальной справкой (mono_oils.txt), остальные уходят ассистенту
+QUESTIONS = [
+    "Комплементарные масла к лаванде",
+    "Какое масло помогает от тревожности?",
+    "Что сочетается с бергамотом?",
+    "Противопоказания мяты перечной",
+    "Чем заменить масло иланг-иланг?",
+    "Как хранить эфирные масла?",
+    "Можно ли использовать масла при беременности?",
+    "Посоветуй аромат для спальни",
+]
+
+DEFAULT_MIX = "chat=4,mix=3,quote=1,voice=1,start=1"
+
+# Шаг обработан, когда бот прислал сообщение с одной из этих фраз
+DONE_PHRASES = {
+    "start": ("Возможности",),
+    "mix.start": ("Введите название масла",),
+    "mix.oil": ("количество капель",),
+    "mix.drops": ("Добавлено",),
+    "mix.recipe": ("Добавлено масел",),
+    "mix.finish": ("Возможности",),
+    "mix.quote": ("Общая стоимость",),
+}
+# Отказы и ошибки бота (⏳ без текста — заглушка потокового ответа, а не отказ)
+ERROR_PREFIXES = ("⚠️", "⏳", "❌")
+PLACEHOLDER = "⏳"
+
+
+# === Трафик ===
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("chat", "mix", "quote", "voice", "start"):
+            raise argparse.ArgumentTypeError(f"неизвестный тип сессии: {kind!r}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def session_steps(kind, rng):
+    names = [name.lower() for name, _, _ in CATALOG]
+    if kind == "chat":
+        return [{"handler": "chat", "text": rng.choice(QUESTIONS)} for _ in range(rng.randint(1, 3))]
+    if kind == "mix":
+        steps = [{"handler": "mix.start", "text": "/р"}]
+        for name in rng.sample(names, rng.randint(1, 4)):
+            steps.append({"handler": "mix.oil", "text": name})
+            steps.append({"handler": "mix.drops", "text": str(rng.randint(1, 10))})
+        if rng.random() < 0.3:
+            recipe = ", ".join(f"{name} {rng.randint(1, 5)}" for name in rng.sample(names, 2))
+            steps.append({"handler": "mix.recipe", "text": recipe})
+        steps.append({"handler": "mix.finish", "text": "*"})
+        return steps
+    if kind == "quote":
+        recipe = ", ".join(f"{name} {rng.randint(1, 8)}" for name in rng.sample(names, rng.randint(2, 5)))
+        return [{"handler": "mix.quote", "text": f"/р {recipe}"}]
+    if kind == "voice":
+        return [{"handler": "voice", "voice": rng.randint(2, 15)}]
+    return [{"handler": "start", "text": "/start"}]
+
+
+def synthetic_traffic(mix, sessions, rate, seed):
+    """
+    Сессии с интервалами по экспоненциальному закону (в среднем rate сессий в секунду).
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    offset = 0.0
+    traffic = []
+    for _ in range(sessions):
+        offset += rng.expovariate(rate)
+        kind = rng.choices(kinds, weights)[0]
+        traffic.append({"offset": round(offset, 3), "kind": kind, "steps": session_steps(kind, rng)})
+    return traffic
+
+
+def load_traffic(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_traffic(path, traffic):
+    with open(path, "w", encoding="utf-8") as f:
+        for session in traffic:
+            f.write(json.dumps(session, ensure_ascii=False) + "\n")
+
+
+def make_voice(seconds):
+    """
+    OGG/Opus с тоном на seconds секунд (тишина по краям) — через ffmpeg, как у Telegram.
+    """
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=48000:duration={seconds}",
+         "-af", "adelay=500:all=1,apad=pad_dur=0.5", "-ac", "1",
+         "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1"],
+        capture_output=True, check=True,
+    )
+    return proc.stdout
+
+
+# === Ответы бота ===
+
+def step_outcome(handler, method, text):
+    """
+    None — сообщение бота ещё не ответ на шаг; иначе "ok" или "error".
+    """
+    if text != PLACEHOLDER and text.startswith(ERROR_PREFIXES):
+        return "error"
+    phrases = DONE_PHRASES.get(handler)
+    if phrases is not None:
+        return "ok" if any(phrase in text for phrase in phrases) else None
+    # Вопрос или голосовое: ответ ассистента целиком (последняя правка потокового ответа)
+    # или локальная справка одним сообщением
+    if text.endswith(ANSWER_END):
+        return "ok"
+    if method == "sendMessage" and text != PLACEHOLDER:
+        return "ok"
+    return None
+
+
+class ReplyTracker:
+    """
+    Сообщения бота по чатам (из вызовов заглушки Bot API); wait() ждёт ответа на шаг.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._cond = threading.Condition()
+
+    def record(self, method, params, at):
+        if method not in ("sendMessage", "editMessageText"):
+            return
+        chat_id = int(params.get("chat_id") or 0)
+        with self._cond:
+            self._calls.setdefault(chat_id, []).append((at, method, params.get("text", "")))
+            self._cond.notify_all()
+
+    def mark(self, chat_id):
+        with self._cond:
+            return len(self._calls.get(chat_id, ()))
+
+    def wait(self, chat_id, since, handler, timeout):
+        deadline = time.monotonic() + timeout
+        index = since
+        with self._cond:
+            while True:
+                calls = self._calls.get(chat_id, [])
+                while index < len(calls):
+                    at, method, text = calls[index]
+                    index += 1
+                    outcome = step_outcome(handler, method, text)
+                    if outcome is not None:
+                        return outcome, at
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return "timeout", None
+                self._cond.wait(left)
+
+    def forget(self, chat_id):
+        with self._cond:
+            self._calls.pop(chat_id, None)
+
+
+# === Процесс бота ===
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BotProcess:
+    """
+    python bot.py против заглушек; stderr читается в фоне (хвост — для диагностики).
+    """
+    def __init__(self, env, cwd):
+        self.proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=cwd, env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        self.tail = deque(maxlen=50)
+        self.warmed_up = threading.Event()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+    def _read_stderr(self):
+        for line in self.proc.stderr:
+            self.tail.append(line.rstrip())
+            if "Прогрев модулей завершён" in line:
+                self.warmed_up.set()
+
+    def rss_mb(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        # SIGINT — бот выходит из polling и дописывает сессии /р
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+
+class RssSampler:
+    def __init__(self, bot, interval=0.25):
+        self.bot = bot
+        self.interval = interval
+        self.samples = []  # (секунды от старта, МБ)
+        self._stop = threading.Event()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            value = self.bot.rss_mb()
+            if value is not None:
+                self.samples.append((round(time.monotonic() - self._started, 2), round(value, 2)))
+            self._stop.wait(self.interval)
+
+
+_SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def scrape_metrics(port):
+    """
+    Гистограммы и gauge из /metrics бота: {"histograms": {метрика: {метка: {...}}}, "gauges": {...}}.
+    """
+    try:
+        text = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode("utf-8")
+    except OSError:
+        return None
+    histograms, gauges = {}, {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        name, labels, value = match[1], dict(_LABEL_RE.findall(match[2] or "")), float(match[3])
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix):
+                base = name[:-len(suffix)]
+                le = labels.pop("le", None)
+                key = ",".join(f"{k}={v}" for k, v in sorted(labels.items())) or "-"
+                series = histograms.setdefault(base, {}).setdefault(key, {"buckets": []})
+                if suffix == "_bucket":
+                    series["buckets"].append((float(le), value))
+                else:
+                    series[suffix[1:]] = value
+                break
+        else:
+            if not labels:
+                gauges[name] = value
+    summary = {}
+    for name, series_by_key in histograms.items():
+        summary[name] = {}
+        for key, series in series_by_key.items():
+            count = series.get("count", 0)
+            if not count:
+                continue
+            p95 = next((bound for bound, cumulative in series["buckets"] if cumulative >= 0.95 * count), None)
+            summary[name][key] = {
+                "count": int(count),
+                "mean_ms": round(series.get("sum", 0) / count * 1000, 1),
+                "p95_ms_le": None if p95 in (None, float("inf")) else round(p95 * 1000, 1),
+            }
+    return {"histograms": summary, "gauges": gauges}
+
+
+# === Прогон ===
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def run_session(index, session, telegram, tracker, results, lags, started, args):
+    chat_id = session.get("chat") or 100000 + index
+    due = started + session["offset"] / args.speed
+    lags.append(max(0.0, time.monotonic() - due))
+    for step in session["steps"]:
+        since = tracker.mark(chat_id)
+        if "voice" in step:
+            update = voice_update(chat_id, f"voice-{step['voice']}", duration=step["voice"])
+        else:
+            update = message_update(chat_id, step["text"])
+        pushed = time.monotonic()
+        telegram.push(update)
+        outcome, at = tracker.wait(chat_id, since, step["handler"], args.step_timeout)
+        results.append((step["handler"], outcome, (at - pushed) * 1000 if at is not None else None))
+        if outcome == "timeout":
+            break
+        if args.think_ms:
+            time.sleep(args.think_ms / 1000)
+    tracker.forget(chat_id)
+
+
+def replay(traffic, telegram, tracker, args):
+    results, lags = [], []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.max_sessions, thread_name_prefix="session") as pool:
+        futures = []
+        for index, session in enumerate(traffic):
+            delay = started + session["offset"] / args.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(run_session, index, session, telegram, tracker, results, lags, started, args))
+        for future in futures:
+            future.result()
+    return results, lags, time.monotonic() - started
+
+
+def summarize(results, elapsed):
+    handlers = {}
+    for handler, outcome, latency in results:
+        entry = handlers.setdefault(handler, {"steps": 0, "ok": 0, "errors": 0, "timeouts": 0, "latencies": []})
+        entry["steps"] += 1
+        entry[{"ok": "ok", "error": "errors", "timeout": "timeouts"}[outcome]] += 1
+        if latency is not None:
+            entry["latencies"].append(latency)
+    summary = {}
+    for handler, entry in sorted(handlers.items()):
+        latencies = entry.pop("latencies")
+        summary[handler] = dict(
+            entry,
+            p50_ms=_round(percentile(latencies, 0.50)),
+            p95_ms=_round(percentile(latencies, 0.95)),
+            p99_ms=_round(percentile(latencies, 0.99)),
+            max_ms=_round(max(latencies) if latencies else None),
+            throughput_per_s=round(entry["ok"] / elapsed, 3),
+        )
+    return summary
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def print_report(report):
+    totals = report["totals"]
+    print(f"\nСессий: {totals['sessions']}, шагов: {totals['steps']} "
+          f"(ok {totals['ok']}, ошибок {totals['errors']}, таймаутов {totals['timeouts']}) "
+          f"за {report['duration_s']:.1f} с")
+    print(f"Пропускная способность: {totals['steps_per_s']:.2f} шагов/с, {totals['sessions_per_s']:.2f} сессий/с; "
+          f"опоздание старта сессий p95 {totals['start_lag_p95_ms']:.0f} мс")
+    print(f"\n{'обработчик':<12} {'шагов':>6} {'ошибок':>7} {'таймаут':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'макс':>8}  (мс)")
+    for handler, entry in report["handlers"].items():
+        cells = [f"{entry[key]:8.0f}" if entry[key] is not None else f"{'—':>8}"
+                 for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{handler:<12} {entry['steps']:>6} {entry['errors']:>7} {entry['timeouts']:>8} {' '.join(cells)}")
+    memory = report["memory"]
+    if memory["start_mb"] is not None:
+        print(f"\nПамять бота (RSS): до прогона {memory['start_mb']:.1f} МБ, пик {memory['peak_mb']:.1f}, "
+              f"после {memory['end_mb']:.1f} ({memory['growth_mb']:+.1f} МБ, "
+              f"{memory['growth_kb_per_1000_steps']:+.0f} КБ на 1000 шагов)")
+    server = report.get("server")
+    if server:
+        print("\nСо стороны бота (/metrics): среднее / p95 (верхняя граница корзины), мс")
+        for name in ("aroma_handler_seconds", "aroma_queue_wait_seconds", "aroma_span_seconds"):
+            for key, entry in sorted(server["histograms"].get(name, {}).items()):
+                print(f"  {name[6:-8]:<11} {key:<32} n={entry['count']:<6} "
+                      f"{entry['mean_ms']:8.1f} / {entry['p95_ms_le'] if entry['p95_ms_le'] is not None else '>max'}")
+        gauges = server["gauges"]
+        print(f"  допуск к OpenAI: 429 {gauges.get('aroma_admission_throttled_total', 0):.0f}, "
+              f"отказов по лимиту пользователя {gauges.get('aroma_admission_rejected_total', 0):.0f}; "
+              f"отброшено обновлений {gauges.get('aroma_dispatch_dropped_total', 0):.0f}")
+    fakes = report["fakes"]
+    print(f"\nЗаглушка OpenAI: {sum(fakes['openai_requests'].values())} запросов {fakes['openai_requests']}, "
+          f"внедрено {fakes['openai_injected']}")
+    print(f"Заглушка Telegram: {fakes['telegram_calls']} вызовов Bot API")
+    if report["skipped"]:
+        print(f"Пропущено: {report['skipped']}")
+
+
+def print_comparison(report, baseline):
+    print("\nСравнение с прошлым прогоном (было -> стало):")
+    before, after = baseline["totals"], report["totals"]
+    print(f"  шагов/с: {before['steps_per_s']:.2f} -> {after['steps_per_s']:.2f}; "
+          f"ошибок: {before['errors']} -> {after['errors']}; таймаутов: {before['timeouts']} -> {after['timeouts']}")
+    for handler, entry in report["handlers"].items():
+        old = baseline["handlers"].get(handler)
+        if not old:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if old[key] and entry[key]:
+                parts.append(f"{key[:3]} {old[key]:.0f} -> {entry[key]:.0f} ({(entry[key] / old[key] - 1) * 100:+.0f}%)")
+        print(f"  {handler:<12} " + ", ".join(parts))
+    if baseline["memory"].get("growth_mb") is not None and report["memory"]["growth_mb"] is not None:
+        print(f"  рост памяти: {baseline['memory']['growth_mb']:+.1f} -> {report['memory']['growth_mb']:+.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной прогон бота против заглушек Telegram и OpenAI")
+    traffic_group = parser.add_argument_group("трафик")
+    traffic_group.add_argument("--traffic", help="записанный трафик (JSONL сессий), например " + TRAFFIC_PATH)
+    traffic_group.add_argument("--record", help="сохранить сгенерированный трафик в JSONL")
+    traffic_group.add_argument("--sessions", type=int, default=200, help="сессий в синтетическом трафике")
+    traffic_group.add_argument("--rate", type=float, default=5.0, help="сессий в секунду (синтетический трафик)")
+    traffic_group.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                               help=f"доли типов сессий (по умолчанию {DEFAULT_MIX})")
+    traffic_group.add_argument("--speed", type=float, default=1.0, help="ускорение проигрывания (x2 — вдвое чаще)")
+    traffic_group.add_argument("--think-ms", type=float, default=200.0, help="пауза пользователя между шагами")
+    traffic_group.add_argument("--warmup-sessions", type=int, default=3,
+                               help="сессий-вопросов до замера (не учитываются)")
+    traffic_group.add_argument("--seed", type=int, default=1)
+    fake_group = parser.add_argument_group("заглушки")
+    fake_group.add_argument("--telegram-latency-ms", type=float, default=5.0, help="задержка каждого вызова Bot API")
+    fake_group.add_argument("--openai-latency-ms", type=float, default=30.0, help="задержка каждого запроса к OpenAI")
+    fake_group.add_argument("--run-ms", type=float, default=1500.0, help="длительность run ассистента")
+    fake_group.add_argument("--whisper-ms", type=float, default=700.0, help="время распознавания голосового")
+    fake_group.add_argument("--error-rate", type=float, default=0.0, help="доля ответов OpenAI 500")
+    fake_group.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов OpenAI 429")
+    fake_group.add_argument("--run-failure-rate", type=float, default=0.0, help="доля run'ов со статусом failed")
+    bot_group = parser.add_argument_group("бот")
+    bot_group.add_argument("--no-stream", action="store_true", help="STREAM_REPLIES=0")
+    bot_group.add_argument("--bot-env", action="append", default=[], metavar="KEY=VALUE",
+                           help="переменная окружения бота (можно несколько раз)")
+    parser.add_argument("--step-timeout", type=float, default=60.0, help="сколько ждать ответа на шаг, с")
+    parser.add_argument("--max-sessions", type=int, default=256, help="одновременных сессий (потоков) не больше")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с результатами прошлого прогона (JSON)")
+    args = parser.parse_args()
+
+    traffic = load_traffic(args.traffic) if args.traffic else synthetic_traffic(
+        args.mix, args.sessions, args.rate, args.seed
+    )
+    if args.record:
+        save_traffic(args.record, traffic)
+        print(f"Трафик записан: {args.record} ({len(traffic)} сессий)")
+
+    skipped = {}
+    voices = {}
+    if any("voice" in step for session in traffic for step in session["steps"]):
+        if shutil.which("ffmpeg"):
+            for seconds in {step["voice"] for session in traffic for step in session["steps"] if "voice" in step}:
+                voices[f"voice-{seconds}"] = make_voice(seconds)
+        else:
+            voice_sessions = [session for session in traffic if any("voice" in step for step in session["steps"])]
+            skipped["voice"] = len(voice_sessions)
+            traffic = [session for session in traffic if session not in voice_sessions]
+            print(f"ffmpeg не найден — голосовые сессии пропущены: {len(voice_sessions)}")
+
+    tracker = ReplyTracker()
+    telegram = FakeTelegram(poll_timeout=0.5, on_call=tracker.record, latency=args.telegram_latency_ms / 1000)
+    telegram.files.update(voices)
+    openai_fake = FakeOpenAI(
+        run_seconds=args.run_ms / 1000, whisper_seconds=args.whisper_ms / 1000,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        run_failure_rate=args.run_failure_rate, latency=args.openai_latency_ms / 1000, seed=args.seed,
+    )
+    sheet = FakeSheet(catalog_csv(CATALOG))
+    metrics_port = free_port()
+
+    with telegram, openai_fake, sheet, tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            "TELEGRAM_BOT_TOKEN": "123456:replay",
+            "TELEGRAM_API_URL": telegram.api_url,
+            "TELEGRAM_FILE_URL": telegram.file_url,
+            "OPENAI_API_KEY": "sk-replay",
+            "OPENAI_BASE_URL": openai_fake.api_base,
+            "CATALOG_URL": sheet.url,
+            "CATALOG_SNAPSHOT": os.path.join(tmp, "oils_snapshot.csv"),
+            "METRICS_PORT": str(metrics_port),
+            "LOG_LEVEL": "INFO",
+            "STREAM_REPLIES": "0" if args.no_stream else "1",
+            "PYTHONPATH": ROOT,
+        })
+        for item in args.bot_env:
+            key, _, value = item.partition("=")
+            env[key] = value
+
+        bot = BotProcess(env, tmp)
+        try:
+            if not telegram.wait_for("getUpdates", timeout=60):
+                raise SystemExit("Бот не начал опрос getUpdates:\n" + "\n".join(bot.tail))
+            if not bot.warmed_up.wait(60):
+                print("Не дождались окончания прогрева модулей бота, продолжаем")
+            if args.warmup_sessions:
+                warmup = [{"offset": 0.0, "kind": "chat", "chat": 900000 + index,
+                           "steps": [{"handler": "chat", "text": QUESTIONS[-1 - index % len(QUESTIONS)]}]}
+                          for index in range(args.warmup_sessions)]
+                replay(warmup, telegram, tracker, args)
+
+            sampler = RssSampler(bot).start()
+            time.sleep(0.3)
+            telegram_calls_before = len(telegram.calls)
+            print(f"Проигрываем {len(traffic)} сессий...")
+            results, lags, elapsed = replay(traffic, telegram, tracker, args)
+            time.sleep(1.0)  # даём фоновым записям (сессии /р, кеш) отработать до замера памяти
+            sampler.stop()
+            server = scrape_metrics(metrics_port)
+            if bot.proc.poll() is not None:
+                raise SystemExit("Бот завершился во время прогона:\n" + "\n".join(bot.tail))
+        finally:
+            bot.stop()
+
+    handlers = summarize(results, elapsed)
+    steps = len(results)
+    memory_values = [value for _, value in sampler.samples]
+    memory = {"start_mb": None, "peak_mb": None, "end_mb": None, "growth_mb": None,
+              "growth_kb_per_1000_steps": None, "samples": sampler.samples[::max(1, len(sampler.samples) // 200)]}
+    if memory_values:
+        growth = memory_values[-1] - memory_values[0]
+        memory.update(start_mb=memory_values[0], peak_mb=max(memory_values), end_mb=memory_values[-1],
+                      growth_mb=round(growth, 2),
+                      growth_kb_per_1000_steps=round(growth * 1024 / max(steps, 1) * 1000, 1))
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "record")},
+        "duration_s": round(elapsed, 2),
+        "totals": {
+            "sessions": len(traffic),
+            "steps": steps,
+            "ok": sum(1 for _, outcome, _ in results if outcome == "ok"),
+            "errors": sum(1 for _, outcome, _ in results if outcome == "error"),
+            "timeouts": sum(1 for _, outcome, _ in results if outcome == "timeout"),
+            "steps_per_s": round(steps / elapsed, 3),
+            "sessions_per_s": round(len(traffic) / elapsed, 3),
+            "start_lag_p95_ms": round((percentile(lags, 0.95) or 0) * 1000, 1),
+        },
+        "handlers": handlers,
+        "memory": memory,
+        "server": server,
+        "fakes": {
+            "openai_requests": dict(openai_fake.requests),
+            "openai_injected": dict(openai_fake.injected),
+            "telegram_calls": len(telegram.calls) - telegram_calls_before,
+        },
+        "skipped": skipped,
+    }
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
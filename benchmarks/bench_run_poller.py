@@ -0,0 +1,133 @@
+# benchmarks/bench_run_poller.py
+#
+# Нагрузочная проверка RunPoller: 100 одновременных чатов против фейкового клиента OpenAI.
+# Запуск: python benchmarks/bench_run_poller.py [--chats 100] [--workers 4]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_poller import RunFailedError, RunPoller  # noqa: E402
+
+
+class FakeRuns:
+    """
+    Имитирует beta.threads.runs: run завершается через заданное время,
+    часть run'ов заканчивается ошибкой или зависает навсегда.
+    """
+    def __init__(self, min_time, max_time, fail_rate=0.0, hang_rate=0.0, latency=0.01):
+        self.min_time = min_time
+        self.max_time = max_time
+        self.fail_rate = fail_rate
+        self.hang_rate = hang_rate
+        self.latency = latency
+        self.runs = {}
+        self.retrieve_calls = 0
+        self.cancelled = set()
+        self._lock = threading.Lock()
+        self._ids = 0
+
+    def create(self, thread_id, assistant_id=None):
+        with self._lock:
+            self._ids += 1
+            run_id = f"run_{self._ids}"
+            roll = random.random()
+            if roll < self.hang_rate:
+                final = "in_progress"
+            elif roll < self.hang_rate + self.fail_rate:
+                final = "failed"
+            else:
+                final = "completed"
+            done_at = time.monotonic() + random.uniform(self.min_time, self.max_time)
+            self.runs[run_id] = (done_at, final)
+        return SimpleNamespace(id=run_id, status="queued")
+
+    def retrieve(self, thread_id, run_id):
+        time.sleep(self.latency)  # сетевой round-trip
+        with self._lock:
+            self.retrieve_calls += 1
+            done_at, final = self.runs[run_id]
+        if run_id in self.cancelled:
+            return SimpleNamespace(id=run_id, status="cancelled", last_error=None)
+        if time.monotonic() >= done_at:
+            return SimpleNamespace(id=run_id, status=final, last_error=None)
+        return SimpleNamespace(id=run_id, status="in_progress", last_error=None)
+
+    def cancel(self, thread_id, run_id):
+        with self._lock:
+            self.cancelled.add(run_id)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--min-time", type=float, default=0.5, help="минимальное время run, с")
+    parser.add_argument("--max-time", type=float, default=3.0, help="максимальное время run, с")
+    parser.add_argument("--deadline", type=float, default=5.0)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    runs = FakeRuns(args.min_time, args.max_time, args.fail_rate, args.hang_rate)
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    poller = RunPoller(client=client, workers=args.workers, initial_delay=0.2,
+                       max_delay=1.0, deadline=args.deadline)
+
+    latencies = []   # сколько ответ ждал пользователь
+    overheads = []   # насколько позже фактического завершения run мы это заметили
+    outcomes = {"completed": 0, "failed": 0, "timeout": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.chats)
+
+    def chat(i):
+        barrier.wait()
+        started = time.monotonic()
+        run = runs.create(thread_id=f"thread_{i}")
+        try:
+            poller.wait(f"thread_{i}", run.id)
+            status = "completed"
+        except RunFailedError as e:
+            status = e.status
+        finished = time.monotonic()
+        with lock:
+            outcomes[status] = outcomes.get(status, 0) + 1
+            if status == "completed":
+                latencies.append(finished - started)
+                overheads.append(finished - runs.runs[run.id][0])
+
+    threads = [threading.Thread(target=chat, args=(i,)) for i in range(args.chats)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    poller.shutdown()
+
+    print(f"Чатов: {args.chats}, воркеров опроса: {args.workers}, общее время: {elapsed:.2f} с")
+    print(f"Исходы: {outcomes}, отменено run'ов: {len(runs.cancelled)}")
+    print(f"Запросов runs.retrieve: {runs.retrieve_calls} "
+          f"(в среднем {runs.retrieve_calls / args.chats:.1f} на run)")
+    if latencies:
+        print(f"Задержка ответа: p50={percentile(latencies, 50):.3f} с, "
+              f"p99={percentile(latencies, 99):.3f} с, среднее={statistics.mean(latencies):.3f} с")
+        print(f"Опоздание опроса: p50={percentile(overheads, 50):.3f} с, "
+              f"p99={percentile(overheads, 99):.3f} с")
+
+
+if __name__ == "__main__":
+    main()
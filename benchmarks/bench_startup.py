@@ -0,0 +1,193 @@
+# benchmarks/bench_startup.py
+#
+# Холодный старт бота и бюджет на его регрессию.
+#
+# 1. python -X importtime -c "import bot" (WARM_UP=0): сколько стоит импорт bot
+#    и какие модули тянутся при этом; тяжёлые зависимости (openai, numpy, pydub)
+#    не должны загружаться до первого обращения к ним.
+# 2. Время до первого ответа: python bot.py против заглушки Bot API (benchmarks/fakes.py),
+#    в очереди getUpdates уже лежит /start — меряется время от запуска процесса
+#    до первого getUpdates и до первого sendMessage. Для сравнения тот же запуск
+#    с принудительным импортом openai, numpy и pydub до bot.py (как было раньше).
+#
+# Превышение бюджета (--import-budget-ms, --response-budget-ms) или жадная загрузка
+# тяжёлых модулей — код выхода 1, так что скрипт годится как проверка перед выкладкой.
+# Запуск: python benchmarks/bench_startup.py [--runs 5] [--json startup.json]
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeSheet, FakeTelegram, catalog_csv, message_update  # noqa: E402
+
+# Не должны импортироваться вместе с bot: нужны только ассистенту и голосовым
+HEAVY_MODULES = ("openai", "numpy", "pydub", "pandas")
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)$")
+
+# Запуск «как раньше»: тяжёлые модули импортируются до кода бота
+EAGER_BOOT = (
+    "import runpy, sys; import openai, numpy, pydub; "
+    "sys.argv = ['bot.py']; runpy.run_path('{path}', run_name='__main__')"
+)
+
+
+def bot_env(telegram=None, sheet=None, tmp=None, **extra):
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "OPENAI_API_KEY": "sk-bench",
+        # Ассистент в этом бенчмарке не нужен — запросы к OpenAI никуда не уйдут
+        "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+        "LOG_LEVEL": "INFO",
+        "PYTHONPATH": ROOT,
+    })
+    if telegram is not None:
+        env["TELEGRAM_API_URL"] = telegram.api_url
+        env["TELEGRAM_FILE_URL"] = telegram.file_url
+    env["CATALOG_URL"] = sheet.url if sheet is not None else "http://127.0.0.1:9/export?format=csv"
+    if tmp is not None:
+        env["CATALOG_SNAPSHOT"] = os.path.join(tmp, "oils_snapshot.csv")
+    env.update(extra)
+    return env
+
+
+def measure_imports(tmp):
+    """
+    Импорт bot под -X importtime. Возвращает (мс на import bot, [(мс, модуль)], жадно загруженные тяжёлые).
+    """
+    code = f"import sys, bot; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=tmp, env=bot_env(tmp=tmp, WARM_UP="0", LOCAL_ANSWERS="0"),
+        capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import bot упал:\n{proc.stderr[-2000:]}")
+    total = None
+    top = children = []
+    # Дочерние модули печатаются раньше родителя: прямые импорты bot (отступ 3)
+    # идут перед строкой самого bot (отступ 1)
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match[2]), len(match[3]), match[4]
+        if indent == 1:
+            if name == "bot":
+                total, top = cumulative / 1000, children
+            children = []
+        elif indent == 3:
+            children.append((cumulative / 1000, name))
+    top.sort(reverse=True)
+    eager = [name for name in proc.stdout.strip().split(",") if name]
+    return total, top, eager
+
+
+def measure_first_response(tmp, eager=False, timeout=60.0):
+    """
+    Один холодный запуск bot.py. Возвращает (мс до первого getUpdates, мс до первого ответа, мс прогрева).
+    """
+    sheet = FakeSheet(catalog_csv([("Лаванда", 10, 900), ("Лимон", 10, 600), ("Мята", 10, 700)])).start()
+    telegram = FakeTelegram(poll_timeout=0.2).start()
+    telegram.push(message_update(1001, "/start"))
+    bot_path = os.path.join(ROOT, "bot.py")
+    command = [sys.executable, "-c", EAGER_BOOT.format(path=bot_path)] if eager else [sys.executable, bot_path]
+    started = time.monotonic()
+    proc = subprocess.Popen(command, cwd=tmp, env=bot_env(telegram, sheet, tmp),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        if not telegram.wait_for("sendMessage", timeout=timeout):
+            raise SystemExit("Бот не ответил на /start за отведённое время")
+        # Даём прогреву закончиться, чтобы узнать его длительность
+        time.sleep(0.5 if eager else 2.0)
+    finally:
+        proc.terminate()
+        try:
+            _, stderr = proc.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            _, stderr = proc.communicate()
+        telegram.stop()
+        sheet.stop()
+    first_poll = min(at for at, name, _ in telegram.calls if name == "getUpdates")
+    first_reply = min(at for at, name, _ in telegram.calls if name == "sendMessage")
+    warm = re.search(r"Прогрев модулей завершён за (\d+) мс", stderr)
+    return (
+        (first_poll - started) * 1000,
+        (first_reply - started) * 1000,
+        float(warm[1]) if warm else None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Холодный старт бота: импорт и время до первого ответа")
+    parser.add_argument("--runs", type=int, default=5, help="запусков на каждый вариант")
+    parser.add_argument("--import-budget-ms", type=float, default=400.0,
+                        help="бюджет на import bot (без прогрева)")
+    parser.add_argument("--response-budget-ms", type=float, default=1000.0,
+                        help="бюджет на медиану времени до ответа на /start")
+    parser.add_argument("--no-eager", action="store_true", help="не мерить запуск с жадными импортами")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    args = parser.parse_args()
+
+    failures = []
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        import_ms, top, eager_modules = measure_imports(tmp)
+        print(f"import bot: {import_ms:.0f} мс (бюджет {args.import_budget_ms:.0f} мс)")
+        print("Самые дорогие импорты:")
+        for ms, name in top[:8]:
+            print(f"  {ms:8.1f} мс  {name}")
+        result["import_ms"] = import_ms
+        result["top_imports"] = [{"module": name, "ms": ms} for ms, name in top[:15]]
+        result["eager_heavy_modules"] = eager_modules
+        if eager_modules:
+            failures.append(f"при импорте bot загружены тяжёлые модули: {', '.join(eager_modules)}")
+        if import_ms > args.import_budget_ms:
+            failures.append(f"import bot {import_ms:.0f} мс > бюджета {args.import_budget_ms:.0f} мс")
+
+        variants = [("lazy", False)] + ([] if args.no_eager else [("eager", True)])
+        for label, eager in variants:
+            runs = [measure_first_response(tmp, eager=eager) for _ in range(args.runs)]
+            poll = statistics.median(run[0] for run in runs)
+            reply = statistics.median(run[1] for run in runs)
+            warm = [run[2] for run in runs if run[2] is not None]
+            print(f"\n{label}: первый getUpdates {poll:.0f} мс, ответ на /start {reply:.0f} мс "
+                  f"(медиана из {len(runs)}, мин {min(run[1] for run in runs):.0f}, "
+                  f"макс {max(run[1] for run in runs):.0f})"
+                  + (f", прогрев в фоне {statistics.median(warm):.0f} мс" if warm else ""))
+            result[label] = {
+                "first_poll_ms": poll,
+                "first_response_ms": reply,
+                "first_response_runs_ms": [run[1] for run in runs],
+                "warm_up_ms": statistics.median(warm) if warm else None,
+            }
+        if result["lazy"]["first_response_ms"] > args.response_budget_ms:
+            failures.append(f"ответ на /start {result['lazy']['first_response_ms']:.0f} мс "
+                            f"> бюджета {args.response_budget_ms:.0f} мс")
+        if "eager" in result:
+            print(f"Выигрыш ленивой загрузки: "
+                  f"{result['eager']['first_response_ms'] / result['lazy']['first_response_ms']:.1f}x")
+
+    result["failures"] = failures
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if failures:
+        print("\nРЕГРЕССИЯ:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nOK: в пределах бюджета")
+
+
+if __name__ == "__main__":
+    main()
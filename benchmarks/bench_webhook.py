@@ -0,0 +1,209 @@
+# benchmarks/bench_webhook.py
+#
+# Проверка и нагрузка webhook-сервера без Telegram.
+#
+# По умолчанию поднимает WebhookServer в этом же процессе с настоящим ChatDispatcher
+# и обработчиком-заглушкой (handler_ms на обновление), затем:
+# - проверяет /healthz, /readyz, отказ без секретного токена, битый JSON, отрицательный
+#   Content-Length, повторную доставку и повтор обновления, которое не удалось разобрать;
+# - гоняет clients параллельных keep-alive клиентов и меряет задержку ответа 200;
+# - останавливает сервер посреди потока и проверяет, что все принятые обновления обработаны.
+#
+# С --url отправляет записанные обновления (benchmarks/data/webhook_updates.jsonl)
+# на уже запущенного бота: BOT_MODE=webhook WEBHOOK_SECRET=... python bot.py
+# Запуск: python benchmarks/bench_webhook.py [--clients 8] [--updates 2000] [--handler-ms 20]
+#         python benchmarks/bench_webhook.py --url http://127.0.0.1:8080/webhook --secret ...
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dispatcher import ChatDispatcher  # noqa: E402
+from webhook import WebhookServer  # noqa: E402
+
+UPDATES_PATH = os.path.join(ROOT, "benchmarks", "data", "webhook_updates.jsonl")
+SECRET = "bench-secret"
+
+
+def to_namespace(data):
+    """Грубая замена telebot.types.Update.de_json: dict -> объекты с атрибутами."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: to_namespace(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [to_namespace(value) for value in data]
+    return data
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Client:
+    """Keep-alive HTTP-клиент к webhook."""
+    def __init__(self, url, secret):
+        parts = urlsplit(url)
+        self.path = parts.path or "/"
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        self.secret = secret
+
+    def post(self, payload, secret=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if (secret or self.secret) is not None:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = secret or self.secret
+        self.conn.request("POST", self.path, body, headers)
+        response = self.conn.getresponse()
+        response.read()
+        return response.status
+
+    def get(self, path):
+        self.conn.request("GET", path)
+        response = self.conn.getresponse()
+        response.read()
+        return response.status
+
+
+def raw_status(url, request):
+    """Статус ответа на сырой HTTP-запрос (http.client не даст отправить битые заголовки)."""
+    parts = urlsplit(url)
+    with socket.create_connection((parts.hostname, parts.port), timeout=10) as sock:
+        sock.sendall(request)
+        return int(sock.recv(1024).split(b" ", 2)[1])
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def replay_to_url(args):
+    client = Client(args.url, args.secret)
+    for update in load_updates(args.file):
+        text = update.get("message", {}).get("text", "")
+        print(f"update {update['update_id']} ({text!r}): HTTP {client.post(update)}")
+
+
+def start_server(handler_ms):
+    def handler(update):
+        time.sleep(handler_ms / 1000)
+
+    dispatcher = ChatDispatcher(handler, workers=8, max_pending_per_chat=1000, max_pending_total=100000)
+    server = WebhookServer(dispatcher, SECRET, host="127.0.0.1", port=0, parse_update=to_namespace,
+                           drain_timeout=60)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_until_complete(server._stopped.wait())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    return server, dispatcher, loop, thread
+
+
+def make_update(update_id, chat_id, text="масло от тревожности"):
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": text,
+                                                "chat": {"id": chat_id, "type": "private"}}}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--file", default=UPDATES_PATH)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--handler-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    if args.url:
+        replay_to_url(args)
+        return
+
+    # Предупреждение о неверном токене ожидаемо
+    logging.getLogger("aroma_bot.webhook").setLevel(logging.ERROR)
+    server, dispatcher, loop, thread = start_server(args.handler_ms)
+    url = f"http://127.0.0.1:{server.port}/webhook"
+
+    client = Client(url, SECRET)
+    check(client.get("/healthz") == 200 and client.get("/readyz") == 200, "health/ready")
+    check(client.post(make_update(1, 1), secret="wrong") == 401, "неверный токен должен давать 401")
+    check(client.post(b"{not json") == 400, "битый JSON должен давать 400")
+    check(raw_status(url, b"POST /webhook HTTP/1.1\r\nHost: x\r\nContent-Length: -5\r\n\r\n") == 400,
+          "отрицательный Content-Length должен давать 400")
+    recorded = load_updates(args.file)
+    check(all(client.post(update) == 200 for update in recorded), "записанные обновления")
+    check(client.post(recorded[0]) == 200 and server.duplicates == 1, "повторная доставка")
+
+    # Обновление, которое не удалось разобрать, не запоминается: повтор Telegram принимается
+    parse_update = server.parse_update
+    server.parse_update = lambda data: 1 / 0
+    logging.getLogger("aroma_bot.webhook").setLevel(logging.CRITICAL)
+    check(client.post(make_update(5, 1)) == 400, "ошибка разбора должна давать 400")
+    logging.getLogger("aroma_bot.webhook").setLevel(logging.ERROR)
+    server.parse_update = parse_update
+    received = server.received
+    check(client.post(make_update(5, 1)) == 200 and server.received == received + 1 and server.duplicates == 1,
+          "повтор после ошибки разбора не должен считаться дубликатом")
+    print(f"Проверки: healthz/readyz, 401, 400, Content-Length < 0, {len(recorded)} записанных обновлений, "
+          f"дубликат, повтор после ошибки разбора — ок")
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = Client(url, SECRET)
+        own = []
+        for n in range(index, args.updates, args.clients):
+            started = time.perf_counter()
+            check(local.post(make_update(10 + n, n % 200)) == 200, "ответ не 200")
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(worker, range(args.clients)))
+    elapsed = time.perf_counter() - started
+    print(f"{args.updates} обновлений от {args.clients} клиентов за {elapsed:.2f} с "
+          f"({args.updates / elapsed:.0f} upd/с), ответ 200: p50={percentile(latencies, 0.5) * 1000:.1f} мс, "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f} мс")
+
+    # Плавная остановка, пока в очередях диспетчера ещё есть работа
+    depth = dispatcher.depth()
+    stopping = asyncio.run_coroutine_threadsafe(server.stop(), loop)
+    time.sleep(0.05)
+    status = client.post(make_update(10**9, 1)) if not stopping.done() else 503
+    stopping.result()
+    thread.join()
+    stats = dispatcher.stats()
+    check(status == 503, f"во время остановки новые обновления должны получать 503, а не {status}")
+    check(stats["processed"] == server.received and stats["depth"] == 0, "не все обновления обработаны")
+    print(f"Остановка: в очереди было {depth}, обработано {stats['processed']} из {server.received} принятых, "
+          f"новое обновление во время остановки — HTTP {status}")
+
+
+if __name__ == "__main__":
+    main()
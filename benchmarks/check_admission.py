@@ -0,0 +1,225 @@
+# benchmarks/check_admission.py
+#
+# Детерминированная проверка AdmissionController на поддельных часах и поддельном OpenAI:
+# сценарии (лимит пользователя, общий лимит и in-flight, приоритет /р, реакция на 429)
+# и симуляция всплеска трафика с подсчётом ответов 429 с ограничителем и без него.
+# Запуск: python benchmarks/check_admission.py [--users 200] [--seconds 120] [--seed 1]
+
+import argparse
+import logging
+import os
+import random
+import sys
+from collections import deque
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from admission import INTERACTIVE, NORMAL, AdmissionController, RateLimited, retry_after_of  # noqa: E402
+from run_poller import RunFailedError  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeRateLimitError(Exception):
+    """Как openai.RateLimitError: status_code и заголовки ответа."""
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limit")
+        self.response = SimpleNamespace(headers={"retry-after": f"{retry_after:.3f}"})
+
+
+class FakeOpenAI:
+    """Сервер с лимитом rps запросов в скользящую секунду, сверх лимита — 429."""
+    def __init__(self, clock, rps):
+        self.clock = clock
+        self.rps = rps
+        self.accepted = deque()
+        self.rejected = 0
+
+    def request(self):
+        now = self.clock()
+        while self.accepted and self.accepted[0] <= now - 1.0:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.rps:
+            self.rejected += 1
+            raise FakeRateLimitError(1.0 - (now - self.accepted[0]))
+        self.accepted.append(now)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_user_bucket():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate=0.5, user_burst=3, global_rate=100, global_burst=100, clock=clock)
+    for _ in range(3):
+        controller.release(controller.submit("u1"))
+    try:
+        controller.submit("u1")
+        raise AssertionError("четвёртый запрос подряд должен быть отклонён")
+    except RateLimited as e:
+        check(e.scope == "user" and abs(e.retry_after - 2.0) < 1e-9, f"retry_after={e.retry_after}")
+    controller.release(controller.submit("u2"))  # другой пользователь не страдает
+    clock.advance(2.0)
+    check(controller.submit("u1").granted, "через 1/rate секунд запрос снова допускается")
+
+
+def check_global_and_in_flight():
+    clock = FakeClock()
+    controller = AdmissionController(global_rate=1.0, global_burst=2, max_in_flight=3, clock=clock)
+    tickets = [controller.submit(f"u{i}") for i in range(5)]
+    check([t.granted for t in tickets] == [True, True, False, False, False], "запас общего ведра — 2")
+    clock.advance(1.0)
+    check(controller.poll(tickets[2]) and not tickets[3].granted, "через секунду допускается ещё один")
+    clock.advance(5.0)
+    check(not controller.poll(tickets[3]), "in-flight упёрся в 3")
+    controller.release(tickets[0])
+    check(tickets[3].granted and not tickets[4].granted, "release освобождает слот")
+
+
+def check_priority():
+    clock = FakeClock()
+    controller = AdmissionController(global_rate=1.0, global_burst=1, clock=clock)
+    first = controller.submit("a")
+    normal = [controller.submit(f"n{i}", NORMAL) for i in range(3)]
+    interactive = controller.submit("mix", INTERACTIVE)
+    controller.release(first)
+    clock.advance(1.0)
+    check(controller.poll(interactive) and not any(t.granted for t in normal), "/р обгоняет очередь")
+    clock.advance(1.0)
+    check(controller.poll(normal[0]), "дальше — по порядку поступления")
+
+
+def check_throttle():
+    clock = FakeClock()
+    controller = AdmissionController(global_rate=4.0, global_burst=4, recovery=0.25, clock=clock)
+    ticket = controller.submit("u")
+    controller.release(ticket, FakeRateLimitError(3.0))
+    check(controller.stats()["rate"] == 2.0, "после 429 скорость падает вдвое")
+    waiting = controller.submit("v")
+    clock.advance(2.9)
+    check(not controller.poll(waiting), "во время Retry-After никто не допускается")
+    clock.advance(0.2)
+    check(controller.poll(waiting), "после паузы допуск продолжается")
+    controller.release(waiting)
+    check(controller.stats()["rate"] == 3.0, "успешный запрос возвращает скорость")
+    run_error = RunFailedError("run_1", "failed", SimpleNamespace(code="rate_limit_exceeded", message=""))
+    check(retry_after_of(run_error) == 5.0, "run с rate_limit_exceeded — тоже 429")
+    check(retry_after_of(ValueError()) is None, "прочие ошибки не тормозят допуск")
+
+
+def simulate(args, with_admission):
+    """Всплеск: обычные пользователи, один спамер и диктовка в /р; шаг времени 50 мс."""
+    rng = random.Random(args.seed)
+    clock = FakeClock()
+    server = FakeOpenAI(clock, rps=args.server_rps)
+    controller = AdmissionController(
+        user_rate=12 / 60, user_burst=5, global_rate=args.server_rps * 0.8, global_burst=args.server_rps,
+        max_in_flight=16, max_wait=30.0, clock=clock
+    )
+    step = 0.05
+    arrivals = []
+    for _ in range(args.users * 3):
+        # Всплеск в середине прогона
+        arrivals.append((rng.triangular(0, args.seconds, args.seconds / 2), f"user{rng.randrange(args.users)}", NORMAL))
+    arrivals += [(t * 0.1, "spammer", NORMAL) for t in range(int(args.seconds * 10))]
+    arrivals += [(rng.uniform(0, args.seconds), f"mix{i % 10}", INTERACTIVE) for i in range(60)]
+    arrivals.sort(key=lambda a: a[0])
+
+    waiting, running = [], []  # (ticket, user, priority, submitted_at) / (finish_at, ticket)
+    served = {"ok": 0, "429": 0, "rejected": 0, "timeout": 0, "spammer": 0}
+    waits = {NORMAL: [], INTERACTIVE: []}
+    index = 0
+    while clock.now < args.seconds + 60 or waiting or running:
+        while index < len(arrivals) and arrivals[index][0] <= clock.now:
+            _, user, priority = arrivals[index]
+            index += 1
+            if not with_admission:
+                waiting.append((None, user, priority, clock.now))
+                continue
+            try:
+                waiting.append((controller.submit(user, priority), user, priority, clock.now))
+            except RateLimited:
+                served["rejected"] += 1
+        still_waiting = []
+        for ticket, user, priority, submitted_at in waiting:
+            if with_admission and not controller.poll(ticket):
+                if clock.now - submitted_at > controller.max_wait:
+                    controller.cancel(ticket)
+                    served["timeout"] += 1
+                else:
+                    still_waiting.append((ticket, user, priority, submitted_at))
+                continue
+            try:
+                server.request()
+            except FakeRateLimitError as e:
+                served["429"] += 1
+                if with_admission:
+                    controller.release(ticket, e)
+                continue
+            waits[priority].append(clock.now - submitted_at)
+            served["ok"] += 1
+            served["spammer"] += user == "spammer"
+            running.append((clock.now + rng.uniform(1.0, 4.0), ticket))
+        waiting = still_waiting
+        finished = [item for item in running if item[0] <= clock.now]
+        running = [item for item in running if item[0] > clock.now]
+        for _, ticket in finished:
+            if with_admission:
+                controller.release(ticket)
+        clock.advance(step)
+        if clock.now > args.seconds * 10:
+            break
+    return served, waits
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--server-rps", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Предупреждения о 429 в симуляции ожидаемы
+    logging.getLogger("aroma_bot.admission").setLevel(logging.ERROR)
+
+    for scenario in (check_user_bucket, check_global_and_in_flight, check_priority, check_throttle):
+        scenario()
+        print(f"{scenario.__name__}: ок")
+
+    for label, with_admission in (("без ограничителя", False), ("с AdmissionController", True)):
+        served, waits = simulate(args, with_admission)
+        print(f"{label}: успешно {served['ok']} (из них спамер {served['spammer']}), ответов 429 {served['429']}, "
+              f"отказов по лимиту пользователя {served['rejected']}, не дождались очереди {served['timeout']}")
+        if with_admission:
+            print(f"  ожидание допуска p95: /р {percentile(waits[INTERACTIVE], 0.95):.2f} с, "
+                  f"остальные {percentile(waits[NORMAL], 0.95):.2f} с")
+
+    # Детерминизм: два прогона с одним seed дают одно и то же
+    check(simulate(args, True) == simulate(args, True), "симуляция недетерминирована")
+    print("Повторный прогон совпал: поведение детерминировано")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/check_rendering.py
+#
+# Проверка rendering.py на корректность: разбираем результат упрощённым парсером MarkdownV2
+# (строгим: неэкранированный спецсимвол или незакрытая сущность — ошибка) и сравниваем
+# видимый текст с исходным. Так видно, что текст экранирован ровно один раз:
+# при двойном экранировании в видимом тексте появляются обратные слеши.
+# Запуск: python benchmarks/check_rendering.py [--cases 2000] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rendering import (  # noqa: E402
+    MESSAGE_LIMIT, SPECIAL_CHARS, Template, escape_code, escape_markdown, split_message
+)
+
+ALPHABET = SPECIAL_CHARS + "абвгдеёжзийклмнопрстуфхцчшщъыьэюя ABC xyz 0123 \n,:;?\"'/%😀"
+
+
+def parse_markdown_v2(rendered):
+    """
+    Возвращает (видимый текст, число сущностей). Понимает только *жирный* и `код`.
+    """
+    visible = []
+    bold = code = False
+    entities = 0
+    i = 0
+    while i < len(rendered):
+        char = rendered[i]
+        if char == "\\":
+            if i + 1 == len(rendered):
+                raise ValueError("обратный слеш в конце текста")
+            escaped = rendered[i + 1]
+            allowed = "`\\" if code else SPECIAL_CHARS
+            if escaped not in allowed:
+                raise ValueError(f"лишнее экранирование {escaped!r} в позиции {i}")
+            visible.append(escaped)
+            i += 2
+            continue
+        if char == "`":
+            code = not code
+            entities += code
+        elif code:
+            visible.append(char)
+        elif char == "*":
+            bold = not bold
+            entities += bold
+        elif char in SPECIAL_CHARS:
+            raise ValueError(f"неэкранированный {char!r} в позиции {i}")
+        else:
+            visible.append(char)
+        i += 1
+    if bold or code:
+        raise ValueError("незакрытая сущность")
+    return "".join(visible), entities
+
+
+def random_text(rng, length):
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_escape(rng, cases):
+    for _ in range(cases):
+        text = random_text(rng, rng.randint(0, 200))
+        check(parse_markdown_v2(escape_markdown(text))[0] == text, f"escape_markdown: {text!r}")
+        code = parse_markdown_v2("`" + escape_code(text) + "`")[0]
+        check(code == text, f"escape_code: {text!r}")
+    # Двойное экранирование парсер замечает
+    check(parse_markdown_v2(escape_markdown(escape_markdown("1.5")))[0] != "1.5", "двойное экранирование не видно")
+
+
+def check_templates(rng, cases):
+    template = Template(
+        "🎉 *Состав смеси:*\n{mix}\n💰 *Итого:* {total:.0f}р. Отправьте `*` или `{command}`\\. Готово\\!"
+    )
+    for _ in range(cases):
+        mix = random_text(rng, rng.randint(0, 60))
+        command = random_text(rng, rng.randint(1, 10))
+        total = rng.uniform(0, 10000)
+        visible, entities = parse_markdown_v2(template.render(mix=mix, total=total, command=command))
+        expected = f"🎉 Состав смеси:\n{mix}\n💰 Итого: {total:.0f}р. Отправьте * или {command}. Готово!"
+        check(visible == expected, f"шаблон: {visible!r}")
+        check(entities == 4, f"шаблон: сущностей {entities}")
+    # Шаблон без полей рендерится один раз на импорте
+    static = Template("Привет! 👋 (тест)")
+    check(static.render() is static.render(), "статический шаблон рендерится заново")
+    for broken in ("*не закрыт", "`не закрыт", "{0}"):
+        try:
+            Template(broken)
+        except ValueError:
+            continue
+        raise AssertionError(f"шаблон {broken!r} должен быть ошибкой")
+
+
+def check_split(rng, cases):
+    paragraph = Template("*{title}*\n{body}\n`{code}`\n\n")
+    for case in range(cases):
+        parts = []
+        for _ in range(rng.randint(1, 60)):
+            parts.append(paragraph.render(
+                title=random_text(rng, rng.randint(1, 40)),
+                body=random_text(rng, rng.randint(0, 800)),
+                code=random_text(rng, rng.randint(1, 30)),
+            ))
+        # Длинные сущности, которые неизбежно придётся резать посередине
+        if case % 5 == 0:
+            parts.append("*" + escape_markdown(random_text(rng, 9000)) + "*")
+        if case % 7 == 0:
+            parts.append("`" + escape_code(random_text(rng, 9000)) + "`")
+        if case % 11 == 0:
+            parts.append("\\\\" * 5000)
+        rendered = "".join(parts)
+        limit = rng.choice((MESSAGE_LIMIT, 1000, 64))
+        chunks = split_message(rendered, limit)
+        check(all(0 < len(chunk) <= limit for chunk in chunks), "часть длиннее лимита")
+        visible = "".join(parse_markdown_v2(chunk)[0] for chunk in chunks)
+        original = parse_markdown_v2(rendered)[0]
+        # На разрезах теряются только пробелы и переводы строк
+        squeeze = lambda text: "".join(text.split())  # noqa: E731
+        check(squeeze(visible) == squeeze(original), "текст потерялся при разрезании")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    check_escape(rng, args.cases)
+    print(f"escape_markdown / escape_code: {args.cases} случайных строк — ок")
+    check_templates(rng, args.cases)
+    print(f"Template: {args.cases} подстановок — ок")
+    split_cases = max(1, args.cases // 20)
+    check_split(rng, split_cases)
+    print(f"split_message: {split_cases} длинных ответов — ок")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+# benchmarks/fakes.py
+#
+# Локальные заглушки внешних сервисов для бенчмарков: Telegram Bot API, OpenAI
+# (Threads / Runs / Whisper) и CSV прайса (Google Sheets). Каждая заглушка —
+# ThreadingHTTPServer в фоновом потоке на 127.0.0.1, адрес подставляется боту через
+# переменные окружения (TELEGRAM_API_URL, OPENAI_BASE_URL, CATALOG_URL)
+# или напрямую (telebot.apihelper.API_URL).
+
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент оборвал соединение посреди запроса (остановленный бот, брошенный long polling):
+        # для заглушки это нормально, трассировка в середине отчёта не нужна
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """
+    Основа заглушек: HTTP-сервер в фоне, route() переопределяется наследниками.
+    latency — искусственная задержка каждого ответа, секунд. route() может вернуть
+    вместо байтов итератор кусков — тогда ответ уходит с Transfer-Encoding: chunked
+    (потоковые ответы OpenAI).
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def do_DELETE(self):
+                self._serve("DELETE")
+
+            def _serve(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, headers, payload = fake.route(method, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                try:
+                    if isinstance(payload, bytes):
+                        self.send_header("Content-Length", str(len(payload)))
+                        self.end_headers()
+                        self.wfile.write(payload)
+                        return
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for chunk in payload:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except ConnectionError:
+                    pass  # клиент ушёл, не дождавшись ответа (например, остановленный бот)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _QuietHTTPServer((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, method, path, headers, body):
+        return 404, {}, b""
+
+
+def json_response(data, status=200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class FakeTelegram(FakeServer):
+    """
+    Заглушка Bot API: /bot<token>/<метод> и /file/bot<token>/<путь>.
+
+    - push() ставит обновления в очередь getUpdates (long polling не дольше poll_timeout);
+    - sendMessage / editMessageText записываются в calls и отвечают правдоподобным Message;
+    - getFile / скачивание файла отдают байты из files (file_id -> bytes) — для голосовых.
+    on_call(method, params, at) вызывается на каждый метод Bot API — так бенчмарк узнаёт,
+    когда бот ответил.
+    """
+    def __init__(self, poll_timeout=0.5, on_call=None, **kwargs):
+        super().__init__(**kwargs)
+        self.poll_timeout = poll_timeout
+        self.on_call = on_call
+        self.files = {}
+        self.calls = []  # (время, метод, параметры)
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+
+    @property
+    def api_url(self):
+        return self.base_url + "/bot{0}/{1}"
+
+    @property
+    def file_url(self):
+        return self.base_url + "/file/bot{0}/{1}"
+
+    def push(self, *updates):
+        """
+        Ставит обновления в очередь; update_id проставляется, если его нет.
+        """
+        with self._cond:
+            for update in updates:
+                if "update_id" not in update:
+                    update = dict(update, update_id=self._next_update_id)
+                self._next_update_id = max(self._next_update_id, update["update_id"]) + 1
+                self._updates.append(update)
+            self._cond.notify_all()
+
+    def wait_for(self, method, count=1, timeout=10.0) -> bool:
+        """
+        Ждёт, пока бот вызовет method хотя бы count раз.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while sum(1 for _, name, _ in self.calls if name == method) < count:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+            return True
+
+    def route(self, method, path, headers, body):
+        parts = urlsplit(path)
+        params = dict(parse_qsl(parts.query))
+        if body and "application/json" in (headers.get("Content-Type") or ""):
+            params.update(json.loads(body))
+        elif body and "x-www-form-urlencoded" in (headers.get("Content-Type") or ""):
+            params.update(parse_qsl(body.decode("utf-8")))
+
+        segments = parts.path.strip("/").split("/")
+        if segments[0] == "file" and len(segments) >= 3:
+            data = self.files.get(segments[-1].rsplit(".", 1)[0])
+            return (200, {"Content-Type": "application/octet-stream"}, data) if data is not None else (404, {}, b"")
+        if len(segments) != 2 or not segments[0].startswith("bot"):
+            return 404, {}, b""
+        name = segments[1]
+        now = time.monotonic()
+        if name == "getUpdates":
+            return json_response({"ok": True, "result": self._get_updates(params)})
+        with self._cond:
+            self.calls.append((now, name, params))
+            self._cond.notify_all()
+        if self.on_call is not None:
+            self.on_call(name, params, now)
+        return json_response({"ok": True, "result": self._result(name, params)})
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), self.poll_timeout)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch = self._updates[:int(params.get("limit") or 100)]
+            self.calls.append((time.monotonic(), "getUpdates", {"offset": offset, "returned": len(batch)}))
+            self._cond.notify_all()
+            return batch
+
+    def _result(self, name, params):
+        if name in ("sendMessage", "editMessageText"):
+            with self._cond:
+                message_id = int(params.get("message_id") or 0) or self._next_message_id
+                self._next_message_id += 1
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if name == "getFile":
+            file_id = params.get("file_id", "")
+            data = self.files.get(file_id, b"")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(data),
+                    "file_path": f"voice/{file_id}.oga"}
+        if name == "getMe":
+            return BOT_USER
+        return True
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Aroma", "username": "aroma_bench_bot"}
+
+
+def message_update(chat_id, text, update_id=None):
+    """
+    Обновление с текстовым сообщением (команды — с entity bot_command, как у Telegram).
+    """
+    message = {
+        "message_id": int(time.time() * 1000) % 1000000000,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Bench"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    update = {"message": message}
+    if update_id is not None:
+        update["update_id"] = update_id
+    return update
+
+
+def voice_update(chat_id, file_id, duration=5, update_id=None):
+    """
+    Обновление с голосовым сообщением; байты файла кладутся в FakeTelegram.files[file_id].
+    """
+    update = {"message": {
+        "message_id": int(time.time() * 1000) % 1000000000,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Bench"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "voice": {"file_id": file_id, "file_unique_id": file_id, "duration": duration, "mime_type": "audio/ogg"},
+    }}
+    if update_id is not None:
+        update["update_id"] = update_id
+    return update
+
+
+class FakeSheet(FakeServer):
+    """
+    Заглушка экспорта Google Sheets: GET / — CSV прайса с ETag (повторный запрос
+    с If-None-Match получает 304, как у настоящей таблицы).
+    """
+    def __init__(self, csv_text, **kwargs):
+        super().__init__(**kwargs)
+        self.csv = csv_text.encode("utf-8")
+        self.requests = 0
+
+    @property
+    def url(self):
+        return self.base_url + "/export?format=csv"
+
+    def route(self, method, path, headers, body):
+        self.requests += 1
+        etag = f'"{hash(self.csv) & 0xffffffff:x}"'
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "text/csv; charset=utf-8", "ETag": etag}, self.csv
+
+
+def catalog_csv(oils):
+    """
+    CSV прайса (Name, Vol, Price, без заголовка — как экспорт таблицы) из [(название, объём мл, цена)].
+    """
+    return "".join(f"{name},{vol},{price}\n" for name, vol, price in oils)
+
+
+# Так заканчивается каждый ответ поддельного ассистента: по нему бенчмарк понимает,
+# что ответ (в том числе потоковый, правками сообщения) дошёл до пользователя целиком
+ANSWER_END = "∎"
+
+_ANSWER_WORDS = (
+    "лаванда успокаивает нервную систему и помогает уснуть, масло лимона бодрит, "
+    "мята освежает и снимает напряжение, для ингаляций достаточно двух-трёх капель, "
+    "перед нанесением на кожу масло разбавляют базовым, детям дозировку уменьшают вдвое"
+).split()
+
+
+class FakeOpenAI(FakeServer):
+    """
+    Заглушка OpenAI API (/v1): Threads, Messages, Runs (опрос и stream=True) и Whisper.
+
+    - run завершается через run_seconds ± run_jitter (доля) после создания; с вероятностью
+      run_failure_rate — статусом failed; потоковый run отдаёт ответ stream_chunks кусками
+      за то же время;
+    - whisper_seconds — время распознавания, transcript — что «распознано»;
+    - error_rate / rate_limit_rate — доля запросов, получающих 500 / 429 (с Retry-After:
+      retry_after секунд); клиент openai сам повторяет такие запросы, как и с настоящим API.
+    Случайность — из random.Random(seed), поэтому прогон с тем же seed воспроизводим
+    по набору ответов (порядок запросов от бота, конечно, может отличаться).
+    """
+    def __init__(self, run_seconds=1.0, run_jitter=0.3, run_failure_rate=0.0, whisper_seconds=0.5,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, answer_words=40, stream_chunks=8,
+                 transcript="Какое масло помогает от тревожности?", seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.run_seconds = run_seconds
+        self.run_jitter = run_jitter
+        self.run_failure_rate = run_failure_rate
+        self.whisper_seconds = whisper_seconds
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.answer_words = answer_words
+        self.stream_chunks = stream_chunks
+        self.transcript = transcript
+        self.requests = {}  # эндпоинт -> количество
+        self.injected = {"429": 0, "500": 0, "run_failed": 0}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._threads = {}  # thread_id -> [сообщения]
+        self._runs = {}     # run_id -> {"thread_id", "done_at", "failed", "answer", "settled"}
+        self._lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return self.base_url + "/v1"
+
+    # --- Маршрутизация ---
+
+    def route(self, method, path, headers, body):
+        segments = urlsplit(path).path.strip("/").split("/")
+        if segments[:1] != ["v1"]:
+            return 404, {}, b""
+        segments = segments[1:]
+        endpoint = self._endpoint(method, segments)
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.injected["429"] += 1
+            status, _, payload = json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, 429
+            )
+            return status, {"Content-Type": "application/json", "Retry-After": str(self.retry_after)}, payload
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.injected["500"] += 1
+            return json_response({"error": {"message": "Internal server error", "type": "server_error"}}, 500)
+
+        if endpoint == "audio.transcriptions":
+            time.sleep(self.whisper_seconds)
+            return json_response({"text": self.transcript})
+        if endpoint == "threads.create":
+            return json_response(self._create_thread())
+        thread_id = segments[1] if len(segments) > 1 else None
+        if thread_id not in self._threads:
+            return json_response({"error": {"message": f"No thread found with id '{thread_id}'."}}, 404)
+        if endpoint == "threads.delete":
+            with self._lock:
+                del self._threads[thread_id]
+            return json_response({"id": thread_id, "object": "thread.deleted", "deleted": True})
+        if endpoint == "messages.create":
+            data = json.loads(body or b"{}")
+            return json_response(self._add_message(thread_id, data.get("role", "user"), str(data.get("content", ""))))
+        if endpoint == "messages.list":
+            self._settle_thread(thread_id)
+            with self._lock:
+                data = list(reversed(self._threads[thread_id]))
+            return json_response({"object": "list", "data": data, "has_more": False,
+                                  "first_id": data[0]["id"] if data else None,
+                                  "last_id": data[-1]["id"] if data else None})
+        if endpoint == "runs.create":
+            data = json.loads(body or b"{}")
+            run_id = self._create_run(thread_id, data.get("assistant_id", ""))
+            if data.get("stream"):
+                return 200, {"Content-Type": "text/event-stream"}, self._stream_run(run_id)
+            return json_response(self._run_object(run_id))
+        run_id = segments[3]
+        if run_id not in self._runs:
+            return json_response({"error": {"message": f"No run found with id '{run_id}'."}}, 404)
+        if endpoint == "runs.cancel":
+            with self._lock:
+                self._runs[run_id]["cancelled"] = True
+            return json_response(self._run_object(run_id))
+        self._settle_run(run_id)
+        return json_response(self._run_object(run_id))
+
+    @staticmethod
+    def _endpoint(method, segments):
+        if segments[:2] == ["audio", "transcriptions"]:
+            return "audio.transcriptions"
+        if segments[:1] != ["threads"]:
+            return "unknown"
+        if len(segments) == 1:
+            return "threads.create"
+        if len(segments) == 2:
+            return "threads.delete" if method == "DELETE" else "threads.retrieve"
+        if segments[2] == "messages":
+            return "messages.create" if method == "POST" else "messages.list"
+        if segments[2] == "runs":
+            if len(segments) == 3:
+                return "runs.create"
+            return "runs.cancel" if segments[-1] == "cancel" else "runs.retrieve"
+        return "unknown"
+
+    # --- Состояние ---
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids):08d}"
+
+    def _create_thread(self):
+        thread_id = self._new_id("thread")
+        with self._lock:
+            self._threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    def _add_message(self, thread_id, role, text, run_id=None):
+        message = {
+            "id": self._new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "run_id": run_id, "metadata": {}, "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        }
+        with self._lock:
+            messages = self._threads.get(thread_id)
+            if messages is not None:
+                messages.append(message)
+        return message
+
+    def _create_run(self, thread_id, assistant_id):
+        with self._lock:
+            duration = self.run_seconds * (1 + self.run_jitter * (2 * self._random.random() - 1))
+            failed = self._random.random() < self.run_failure_rate
+            words = [self._random.choice(_ANSWER_WORDS) for _ in range(self.answer_words)]
+        run_id = self._new_id("run")
+        self._runs[run_id] = {
+            "thread_id": thread_id, "assistant_id": assistant_id, "created_at": int(time.time()),
+            "done_at": time.monotonic() + max(0.0, duration), "failed": failed, "cancelled": False,
+            "answer": " ".join(words).capitalize() + ". " + ANSWER_END, "settled": False,
+        }
+        if failed:
+            self.injected["run_failed"] += 1
+        return run_id
+
+    def _status(self, run):
+        if run["cancelled"]:
+            return "cancelled"
+        if time.monotonic() < run["done_at"]:
+            return "in_progress"
+        return "failed" if run["failed"] else "completed"
+
+    def _settle_run(self, run_id):
+        run = self._runs[run_id]
+        with self._lock:
+            if run["settled"] or self._status(run) != "completed":
+                return
+            run["settled"] = True
+        self._add_message(run["thread_id"], "assistant", run["answer"], run_id)
+
+    def _settle_thread(self, thread_id):
+        for run_id in [run_id for run_id, run in list(self._runs.items()) if run["thread_id"] == thread_id]:
+            self._settle_run(run_id)
+
+    def _run_object(self, run_id):
+        run = self._runs[run_id]
+        status = self._status(run)
+        return {
+            "id": run_id, "object": "thread.run", "created_at": run["created_at"],
+            "thread_id": run["thread_id"], "assistant_id": run["assistant_id"], "status": status,
+            "last_error": {"code": "server_error", "message": "Injected failure"} if status == "failed" else None,
+            "model": "fake", "instructions": "", "tools": [], "metadata": {},
+        }
+
+    def _stream_run(self, run_id):
+        run = self._runs[run_id]
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        yield event("thread.run.created", dict(self._run_object(run_id), status="queued"))
+        yield event("thread.run.in_progress", dict(self._run_object(run_id), status="in_progress"))
+        if not run["failed"]:
+            message_id = self._new_id("msg")
+            words = run["answer"].split(" ")
+            step = max(1, -(-len(words) // self.stream_chunks))
+            pieces = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+            pieces[-1] = pieces[-1].rstrip()
+            delay = max(0.0, run["done_at"] - time.monotonic()) / len(pieces)
+            for index, piece in enumerate(pieces):
+                time.sleep(delay)
+                yield event("thread.message.delta", {
+                    "id": message_id, "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": piece}}]},
+                })
+        else:
+            time.sleep(max(0.0, run["done_at"] - time.monotonic()))
+        self._settle_run(run_id)
+        status = self._status(run)
+        yield event(f"thread.run.{status}", self._run_object(run_id))
+        yield b"event: done\ndata: [DONE]\n\n"
@@ -1,12 +1,35 @@
 import os
+import math
+import logging
 import telebot
-import openai
-import tempfile
-import io
 from dotenv import load_dotenv
-import pandas as pd
-from pydub import AudioSegment, silence
 from assistent import AssistantDialogManager
+from thread_store import MemoryThreadStore, SQLiteThreadStore
+from oil_knowledge import OilKnowledgeBase
+from answer_cache import AnswerCache
+from transcription import ChunkedTranscriber
+from run_poller import RunFailedError
+from admission import INTERACTIVE, NORMAL, AdmissionController, RateLimited
+from streaming import StreamingReply
+from rendering import Template, escape_markdown, split_message
+from dispatcher import install_dispatcher
+from webhook import WebhookServer, install_webhook, is_loopback
+from catalog_refresher import CatalogRefresher
+from pricing import RecipeError, RecipePricer, parse_recipe
+from mix_session import (
+    WAITING_DROPS, WAITING_NEXT_OIL, MemorySessionStore, MixSession, RedisSessionStore,
+    SQLiteSessionStore, WriteBehindSessionStore
+)
+from metrics import (
+    REGISTRY, configure_logging, instrument_methods, log_event, span, start_metrics_server
+)
+from lazy import background, lazy_import, warm_up
+
+# Тяжёлые зависимости не нужны для первого ответа: openai (~0,8 с на импорт) и
+# audio (NumPy + pydub) загружаются при первом обращении или фоновым прогревом
+# сразу после старта (см. «Прогрев» ниже)
+openai = lazy_import("openai")
+audio = lazy_import("audio")
 
 # === ЗАГРУЗКА API-КЛЮЧЕЙ И СОЗДАНИЕ ОБЪЕКТА БОТА ===
 load_dotenv()
@@ -17,276 +40,553 @@ if not TELEGRAM_BOT_TOKEN or not OPENAI_API_KEY:
     raise ValueError("❌ Отсутствует TELEGRAM_BOT_TOKEN или OPENAI_API_KEY в .env файле!")
 
 openai.api_key = OPENAI_API_KEY
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, parse_mode="MarkdownV2")
-print("[DEBUG] Телеграм-бот инициализирован")
-
-# === ЗАГРУЗКА ДАННЫХ ИЗ GOOGLE SHEETS ДЛЯ РЕЖИМА /р ===
-print("[DEBUG] Пытаемся загрузить данные из Google Sheets...")
-SHEET_URL = "https://docs.google.com/spreadsheets/d/1MknmvI9_YvjM7bge9tPryRKrrzCi-Ywc5ZfYiyb6Bdg/export?format=csv"
-COLUMN_NAMES = ["Name", "Vol", "Price"]
-
-try:
-    df = pd.read_csv(SHEET_URL, names=COLUMN_NAMES, encoding="utf-8")
-    print("[DEBUG] Данные о маслах успешно загружены из Google Sheets")
-except Exception as e:
-    print(f"[DEBUG] Ошибка загрузки данных: {e}")
-    df = pd.DataFrame(columns=COLUMN_NAMES)
+# Повторы запросов к OpenAI делает не клиент, а call_with_retries (admission.py) и пул
+# распознавания: иначе клиент сам пережидает 429, и ограничитель допуска о них не узнаёт
+openai.max_retries = 0
+
+# Логирование: уровень LOG_LEVEL (по умолчанию WARNING), вывод через фоновый поток.
+# Метрики в формате Prometheus: METRICS_PORT задан — поднимается http://127.0.0.1:<порт>/metrics
+configure_logging()
+log = logging.getLogger("aroma_bot.bot")
+# TELEGRAM_API_URL — свой сервер Bot API (например, локальный telegram-bot-api),
+# шаблон вида http://host:port/bot{0}/{1}; по умолчанию — api.telegram.org
+if os.getenv("TELEGRAM_API_URL"):
+    telebot.apihelper.API_URL = os.getenv("TELEGRAM_API_URL")
+    telebot.apihelper.FILE_URL = os.getenv("TELEGRAM_FILE_URL", telebot.apihelper.FILE_URL)
+# threaded=False: обновления раздаёт ChatDispatcher (см. конец файла), а не пул telebot
+bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, parse_mode="MarkdownV2", threaded=False)
+instrument_methods(bot, "telegram", ["reply_to", "send_message", "edit_message_text", "get_file", "download_file"])
+log.info("Телеграм-бот инициализирован")
+
+# === ПРАЙС-ЛИСТ ИЗ GOOGLE SHEETS ДЛЯ РЕЖИМА /р ===
+# Справочник поднимается из локального снимка сразу, а таблица обновляется в фоне
+# условными запросами (ETag / If-Modified-Since) раз в CATALOG_REFRESH_INTERVAL секунд.
+SHEET_URL = os.getenv(
+    "CATALOG_URL",
+    "https://docs.google.com/spreadsheets/d/1MknmvI9_YvjM7bge9tPryRKrrzCi-Ywc5ZfYiyb6Bdg/export?format=csv"
+)
+catalog_refresher = CatalogRefresher(
+    SHEET_URL,
+    snapshot_path=os.getenv("CATALOG_SNAPSHOT", "oils_snapshot.csv"),
+    interval=float(os.getenv("CATALOG_REFRESH_INTERVAL", "300")),
+)
+if not catalog_refresher.load_snapshot():
+    log.info("Снимка прайса нет, справочник появится после первой загрузки из Google Sheets")
+catalog_refresher.start()
 
 # === Ассистент для диалога (из assistent.py) ===
-print("[DEBUG] Создаём AssistantDialogManager...")
-assistant_manager = AssistantDialogManager(time_limit=1200)  # 20 минут неактивности
+# THREAD_STORE_PATH задан — соответствия user_id -> thread_id хранятся в SQLite и общие
+# для всех процессов бота; иначе — ограниченный LRU в памяти (THREAD_STORE_MAX_SIZE записей)
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH")
+if THREAD_STORE_PATH:
+    thread_store = SQLiteThreadStore(THREAD_STORE_PATH)
+else:
+    thread_store = MemoryThreadStore(max_size=int(os.getenv("THREAD_STORE_MAX_SIZE", "10000")))
+# Кеш ответов на одинаковые вопросы — включается явно: ANSWER_CACHE=1.
+# ANSWER_CACHE_SIMILARITY (например, 0.8) включает поиск похожих вопросов по TF-IDF.
+answer_cache = None
+if os.getenv("ANSWER_CACHE", "0") == "1":
+    similarity = os.getenv("ANSWER_CACHE_SIMILARITY")
+    answer_cache = AnswerCache(
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(5 * 1024 * 1024))),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+        similarity=float(similarity) if similarity else None,
+    )
+# Допуск запросов к OpenAI (ассистент и Whisper): лимит на пользователя
+# USER_REQUESTS_PER_MINUTE (с запасом USER_BURST), общий OPENAI_REQUESTS_PER_SECOND
+# (с запасом OPENAI_BURST), не больше OPENAI_MAX_IN_FLIGHT запросов одновременно.
+# Запрос, не дождавшийся очереди за ADMISSION_MAX_WAIT секунд, получает отказ.
+admission = AdmissionController(
+    user_rate=float(os.getenv("USER_REQUESTS_PER_MINUTE", "12")) / 60,
+    user_burst=int(os.getenv("USER_BURST", "5")),
+    global_rate=float(os.getenv("OPENAI_REQUESTS_PER_SECOND", "3")),
+    global_burst=int(os.getenv("OPENAI_BURST", "10")),
+    max_in_flight=int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "60")),
+)
+assistant_manager = AssistantDialogManager(
+    time_limit=1200,  # 20 минут неактивности
+    store=thread_store,
+    cache=answer_cache,
+    admission=admission,
+)
+assistant_manager.start_sweeper(interval=float(os.getenv("THREAD_SWEEP_INTERVAL", "60")))
+
+# === Локальная справка по монографиям (mono_oils.txt) ===
+# Прямые вопросы («комплементарные масла к базилику», «масло от тревожности») отвечаются
+# на месте; если уверенности нет, вопрос уходит ассистенту. LOCAL_ANSWERS=0 отключает.
+# Индекс строится в фоне: /start и /р от него не зависят, а вопрос, пришедший раньше,
+# дождётся окончания загрузки.
+LOCAL_ANSWERS = os.getenv("LOCAL_ANSWERS", "1") == "1"
+
+def load_knowledge_base():
+    knowledge_base = OilKnowledgeBase.from_file()
+    log.info("Загружено монографий: %d", len(knowledge_base.records))
+    if answer_cache is not None:
+        # «что такое лаванда» понятен без контекста, если лаванда — известное масло
+        answer_cache.add_topics(knowledge_base.name_terms)
+    return knowledge_base
+
+knowledge_base_future = background(load_knowledge_base, name="knowledge-base") if LOCAL_ANSWERS else None
+
+def local_knowledge():
+    """
+    База монографий или None, если локальные ответы выключены или база не загрузилась.
+    """
+    if knowledge_base_future is None:
+        return None
+    try:
+        return knowledge_base_future.result()
+    except Exception:
+        return None
 
-# === Глобальное состояние ===
-user_states = {}
-drops_counts = {}
-current_oils = {}
-drop_session_changes = {}
+# Потоковые ответы ассистента: заглушка + правки сообщения не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# === СЕССИИ РЕЖИМА /р ===
+# MIX_SESSION_REDIS_URL — общие сессии для реплик на разных машинах (нужен пакет redis),
+# MIX_SESSION_PATH — SQLite-файл (переживает перезапуск, общий для процессов на одной машине),
+# иначе — в памяти. Изменения пишутся в фоне раз в MIX_SESSION_FLUSH_INTERVAL секунд
+# (в общие Redis и SQLite — сразу, см. WriteBehindSessionStore),
+# брошенные сессии удаляются через MIX_SESSION_IDLE_TIMEOUT секунд простоя.
+MIX_SESSION_IDLE_TIMEOUT = float(os.getenv("MIX_SESSION_IDLE_TIMEOUT", "3600"))
+if os.getenv("MIX_SESSION_REDIS_URL"):
+    import redis
+    mix_backend = RedisSessionStore(
+        redis.Redis.from_url(os.getenv("MIX_SESSION_REDIS_URL")), ttl=MIX_SESSION_IDLE_TIMEOUT
+    )
+elif os.getenv("MIX_SESSION_PATH"):
+    mix_backend = SQLiteSessionStore(os.getenv("MIX_SESSION_PATH"))
+else:
+    mix_backend = MemorySessionStore()
+mix_sessions = WriteBehindSessionStore(
+    mix_backend,
+    flush_interval=float(os.getenv("MIX_SESSION_FLUSH_INTERVAL", "1.0")),
+    idle_timeout=MIX_SESSION_IDLE_TIMEOUT,
+)
+mix_sessions.start()
+
+# === ТЕКСТЫ СООБЩЕНИЙ (MarkdownV2) ===
+# Шаблоны экранируются один раз при импорте; разметка в них — только *жирный* и `код`,
+# подставляемые значения экранируются при render()
+CAPABILITIES = Template(
+    "*Возможности бота:*\n\n"
+    "✅ `/start` – Приветствие и вывод возможностей\n"
+    "✅ `/р` – Рассчитать смесь масел\n"
+    "✅ `/р лаванда 5, лимон 3` – Рассчитать рецепт одной командой\n"
+    "✅ Или просто напишите свой вопрос, и я отвечу, используя свои знания."
+)
+GREETING = Template("Привет! 👋 Я ваш помощник по эфирным маслам.\n\nДавайте начнём!")
+MIX_START = Template(
+    "Введите название масла (например, Лаванда, Лимон, Мята) "
+    "или весь рецепт сразу: `лаванда 5, лимон 3`.\n\n"
+    "🛑 Чтобы закончить ввод смеси, отправьте `*`."
+)
+MIX_FINISHED = Template(
+    "🎉 Смесь завершена!\n\n"
+    "🧪 *Состав смеси:*\n{mix}\n\n"
+    "💰 *Общая стоимость:* {total}р."
+)
+MIX_QUOTE = Template(
+    "🧪 *Состав смеси:*\n{mix}\n\n"
+    "💰 *Общая стоимость:* {total}р."
+)
+MIX_QUOTE_UNKNOWN = Template("❌ Нет в прайсе: {oils}.\nПроверьте названия и отправьте рецепт ещё раз.")
+MIX_RECIPE_ERROR = Template("❌ Не понял позицию «{item}». Пример: `/р лаванда 5, лимон 3, мята 2`")
+MIX_OIL_NOT_FOUND = Template('❌ Масло "{oil}" не найдено.\nПопробуйте снова:')
+MIX_ASK_DROPS = Template("Введите количество капель для {oil}:")
+MIX_BAD_DROPS = Template("❌ Введите корректное количество капель:")
+MIX_ADDED = Template(
+    "✅ Добавлено: *{oil}* — {drops} капель.\n"
+    "Текущий состав смеси:\n{mix}\n"
+    "Общая стоимость: {total}р.\n\n"
+    "Введите название следующего масла или отправьте `*` для завершения."
+)
+MIX_ADDED_RECIPE = Template(
+    "✅ Добавлено масел: {count}.\n"
+    "Текущий состав смеси:\n{mix}\n"
+    "Общая стоимость: {total}р.\n\n"
+    "Введите название следующего масла или отправьте `*` для завершения."
+)
+RATE_LIMITED = Template("⏳ Слишком много запросов. Попробуйте ещё раз через {seconds} с.")
+VOICE_NOT_RECOGNIZED = Template("❌ Не удалось распознать голосовое сообщение или аудио пустое.")
+VOICE_FAILED = Template("❌ Ошибка при обработке голосового сообщения. Попробуйте ещё раз.")
+ASSISTANT_FAILED = Template("⚠️ Ассистент сейчас не смог ответить. Попробуйте ещё раз чуть позже.")
+ASSISTANT_EMPTY = Template("⚠️ Ассистент прислал пустой ответ. Попробуйте переформулировать вопрос.")
+
+def send_rendered(message, rendered):
+    """
+    Отвечает на сообщение готовым MarkdownV2-текстом; длинный текст уходит
+    несколькими сообщениями (split_message режет по границам абзацев и сущностей).
+    """
+    chunks = split_message(rendered)
+    bot.reply_to(message, chunks[0], parse_mode="MarkdownV2")
+    for chunk in chunks[1:]:
+        bot.send_message(message.chat.id, chunk, parse_mode="MarkdownV2")
 
-# Состояния диалога (используются только для режима /р)
-WAITING_NEXT_OIL = "waiting_for_next_oil"
-WAITING_DROPS = "waiting_for_drop_quantity"
+def current_pricer():
+    """
+    Расчётчик рецептов для текущей версии прайса: пересоздаётся после обновления таблицы.
+    """
+    global _pricer
+    catalog = catalog_refresher.catalog
+    if _pricer is None or _pricer.catalog is not catalog:
+        _pricer = RecipePricer(catalog)
+    return _pricer
 
-def escape_markdown(text):
-    """Экранирует специальные символы для MarkdownV2."""
-    print("[DEBUG] escape_markdown вызван для строки длиной", len(text))
-    escape_chars = r"\_*[]()~`>#+-=|{}.!<>"
-    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+_pricer = None
 
 def show_bot_capabilities(chat_id):
     """
     Меню возможностей бота.
     """
-    print(f"[DEBUG] show_bot_capabilities вызван для chat_id={chat_id}")
-    capabilities = (
-        "*Возможности бота:*\n\n"
-        "✅ `/start` – Приветствие и вывод возможностей\n"
-        "✅ `/р` – Рассчитать смесь масел\n"
-        "✅ Или просто напишите свой вопрос, и я отвечу, используя свои знания.\n\n"
-    )
-    bot.send_message(chat_id, escape_markdown(capabilities), parse_mode="MarkdownV2")
+    bot.send_message(chat_id, CAPABILITIES.render(), parse_mode="MarkdownV2")
 
-def simple_transcribe_audio(audio_file_path, silence_thresh=-40.0, min_silence_len=1000):
+def whisper_transcribe(upload, priority=NORMAL):
     """
-    Упрощённая транскрипция аудио с проверкой на пустоту.
-    Если аудиофайл пустой (содержит только тишину или нулевую длительность), возвращается None.
+    Один запрос к Whisper API: upload - BytesIO с аудио и атрибутом name.
+    Каждый запрос (в том числе кусок длинного голосового) проходит общие лимиты
+    admission; лимит пользователя списывается один раз на сообщение.
     """
-    print(f"[DEBUG] Начинаем транскрипцию файла: {audio_file_path}")
-    try:
-        audio = AudioSegment.from_file(audio_file_path)
-        print(f"[DEBUG] Аудиофайл загружен. Длительность: {len(audio)} мс")
-
-        # Если аудио имеет нулевую продолжительность
-        if len(audio) == 0:
-            print("[DEBUG] Аудиофайл имеет нулевую длительность. Возвращаем None.")
-            return None
-
-        # Проверяем, содержит ли аудио ненулевые сегменты
-        print("[DEBUG] Поиск ненулевых сегментов...")
-        nonsilent_segments = silence.detect_nonsilent(
-            audio, 
-            min_silence_len=min_silence_len, 
-            silence_thresh=silence_thresh
-        )
-        if len(nonsilent_segments) == 0:
-            print("[DEBUG] Аудиофайл содержит только тишину. Возвращаем None.")
-            return None
-        
-        # Конвертируем в моно WAV
-        print("[DEBUG] Конвертируем аудио в моно WAV для отправки в Whisper...")
-        audio = audio.set_channels(1)
-        wav_io = io.BytesIO()
-        audio.export(wav_io, format="wav")
-        wav_io.seek(0)
-        wav_io.name = "audio.wav"
-        
-        print("[DEBUG] Отправляем WAV в Whisper API для транскрипции...")
+    with admission.admit(None, priority=priority), span("whisper"):
         transcript = openai.audio.transcriptions.create(
-            file=wav_io,
+            file=upload,
             model="whisper-1",
             language="ru",
             response_format="json"  # или "text", если нужен просто текст
         )
-        text = transcript.text.strip()
-        print(f"[DEBUG] Whisper вернул текст: {text!r}")
+    return transcript.text
+
+# Длинные голосовые (дольше TRANSCRIBE_CHUNKED_SECONDS) распознаются кусками
+# до TRANSCRIBE_CHUNK_SECONDS на пуле из TRANSCRIBE_WORKERS потоков
+transcriber = ChunkedTranscriber(
+    whisper_transcribe,
+    workers=int(os.getenv("TRANSCRIBE_WORKERS", "4")),
+    max_chunk_ms=int(float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "30")) * 1000),
+    min_chunked_ms=int(float(os.getenv("TRANSCRIBE_CHUNKED_SECONDS", "45")) * 1000),
+)
+
+def simple_transcribe_audio(audio_data, silence_thresh=-40.0, min_silence_len=1000,
+                            user_id=None, priority=NORMAL):
+    """
+    Упрощённая транскрипция аудио с проверкой на пустоту.
+    audio_data - байты OGG-файла голосового сообщения (как их отдаёт bot.download_file).
+    Аудио декодируется в памяти, тишина ищется векторно по кадрам, начало и конец
+    обрезаются, а в Whisper уходит 16 кГц моно OGG/Opus вместо несжатого WAV.
+    Длинные сообщения режутся по паузам и распознаются по кускам параллельно.
+    Если аудио пустое (содержит только тишину или нулевую длительность), возвращается None.
+    Распознавание проходит через admission от имени user_id; при превышении лимитов
+    выбрасывается RateLimited.
+    """
+    try:
+        with span("audio.prepare"):
+            prepared = audio.prepare_audio(
+                audio_data,
+                silence_thresh=silence_thresh,
+                min_silence_len=min_silence_len
+            )
+        if prepared is None:
+            log_event(log, logging.DEBUG, "audio_empty", size=len(audio_data))
+            return None
+        log_event(log, logging.DEBUG, "audio_prepared", size=len(audio_data),
+                  duration_ms=prepared.duration_ms, speech_ms=len(prepared.segment))
+
+        admission.charge_user(user_id)
+        with span("transcribe"):
+            text = transcriber.transcribe(prepared, priority=priority)
+        log_event(log, logging.DEBUG, "transcribed", chars=len(text))
         return text if text else None
-    except Exception as e:
-        print(f"[DEBUG] Ошибка транскрипции: {e}", flush=True)
+    except RateLimited:
+        raise
+    except Exception:
+        log.exception("Ошибка транскрипции")
         return None
 
+def retry_seconds(error):
+    """
+    Через сколько целых секунд предложить пользователю повторить запрос.
+    """
+    return max(1, math.ceil(error.retry_after))
+
+def stream_assistant_reply(message):
+    """
+    Отвечает ассистентом в потоковом режиме: заглушка появляется сразу,
+    затем текст дописывается правками сообщения.
+    """
+    reply = StreamingReply(bot, message, min_interval=STREAM_EDIT_INTERVAL)
+    reply.start()
+    try:
+        for delta in assistant_manager.ask_assistant_stream(message.chat.id, message.text.strip()):
+            reply.feed(delta)
+    except RateLimited as e:
+        log_event(log, logging.INFO, "rate_limited", chat_id=message.chat.id, scope=e.scope)
+        reply.finish(fallback=RATE_LIMITED.render(seconds=retry_seconds(e)))
+        return
+    except RunFailedError as e:
+        log.warning("Ассистент не ответил: %s", e)
+        reply.finish(fallback=ASSISTANT_FAILED.render())
+        return
+    except Exception:
+        # Ошибки OpenAI после всех повторов (5xx, обрыв соединения) — заглушка не должна
+        # остаться без ответа
+        log.exception("Ошибка потокового ответа ассистента")
+        reply.finish(fallback=ASSISTANT_FAILED.render())
+        return
+    reply.finish(fallback=ASSISTANT_EMPTY.render())
+    log_event(log, logging.DEBUG, "stream_reply_sent", chat_id=message.chat.id, edits=reply.edits)
+
 @bot.message_handler(commands=['start'])
 def start_command(message):
-    print(f"[DEBUG] start_command вызван от chat_id={message.chat.id}")
-    bot.reply_to(
-        message,
-        escape_markdown("Привет! 👋 Я ваш помощник по эфирным маслам\\.\n\nДавайте начнём!"),
-        parse_mode="MarkdownV2"
-    )
+    bot.reply_to(message, GREETING.render(), parse_mode="MarkdownV2")
     show_bot_capabilities(message.chat.id)
 
 @bot.message_handler(commands=['р'])
 def mix_command(message):
     """
-    Начало режима расчёта смеси масел.
+    Начало режима расчёта смеси масел. С рецептом в аргументах (/р лаванда 5, лимон 3)
+    смесь считается сразу, без пошагового диалога.
     """
-    print(f"[DEBUG] mix_command (/р) вызван от chat_id={message.chat.id}")
-    bot.reply_to(
-        message,
-        escape_markdown(
-            "Введите название масла \\(например, Лаванда, Лимон, Мята\\)\\.\n\n"
-            "🛑 Чтобы закончить ввод смеси, отправьте `*`\\."
-        ), 
-        parse_mode="MarkdownV2"
-    )
-    user_states[message.chat.id] = WAITING_NEXT_OIL
-    print(f"[DEBUG] Состояние для chat_id={message.chat.id} установлено в {WAITING_NEXT_OIL}")
+    parts = message.text.split(maxsplit=1)
+    if len(parts) > 1:
+        quote = quote_recipe(message, parts[1])
+        if quote is not None:
+            send_rendered(message, MIX_QUOTE.render(mix="\n".join(quote.lines()), total=int(quote.total)))
+        return
+    bot.reply_to(message, MIX_START.render(), parse_mode="MarkdownV2")
+    mix_sessions.put(MixSession(message.chat.id))
+    log_event(log, logging.DEBUG, "mix_state", chat_id=message.chat.id, state=WAITING_NEXT_OIL)
+
+def quote_recipe(message, text):
+    """
+    Считает рецепт целиком. Возвращает Quote или None — тогда пользователю уже
+    отправлено, что именно не так (позиция не разобралась или масла нет в прайсе).
+    """
+    try:
+        items = parse_recipe(text)
+    except RecipeError as e:
+        bot.reply_to(message, MIX_RECIPE_ERROR.render(item=e.item), parse_mode="MarkdownV2")
+        return None
+    with span("pricing.quote"):
+        quote = current_pricer().quote(items)
+    log_event(log, logging.DEBUG, "recipe_quote", chat_id=message.chat.id, oils=len(items),
+              unknown=len(quote.unknown), total=round(quote.total, 2))
+    if not quote.complete:
+        bot.reply_to(message, MIX_QUOTE_UNKNOWN.render(oils=", ".join(quote.unknown)), parse_mode="MarkdownV2")
+        return None
+    return quote
 
 @bot.message_handler(content_types=['voice'])
 def handle_voice_message(message):
     """
     Обработка голосовых сообщений (Speech-to-Text).
     """
-    print(f"[DEBUG] handle_voice_message вызван для chat_id={message.chat.id}")
     try:
         file_info = bot.get_file(message.voice.file_id)
-        print("[DEBUG] file_info получен:", file_info)
         downloaded_file = bot.download_file(file_info.file_path)
-        print("[DEBUG] Голосовой файл скачан, длина:", len(downloaded_file))
+        log_event(log, logging.DEBUG, "voice_downloaded", chat_id=message.chat.id, size=len(downloaded_file))
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_audio:
-            temp_audio.write(downloaded_file)
-            temp_audio_path = temp_audio.name
-        print(f"[DEBUG] Временный файл создан: {temp_audio_path}")
-
-        recognized_text = simple_transcribe_audio(temp_audio_path)
-        print(f"[DEBUG] Результат распознавания: {recognized_text!r}")
-        os.remove(temp_audio_path)
+        # Голосом внутри /р диктуют названия масел — такие запросы короткие и идут вне очереди
+        in_mix = mix_sessions.get(message.chat.id) is not None
+        recognized_text = simple_transcribe_audio(
+            downloaded_file, user_id=message.chat.id, priority=INTERACTIVE if in_mix else NORMAL
+        )
 
         if recognized_text:
-            print("[DEBUG] Распознан текст. Передаём в handle_input...")
             message.text = recognized_text
             handle_input(message)
         else:
-            print("[DEBUG] Не удалось распознать голосовое сообщение.")
-            bot.reply_to(
-                message,
-                escape_markdown("❌ Не удалось распознать голосовое сообщение или аудио пустое\\."),
-                parse_mode="MarkdownV2"
-            )
-    except Exception as e:
-        print(f"[DEBUG] Ошибка при обработке голосового сообщения: {e}")
-        bot.reply_to(
-            message,
-            escape_markdown("❌ Ошибка при обработке голосового сообщения\\. Попробуйте ещё раз."),
-            parse_mode="MarkdownV2"
-        )
+            log_event(log, logging.DEBUG, "voice_not_recognized", chat_id=message.chat.id)
+            bot.reply_to(message, VOICE_NOT_RECOGNIZED.render(), parse_mode="MarkdownV2")
+    except RateLimited as e:
+        log_event(log, logging.INFO, "rate_limited", chat_id=message.chat.id, scope=e.scope)
+        bot.reply_to(message, RATE_LIMITED.render(seconds=retry_seconds(e)), parse_mode="MarkdownV2")
+    except Exception:
+        log.exception("Ошибка при обработке голосового сообщения")
+        bot.reply_to(message, VOICE_FAILED.render(), parse_mode="MarkdownV2")
 
 @bot.message_handler(func=lambda message: True)
 def handle_input(message):
     """
     Обработка всех прочих сообщений (не /start, не /р).
     """
-    print(f"[DEBUG] handle_input вызван для chat_id={message.chat.id}")
-    print(f"[DEBUG] Содержание сообщения (lowercase) = {message.text.lower()!r}")
     user_input = message.text.strip().lower()
+    session = mix_sessions.get(message.chat.id)
+    log_event(log, logging.DEBUG, "handle_input", chat_id=message.chat.id, chars=len(user_input),
+              state=session.state if session is not None else None)
 
-    # Проверяем, находится ли пользователь в каком-то "режиме"
-    if message.chat.id in user_states:
-        state = user_states[message.chat.id]
-        print(f"[DEBUG] Текущее состояние: {state}")
-
+    # Проверяем, находится ли пользователь в режиме /р
+    if session is not None:
         # РЕЖИМ "/р": ВВОД НАЗВАНИЙ МАСЕЛ И ИХ КОЛИЧЕСТВА
-        if state == WAITING_NEXT_OIL:
-            print("[DEBUG] Пользователь вводит название следующего масла или * для завершения.")
+        if session.state == WAITING_NEXT_OIL:
             if user_input == "*":
-                print("[DEBUG] Получена команда завершения смеси.")
-                total_cost = int(drops_counts.get(message.chat.id, 0))
-                mix_info = "\n".join(drop_session_changes.get(message.chat.id, []))
-                bot.reply_to(
-                    message,
-                    escape_markdown(
-                        f"🎉 Смесь завершена\\!\n\n"
-                        f"🧪 *Состав смеси:*\n{mix_info}\n\n"
-                        f"💰 *Общая стоимость:* {total_cost}р\\."
-                    ),
-                    parse_mode="MarkdownV2"
-                )
-                print(f"[DEBUG] Смесь завершена для chat_id={message.chat.id}")
+                total_cost = int(session.total_cost)
+                mix_info = "\n".join(session.lines())
+                send_rendered(message, MIX_FINISHED.render(mix=mix_info, total=total_cost))
+                log_event(log, logging.DEBUG, "mix_finished", chat_id=message.chat.id, total_cost=total_cost)
                 show_bot_capabilities(message.chat.id)
-                drops_counts.pop(message.chat.id, None)
-                drop_session_changes.pop(message.chat.id, None)
-                user_states.pop(message.chat.id, None)
+                mix_sessions.delete(message.chat.id)
                 return
 
-            print(f"[DEBUG] Проверяем, есть ли масло '{user_input}' в таблице...")
-            if user_input.capitalize() not in df['Name'].values:
-                print("[DEBUG] Масло не найдено в таблице.")
-                bot.reply_to(
-                    message,
-                    escape_markdown(f'❌ Масло "{user_input}" не найдено\\.\nПопробуйте снова:'),
-                    parse_mode="MarkdownV2"
+            # Весь рецепт одним сообщением: «лаванда 5, лимон 3» — добавляем все масла сразу
+            if any(char.isdigit() for char in user_input):
+                quote = quote_recipe(message, user_input)
+                if quote is None:
+                    return
+                for oil_name, drop_count, price in quote.items:
+                    session.add(oil_name, drop_count, price)
+                mix_sessions.put(session)
+                summary = MIX_ADDED_RECIPE.render(
+                    count=len(quote.items),
+                    mix="; ".join(session.lines()),
+                    total=int(session.total_cost),
                 )
+                send_rendered(message, summary)
                 return
 
-            print("[DEBUG] Масло найдено. Запрашиваем количество капель.")
-            current_oils[message.chat.id] = user_input
-            user_states[message.chat.id] = WAITING_DROPS
-            bot.reply_to(
-                message,
-                escape_markdown(f"Введите количество капель для {user_input}\\:"),
-                parse_mode="MarkdownV2"
-            )
-            print(f"[DEBUG] Состояние для chat_id={message.chat.id} изменено на {WAITING_DROPS}")
+            with span("catalog.find"):
+                oil = catalog_refresher.catalog.find(user_input)
+            if oil is None:
+                log_event(log, logging.DEBUG, "oil_not_found", chat_id=message.chat.id)
+                bot.reply_to(message, MIX_OIL_NOT_FOUND.render(oil=user_input), parse_mode="MarkdownV2")
+                return
+
+            session.current_oil = oil.name
+            session.state = WAITING_DROPS
+            mix_sessions.put(session)
+            bot.reply_to(message, MIX_ASK_DROPS.render(oil=oil.name), parse_mode="MarkdownV2")
+            log_event(log, logging.DEBUG, "mix_state", chat_id=message.chat.id, state=WAITING_DROPS, oil=oil.name)
 
-        elif state == WAITING_DROPS:
-            print("[DEBUG] Пользователь вводит количество капель...")
+        elif session.state == WAITING_DROPS:
             if not user_input.replace(" ", "").isdigit():
-                print("[DEBUG] Пользователь ввёл не число.")
-                bot.reply_to(
-                    message,
-                    escape_markdown("❌ Введите корректное количество капель\\:"),
-                    parse_mode="MarkdownV2"
-                )
+                bot.reply_to(message, MIX_BAD_DROPS.render(), parse_mode="MarkdownV2")
                 return
 
             drop_count = int(user_input.replace(" ", ""))
-            oil_name = current_oils[message.chat.id].capitalize()
-            print(f"[DEBUG] Пользователь хочет добавить {drop_count} капель масла {oil_name}")
-
-            if oil_name in df["Name"].values:
-                oil_price = df.loc[df["Name"] == oil_name, "Price"].values[0]
-                oil_volume = df.loc[df["Name"] == oil_name, "Vol"].values[0]
-                drop_price = oil_price / (oil_volume * 25)
-                total_price = drop_price * drop_count
-                print(f"[DEBUG] Расчёт стоимости: drop_price={drop_price}, total_price={total_price}")
-            else:
-                total_price = 0
-                print("[DEBUG] Не найдено в таблице, total_price=0")
-
-            drops_counts[message.chat.id] = drops_counts.get(message.chat.id, 0) + total_price
-            drop_session_changes[message.chat.id] = drop_session_changes.get(message.chat.id, []) + [
-                f"{oil_name}, {drop_count} капель"
-            ]
-
-            summary = (
-                f"✅ Добавлено: *{oil_name}* — {drop_count} капель\\.\n"
-                f"Текущий состав смеси:\n{'; '.join(drop_session_changes[message.chat.id])}\n"
-                f"Общая стоимость: {int(drops_counts[message.chat.id])}р\\.\n\n"
-                "Введите название следующего масла или отправьте `*` для завершения\\."
+            oil_name = session.current_oil
+
+            with span("catalog.get"):
+                oil = catalog_refresher.catalog.get(oil_name)
+            total_price = oil.cost(drop_count) if oil is not None else 0
+            log_event(log, logging.DEBUG, "mix_add", chat_id=message.chat.id, oil=oil_name,
+                      drops=drop_count, price=total_price)
+
+            session.add(oil_name, drop_count, total_price)
+            session.current_oil = None
+            session.state = WAITING_NEXT_OIL
+            mix_sessions.put(session)
+
+            summary = MIX_ADDED.render(
+                oil=oil_name,
+                drops=drop_count,
+                mix="; ".join(session.lines()),
+                total=int(session.total_cost),
             )
-            print(f"[DEBUG] Отправляем сводку пользователю:\n{summary}")
-            bot.reply_to(message, escape_markdown(summary), parse_mode="MarkdownV2")
-            user_states[message.chat.id] = WAITING_NEXT_OIL
-            print(f"[DEBUG] Состояние для chat_id={message.chat.id} изменено обратно на {WAITING_NEXT_OIL}")
+            send_rendered(message, summary)
 
     else:
-        # ОБЫЧНЫЙ РЕЖИМ: ПЕРЕДАЁМ СООБЩЕНИЕ АССИСТЕНТУ (БЕЗ ЛОКАЛЬНОЙ БАЗЫ)
-        print("[DEBUG] Пользователь не в режиме /р, пересылаем сообщение ассистенту...")
-        assistant_reply = assistant_manager.ask_assistant(message.chat.id, message.text.strip())
-        print(f"[DEBUG] Ответ ассистента:\n{assistant_reply!r}")
+        # ОБЫЧНЫЙ РЕЖИМ: СНАЧАЛА ЛОКАЛЬНАЯ СПРАВКА, ПРИ НИЗКОЙ УВЕРЕННОСТИ — АССИСТЕНТ
+        knowledge_base = local_knowledge()
+        if knowledge_base is not None:
+            with span("knowledge.answer"):
+                local_reply = knowledge_base.answer(message.text)
+            if local_reply:
+                log_event(log, logging.DEBUG, "local_answer", chat_id=message.chat.id)
+                send_rendered(message, escape_markdown(local_reply))
+                return
 
-        bot.reply_to(message, escape_markdown(assistant_reply), parse_mode="MarkdownV2")
-        print(f"[DEBUG] Ответ ассистента отправлен chat_id={message.chat.id}")
+        if STREAM_REPLIES:
+            stream_assistant_reply(message)
+            return
+        try:
+            assistant_reply = assistant_manager.ask_assistant(message.chat.id, message.text.strip())
+        except RateLimited as e:
+            log_event(log, logging.INFO, "rate_limited", chat_id=message.chat.id, scope=e.scope)
+            bot.reply_to(message, RATE_LIMITED.render(seconds=retry_seconds(e)), parse_mode="MarkdownV2")
+            return
+        except RunFailedError as e:
+            log.warning("Ассистент не ответил: %s", e)
+            bot.reply_to(message, ASSISTANT_FAILED.render(), parse_mode="MarkdownV2")
+            return
+        except Exception:
+            log.exception("Ошибка ответа ассистента")
+            bot.reply_to(message, ASSISTANT_FAILED.render(), parse_mode="MarkdownV2")
+            return
+        send_rendered(message, escape_markdown(assistant_reply))
+        log_event(log, logging.DEBUG, "assistant_reply_sent", chat_id=message.chat.id, chars=len(assistant_reply))
+
+# === ДИСПЕТЧЕР ОБНОВЛЕНИЙ: параллельно между чатами, строго по порядку внутри чата ===
+DISPATCH_MAX_TOTAL = int(os.getenv("DISPATCH_MAX_TOTAL", "1000"))
+dispatcher = install_dispatcher(
+    bot,
+    workers=int(os.getenv("DISPATCH_WORKERS", "8")),
+    max_pending_per_chat=int(os.getenv("DISPATCH_MAX_PER_CHAT", "20")),
+    max_pending_total=DISPATCH_MAX_TOTAL,
+)
+
+# === МЕТРИКИ ===
+REGISTRY.gauge("aroma_dispatch_queue_depth", "Обновлений в очередях диспетчера", dispatcher.depth)
+REGISTRY.counter_func("aroma_dispatch_dropped_total", "Обновлений, отброшенных из-за переполнения", lambda: dispatcher.dropped)
+REGISTRY.gauge("aroma_runs_pending", "Run'ов ассистента в ожидании", assistant_manager.poller.pending)
+REGISTRY.gauge("aroma_threads_stored", "Тредов в хранилище", lambda: len(thread_store))
+REGISTRY.gauge("aroma_threads_delete_retry", "Тредов, ожидающих повторного удаления в OpenAI",
+               assistant_manager.sweeper.pending_retries)
+if not isinstance(mix_backend, RedisSessionStore):
+    # В Redis подсчёт — SCAN по всем ключам, слишком дорого на каждый опрос /metrics
+    REGISTRY.gauge("aroma_mix_sessions", "Незавершённых сессий /р", lambda: len(mix_sessions))
+REGISTRY.gauge("aroma_mix_sessions_unflushed", "Изменений сессий /р, ещё не записанных", mix_sessions.pending)
+REGISTRY.gauge("aroma_catalog_size", "Позиций в прайс-листе", lambda: len(catalog_refresher.catalog))
+REGISTRY.gauge("aroma_admission_in_flight", "Запросов к OpenAI в работе", lambda: admission.stats()["in_flight"])
+REGISTRY.gauge("aroma_admission_queued", "Запросов к OpenAI в очереди допуска", lambda: admission.stats()["queued"])
+REGISTRY.counter_func("aroma_admission_rejected_total", "Отказов по лимиту пользователя", lambda: admission.rejected)
+REGISTRY.counter_func("aroma_admission_throttled_total", "Ответов 429 от OpenAI", lambda: admission.throttled)
+if answer_cache is not None:
+    REGISTRY.counter_func("aroma_answer_cache_hits_total", "Попадания в кеш ответов",
+                          lambda: answer_cache.hits + answer_cache.similar_hits)
+    REGISTRY.counter_func("aroma_answer_cache_misses_total", "Промахи кеша ответов", lambda: answer_cache.misses)
+    REGISTRY.gauge("aroma_answer_cache_bytes", "Размер кеша ответов, байт", lambda: answer_cache.bytes)
+
+# === ПРОГРЕВ ===
+# Пока бот уже принимает обновления, фоновый поток загружает openai, обработку аудио
+# и NumPy, чтобы первый вопрос ассистенту или голосовое не ждали импорта.
+# WARM_UP=0 — только по первому обращению (меньше памяти и CPU на старте)
+if os.getenv("WARM_UP", "1") == "1":
+    warm_up(openai, audio, lazy_import("numpy"))
+
+# === РЕЖИМ РАБОТЫ: BOT_MODE=polling (по умолчанию) или webhook ===
+# Webhook: WEBHOOK_SECRET (обязателен), WEBHOOK_HOST / WEBHOOK_PORT / WEBHOOK_PATH — где слушать,
+# WEBHOOK_URL — публичный адрес для регистрации в Telegram (без него регистрация не выполняется).
+# /healthz и /readyz отдаются тем же сервером; /metrics — только если METRICS_PORT не задан
+# и WEBHOOK_HOST — локальный адрес (иначе метрики оказались бы на публичном порту).
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+def run_webhook():
+    secret = os.getenv("WEBHOOK_SECRET")
+    host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    server = WebhookServer(
+        dispatcher,
+        secret,
+        host=host,
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        ready=lambda: dispatcher.depth() < DISPATCH_MAX_TOTAL,
+        serve_metrics=not os.getenv("METRICS_PORT") and is_loopback(host),
+    )
+    if os.getenv("WEBHOOK_URL"):
+        # Регистрация — сетевой запрос к Telegram; сервер начинает слушать, не дожидаясь его
+        background(install_webhook, bot, os.getenv("WEBHOOK_URL"), secret,
+                   max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")), name="set-webhook")
+    server.run()
 
 if __name__ == "__main__":
-    print("[DEBUG] Бот запущен, ожидаем сообщений...")
-    bot.infinity_polling()
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+    log.info("Бот запущен (%s), ожидаем сообщений...", BOT_MODE)
+    try:
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            bot.infinity_polling()
+    finally:
+        # Дописываем сессии /р, которые ещё не ушли в хранилище
+        mix_sessions.stop()
@@ -0,0 +1,188 @@
+# catalog.py
+
+import math
+import re
+
+# Капель в миллилитре: цена капли = Price / (Vol * 25)
+DROPS_PER_ML = 25
+
+# Окончания, которые отрезаем, чтобы «лаванды», «лавандой», «лаванду» сводились к «лаванд».
+# Отсортированы по убыванию длины, чтобы сначала срабатывали самые длинные.
+_RU_ENDINGS = sorted([
+    "ого", "его", "ому", "ему", "ыми", "ими", "ами", "ями", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ую", "юю", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ы", "и", "а", "я",
+    "у", "ю", "е", "о", "ь",
+], key=len, reverse=True)
+
+_NON_WORD = re.compile(r"[^\w\s-]+")
+_SPACES = re.compile(r"[\s-]+")
+
+
+def normalize_name(text: str) -> str:
+    """
+    Приводит название масла к каноническому виду: нижний регистр, ё -> е,
+    без знаков препинания, одиночные пробелы.
+    """
+    text = _NON_WORD.sub(" ", str(text).lower().replace("ё", "е"))
+    return _SPACES.sub(" ", text).strip()
+
+
+def stem_word(word: str) -> str:
+    """
+    Грубый стеммер для русских слов: отрезает одно окончание, оставляя не меньше 3 букв.
+    """
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def stem_name(text: str) -> str:
+    return " ".join(stem_word(word) for word in normalize_name(text).split())
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Расстояние Дамерау-Левенштейна (вставка, удаление, замена, перестановка соседних букв).
+    """
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class OilEntry:
+    """
+    Строка прайс-листа: название, объём флакона (мл), цена флакона и цена одной капли.
+    """
+    __slots__ = ("name", "volume", "price", "drop_price")
+
+    def __init__(self, name, volume, price):
+        self.name = name
+        self.volume = volume
+        self.price = price
+        self.drop_price = price / (volume * DROPS_PER_ML)
+
+    def cost(self, drops: int) -> float:
+        return self.drop_price * drops
+
+    def __repr__(self):
+        return f"OilEntry({self.name!r}, volume={self.volume}, price={self.price})"
+
+
+class OilCatalog:
+    """
+    Компактный справочник масел для режима /р.
+
+    При построении заранее считаются:
+    - хеш-индекс по нормализованному названию (точный поиск за O(1));
+    - хеш-индекс по «основам» слов (падежные формы: «лаванды» -> «лаванда»);
+    - триграммный индекс для опечаток: кандидаты отбираются по общим триграммам,
+      лучший выбирается по коэффициенту Дайса, поиск стоит O(k) от числа кандидатов.
+      Если сходство по триграммам слабое (перестановка букв в коротком слове),
+      для max_candidates лучших кандидатов считается расстояние редактирования.
+    """
+    def __init__(self, entries=(), min_similarity=0.5, max_candidates=5):
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates
+        self.entries = []
+        self._by_name = {}
+        self._by_stem = {}
+        self._trigrams = {}       # триграмма -> список индексов в entries
+        self._entry_trigrams = []
+        for entry in entries:
+            self._add(entry)
+
+    @classmethod
+    def from_rows(cls, rows, **kwargs):
+        """
+        Строит справочник из строк (Name, Vol, Price). Строки с нечисловым
+        или нулевым объёмом/ценой (например, заголовок таблицы) пропускаются.
+        """
+        entries = []
+        for row in rows:
+            try:
+                name, volume, price = row[0], float(row[1]), float(row[2])
+            except (TypeError, ValueError, IndexError):
+                continue
+            if not str(name).strip() or not volume or math.isnan(volume) or math.isnan(price):
+                continue
+            entries.append(OilEntry(str(name).strip(), volume, price))
+        return cls(entries, **kwargs)
+
+    def _add(self, entry):
+        key = normalize_name(entry.name)
+        if not key or key in self._by_name:
+            return
+        index = len(self.entries)
+        self.entries.append(entry)
+        self._by_name[key] = entry
+        self._by_stem.setdefault(stem_name(entry.name), entry)
+        grams = trigrams(stem_name(entry.name))
+        self._entry_trigrams.append(grams)
+        for gram in grams:
+            self._trigrams.setdefault(gram, []).append(index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def get(self, name):
+        """
+        Точный поиск по нормализованному названию (регистр и ё не важны).
+        """
+        return self._by_name.get(normalize_name(name))
+
+    def find(self, name):
+        """
+        Ищет масло: точное совпадение, затем падежная форма, затем ближайшее по триграммам.
+        Возвращает OilEntry или None, если похожих названий нет.
+        """
+        entry = self.get(name)
+        if entry is not None:
+            return entry
+        stemmed = stem_name(name)
+        if not stemmed:
+            return None
+        entry = self._by_stem.get(stemmed)
+        if entry is not None:
+            return entry
+
+        query = trigrams(stemmed)
+        overlap = {}
+        for gram in query:
+            for index in self._trigrams.get(gram, ()):
+                overlap[index] = overlap.get(index, 0) + 1
+        best, best_score = None, self.min_similarity
+        for index, common in overlap.items():
+            score = 2 * common / (len(query) + len(self._entry_trigrams[index]))
+            if score > best_score:
+                best, best_score = self.entries[index], score
+        if best is not None:
+            return best
+
+        # Запасной путь: опечатки, которые рвут почти все триграммы
+        candidates = sorted(overlap, key=overlap.get, reverse=True)[:self.max_candidates]
+        max_distance = max(1, len(stemmed) // 3)
+        best_distance = max_distance + 1
+        for index in candidates:
+            distance = edit_distance(stemmed, stem_name(self.entries[index].name))
+            if distance < best_distance:
+                best, best_distance = self.entries[index], distance
+        return best
@@ -0,0 +1,169 @@
+# catalog_refresher.py
+
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+
+from catalog import OilCatalog
+
+log = logging.getLogger("aroma_bot.catalog_refresher")
+
+
+class CatalogRefresher:
+    """
+    Держит актуальный OilCatalog, скачивая прайс-лист (CSV из Google Sheets) в фоне.
+
+    - При старте справочник поднимается из последнего удачного снимка на диске,
+      сеть для этого не нужна.
+    - Фоновый поток раз в interval секунд делает условный GET (If-None-Match /
+      If-Modified-Since): если таблица не менялась, сервер отвечает 304 и ничего не парсится.
+    - Новый справочник строится целиком и подменяется одной операцией присваивания,
+      поэтому обработчики всегда видят либо старую, либо новую версию, но не смесь.
+    - Если загрузка упала или таблица пришла пустой, остаётся предыдущая версия.
+    """
+    def __init__(self, url, snapshot_path=None, interval=300.0, timeout=10.0):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.timeout = timeout
+
+        self.catalog = OilCatalog()
+        self.etag = None
+        self.last_modified = None
+        self.version = 0
+        self.last_error = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Снимок на диске ---
+
+    @property
+    def _meta_path(self):
+        return self.snapshot_path + ".json"
+
+    def load_snapshot(self) -> bool:
+        """
+        Загружает справочник из снимка. Возвращает True, если снимок нашёлся и не пустой.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                catalog = parse_catalog_csv(f.read())
+            meta = {}
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Не удалось прочитать снимок прайса %s: %s", self.snapshot_path, e)
+            return False
+        if not len(catalog):
+            return False
+        self.etag = meta.get("etag")
+        self.last_modified = meta.get("last_modified")
+        self._swap(catalog)
+        log.info("Справочник загружен из снимка: %d позиций", len(catalog))
+        return True
+
+    def _save_snapshot(self, data: bytes):
+        if not self.snapshot_path:
+            return
+        try:
+            # Пишем во временный файл и подменяем атомарно, чтобы не оставить обрезанный снимок
+            _write_atomic(self.snapshot_path, data)
+            meta = {"etag": self.etag, "last_modified": self.last_modified}
+            _write_atomic(self._meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            log.warning("Не удалось сохранить снимок прайса: %s", e)
+
+    # --- Загрузка из сети ---
+
+    def refresh(self) -> bool:
+        """
+        Один условный запрос к таблице. Возвращает True, если справочник обновился.
+        Любая ошибка оставляет текущую версию справочника нетронутой.
+        """
+        request = urllib.request.Request(self.url)
+        if self.etag:
+            request.add_header("If-None-Match", self.etag)
+        if self.last_modified:
+            request.add_header("If-Modified-Since", self.last_modified)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+            catalog = parse_catalog_csv(data)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self.last_error = None
+                return False
+            self.last_error = e
+            log.warning("Ошибка загрузки прайса: HTTP %s", e.code)
+            return False
+        except Exception as e:
+            self.last_error = e
+            log.warning("Ошибка загрузки прайса: %s", e)
+            return False
+
+        if not len(catalog):
+            self.last_error = ValueError("прайс пуст")
+            log.warning("Прайс пришёл пустым, оставляем предыдущую версию")
+            return False
+
+        self.etag = etag
+        self.last_modified = last_modified
+        self.last_error = None
+        self._swap(catalog)
+        self._save_snapshot(data)
+        log.info("Прайс обновлён: %d позиций, версия %d", len(catalog), self.version)
+        return True
+
+    def _swap(self, catalog):
+        self.catalog = catalog
+        self.version += 1
+
+    # --- Фоновый поток ---
+
+    def start(self):
+        """
+        Запускает фоновое обновление; первый запрос уходит сразу.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="catalog-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+
+def parse_catalog_csv(data: bytes) -> OilCatalog:
+    """
+    Разбирает CSV прайс-листа (колонки Name, Vol, Price без заголовка) в OilCatalog.
+    """
+    text = data.decode("utf-8-sig")
+    return OilCatalog.from_rows(csv.reader(io.StringIO(text)))
+
+
+def _write_atomic(path, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,200 @@
+# dispatcher.py
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import HANDLER_SECONDS, QUEUE_WAIT_SECONDS
+
+log = logging.getLogger("aroma_bot.dispatcher")
+
+
+class ChatDispatcher:
+    """
+    Раздаёт обновления Telegram пулу воркеров, сохраняя строгий порядок FIFO внутри
+    одного чата: у чата в каждый момент времени обрабатывается не больше одного обновления,
+    поэтому машина состояний /р (user_states) видит сообщения в том порядке, в котором
+    их прислал пользователь. Разные чаты обрабатываются параллельно.
+
+    Backpressure:
+    - если у одного чата в очереди уже max_pending_per_chat обновлений, новые отбрасываются;
+    - если всего в очередях max_pending_total обновлений, submit() блокирует поток
+      long polling, пока воркеры не разгребут очередь.
+    """
+    def __init__(self, handler, workers=8, max_pending_per_chat=20, max_pending_total=1000):
+        self.handler = handler
+        self.max_pending_per_chat = max_pending_per_chat
+        self.max_pending_total = max_pending_total
+
+        self._queues = {}      # chat_key -> deque[(время постановки, обновление)]
+        self._active = set()   # чаты, у которых обновление сейчас в работе или в пуле
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch")
+
+        # Счётчики
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.queue_wait_total = 0.0
+        self.handler_stats = {}  # имя обработчика -> [количество, суммарное время, максимум]
+
+    def submit(self, chat_key, update) -> bool:
+        """
+        Ставит обновление в очередь чата. Возвращает False, если обновление отброшено.
+        """
+        with self._cond:
+            queue = self._queues.get(chat_key)
+            if queue is not None and len(queue) >= self.max_pending_per_chat:
+                self.dropped += 1
+                log.warning("Чат %s переполнил очередь, обновление отброшено", chat_key)
+                return False
+            while self._pending >= self.max_pending_total:
+                self._cond.wait()
+            if queue is None:
+                queue = self._queues[chat_key] = deque()
+            queue.append((time.monotonic(), update))
+            self._pending += 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._pending)
+            if chat_key not in self._active:
+                self._active.add(chat_key)
+                self._pool.submit(self._run_next, chat_key)
+        return True
+
+    def _run_next(self, chat_key):
+        with self._cond:
+            enqueued_at, update = self._queues[chat_key].popleft()
+            waited = time.monotonic() - enqueued_at
+            self.queue_wait_total += waited
+        QUEUE_WAIT_SECONDS.observe(waited)
+        ok = True
+        try:
+            self.handler(update)
+        except Exception:
+            ok = False
+            log.exception("Ошибка обработки обновления чата %s", chat_key)
+        with self._cond:
+            self._pending -= 1
+            self.processed += 1
+            self.failed += not ok
+            self._cond.notify_all()
+            if self._queues[chat_key]:
+                # Следующее обновление этого чата встаёт в конец очереди пула,
+                # чтобы болтливый чат не занимал воркер в ущерб остальным
+                self._pool.submit(self._run_next, chat_key)
+            else:
+                del self._queues[chat_key]
+                self._active.discard(chat_key)
+
+    def record_handler(self, name, elapsed):
+        """
+        Учитывает время работы конкретного обработчика (см. instrument_handlers).
+        """
+        HANDLER_SECONDS.observe(elapsed, handler=name)
+        with self._cond:
+            stats = self.handler_stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    def depth(self) -> int:
+        """
+        Сколько обновлений сейчас ждут обработки или обрабатываются.
+        """
+        with self._cond:
+            return self._pending
+
+    def stats(self) -> dict:
+        """
+        Снимок счётчиков: глубина очереди, отброшенные обновления, задержки обработчиков.
+        """
+        with self._cond:
+            return {
+                "depth": self._pending,
+                "active_chats": len(self._active),
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "avg_queue_wait": self.queue_wait_total / self.processed if self.processed else 0.0,
+                "handlers": {
+                    name: {"count": count, "avg": total / count, "max": peak}
+                    for name, (count, total, peak) in self.handler_stats.items()
+                },
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Дожидается обработки всех поставленных обновлений и останавливает пул.
+        """
+        if wait:
+            with self._cond:
+                while self._pending:
+                    self._cond.wait()
+        self._pool.shutdown(wait=wait)
+
+
+def chat_key_of(update):
+    """
+    Ключ упорядочивания для обновления: id чата, иначе id пользователя, иначе update_id.
+    """
+    for attr in ("message", "edited_message", "channel_post", "edited_channel_post", "callback_query"):
+        obj = getattr(update, attr, None)
+        if obj is None:
+            continue
+        chat = getattr(obj, "chat", None) or getattr(getattr(obj, "message", None), "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(obj, "from_user", None)
+        if user is not None:
+            return user.id
+    return ("update", update.update_id)
+
+
+def instrument_handlers(bot, dispatcher):
+    """
+    Оборачивает зарегистрированные message-обработчики бота замером времени.
+    """
+    for handler in bot.message_handlers:
+        func = handler["function"]
+        if getattr(func, "_dispatch_instrumented", False):
+            continue
+
+        def timed(message, _func=func, **kwargs):
+            started = time.monotonic()
+            try:
+                return _func(message, **kwargs)
+            finally:
+                dispatcher.record_handler(_func.__name__, time.monotonic() - started)
+
+        timed._dispatch_instrumented = True
+        timed.__name__ = func.__name__
+        handler["function"] = timed
+
+
+def install_dispatcher(bot, dispatcher=None, **kwargs):
+    """
+    Подключает ChatDispatcher к telebot.TeleBot (созданному с threaded=False):
+    process_new_updates больше не обрабатывает обновления сам, а раскладывает их
+    по очередям чатов. last_update_id сдвигается сразу, чтобы long polling
+    не получил те же обновления повторно.
+    """
+    process_updates = bot.process_new_updates
+    if dispatcher is None:
+        dispatcher = ChatDispatcher(lambda update: process_updates([update]), **kwargs)
+
+    def dispatch_updates(updates):
+        for update in updates:
+            if update.update_id > bot.last_update_id:
+                bot.last_update_id = update.update_id
+            dispatcher.submit(chat_key_of(update), update)
+
+    bot.process_new_updates = dispatch_updates
+    instrument_handlers(bot, dispatcher)
+    return dispatcher
@@ -0,0 +1,113 @@
+# lazy.py
+
+import importlib
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+log = logging.getLogger("aroma_bot.lazy")
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к атрибуту (или в load()).
+
+    Нужен для тяжёлых зависимостей (openai грузится почти секунду), которые не требуются,
+    чтобы бот начал отвечать. Присваивания до загрузки (openai.api_key = ...) запоминаются
+    и применяются к модулю сразу после импорта. Загрузка под блокировкой, поэтому
+    фоновый прогрев и обработчик, первым обратившийся к модулю, не мешают друг другу.
+    """
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_pending", {})
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    for attr, value in self._pending.items():
+                        setattr(module, attr, value)
+                    self._pending.clear()
+                    object.__setattr__(self, "_module", module)
+                    log.debug("Модуль %s загружен за %.0f мс", self._name, (time.perf_counter() - started) * 1000)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        # Модуль уже импортирован кем-то другим — присваиваем сразу, сохраняя порядок присваиваний
+        if self._module is None and self._name not in sys.modules:
+            with self._lock:
+                if self._module is None:
+                    self._pending[attr] = value
+                    return
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        state = "загружен" if self.loaded else "не загружен"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def lazy_import(name) -> LazyModule:
+    """
+    Ленивый модуль name. Один объект на имя, поэтому отложенные присваивания
+    из разных модулей бота попадают в один и тот же модуль.
+    """
+    with _modules_lock:
+        module = _modules.get(name)
+        if module is None:
+            module = _modules[name] = LazyModule(name)
+        return module
+
+
+def background(func, *args, name=None, **kwargs) -> Future:
+    """
+    Выполняет func(*args, **kwargs) в фоновом daemon-потоке; результат или исключение — в Future.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            log.exception("Фоновая задача %s завершилась ошибкой", name or func)
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name or "background", daemon=True).start()
+    return future
+
+
+def warm_up(*modules, name="warm-up") -> Future:
+    """
+    Загружает модули в фоне: LazyModule или имена обычных модулей.
+    Возвращает Future, завершающийся, когда всё загружено.
+    """
+    def load_all():
+        started = time.perf_counter()
+        for module in modules:
+            if isinstance(module, LazyModule):
+                module.load()
+            else:
+                importlib.import_module(module)
+        log.info("Прогрев модулей завершён за %.0f мс", (time.perf_counter() - started) * 1000)
+
+    return background(load_all, name=name)
@@ -0,0 +1,269 @@
+# metrics.py
+
+import atexit
+import bisect
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("aroma_bot")
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_listener = None
+
+
+class _KeyValueFormatter(logging.Formatter):
+    """
+    Одна строка на событие: время, уровень, логгер, событие и поля key=value.
+    """
+    def format(self, record):
+        fields = getattr(record, "fields", None)
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level=None):
+    """
+    Настраивает логирование бота: уровень из LOG_LEVEL (по умолчанию WARNING).
+    Запись в stderr идёт из отдельного потока через очередь (QueueHandler / QueueListener),
+    поэтому обработчики не блокируются на выводе.
+    """
+    global _listener
+    level = level or os.getenv("LOG_LEVEL", "WARNING")
+    root = logging.getLogger("aroma_bot")
+    root.setLevel(level)
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(_KeyValueFormatter())
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Структурированное событие. Если уровень выключен, поля даже не форматируются.
+    Текст пользователей в поля не кладём — только длины и идентификаторы.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+# --- Метрики ---
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Значение снимается функцией в момент запроса /metrics.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help = help_text
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+class CounterFunc(Gauge):
+    """
+    Счётчик, который ведёт сам объект (dispatcher.dropped, admission.rejected):
+    значение снимается функцией, как у Gauge, но экспортируется с типом counter.
+    """
+    kind = "counter"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # ключ меток -> [счётчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, func):
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, func)
+
+    def counter_func(self, name, help_text, func):
+        with self._lock:
+            self._metrics[name] = CounterFunc(name, help_text, func)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Общие метрики бота
+SPAN_SECONDS = REGISTRY.histogram("aroma_span_seconds", "Длительность операций (Telegram, Whisper, ассистент, справочник)")
+HANDLER_SECONDS = REGISTRY.histogram("aroma_handler_seconds", "Время работы обработчиков сообщений")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("aroma_queue_wait_seconds", "Ожидание обновления в очереди диспетчера")
+RUN_POLL_ITERATIONS = REGISTRY.histogram(
+    "aroma_run_poll_iterations", "Число запросов runs.retrieve на один run", buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+ERRORS = REGISTRY.counter("aroma_errors_total", "Ошибки по местам возникновения")
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Замер длительности блока: значение попадает в aroma_span_seconds{span=name},
+    а на уровне DEBUG ещё и в лог. Исключения считаются в aroma_errors_total.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(where=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.observe(elapsed, span=name, **labels)
+        log_event(log, logging.DEBUG, "span", span=name, seconds=round(elapsed, 4), **labels)
+
+
+def instrument_methods(obj, prefix, names):
+    """
+    Оборачивает методы объекта (например, сетевые методы telebot.TeleBot) в span().
+    """
+    for name in names:
+        method = getattr(obj, name)
+
+        def timed(*args, _method=method, _span=f"{prefix}.{name}", **kwargs):
+            with span(_span):
+                return _method(*args, **kwargs)
+
+        setattr(obj, name, timed)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Поднимает локальный эндпоинт /metrics в формате Prometheus в фоновом потоке.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
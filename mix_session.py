@@ -0,0 +1,361 @@
+# mix_session.py
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("aroma_bot.mix_session")
+
+# Состояния диалога режима /р
+WAITING_NEXT_OIL = "waiting_for_next_oil"
+WAITING_DROPS = "waiting_for_drop_quantity"
+
+
+class MixSession:
+    """
+    Состояние одного расчёта смеси /р: шаг диалога, масло, для которого ждём капли,
+    и состав смеси — список (масло, капли, стоимость).
+    """
+    __slots__ = ("user_id", "state", "current_oil", "entries", "total_cost", "updated_at")
+
+    def __init__(self, user_id, state=WAITING_NEXT_OIL, current_oil=None, entries=None,
+                 total_cost=0.0, updated_at=0.0):
+        self.user_id = user_id
+        self.state = state
+        self.current_oil = current_oil
+        self.entries = entries if entries is not None else []
+        self.total_cost = total_cost
+        self.updated_at = updated_at
+
+    def add(self, oil, drops, cost):
+        self.entries.append((oil, drops, cost))
+        self.total_cost += cost
+
+    def lines(self):
+        """
+        Состав смеси для показа пользователю: ["Лаванда, 5 капель", ...].
+        """
+        return [f"{oil}, {drops} капель" for oil, drops, _ in self.entries]
+
+    def dumps(self) -> str:
+        return json.dumps(
+            [self.state, self.current_oil, self.entries, self.total_cost],
+            ensure_ascii=False, separators=(",", ":")
+        )
+
+    @classmethod
+    def loads(cls, user_id, data, updated_at=0.0):
+        state, current_oil, entries, total_cost = json.loads(data)
+        return cls(user_id, state, current_oil, [tuple(entry) for entry in entries], total_cost, updated_at)
+
+    def __repr__(self):
+        return f"MixSession({self.user_id!r}, {self.state!r}, {len(self.entries)} масел, {self.total_cost:.2f})"
+
+
+class SessionStore:
+    """
+    Интерфейс хранилища сессий /р: user_id -> MixSession.
+    shared — хранилище видят другие процессы или реплики бота.
+    """
+    shared = False
+
+    def get(self, user_id):
+        """
+        Возвращает MixSession или None.
+        """
+        raise NotImplementedError
+
+    def put_many(self, sessions):
+        raise NotImplementedError
+
+    def delete_many(self, user_ids):
+        raise NotImplementedError
+
+    def evict_idle(self, older_than) -> int:
+        """
+        Удаляет сессии, не менявшиеся с момента older_than. Возвращает их количество.
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def put(self, session):
+        self.put_many([session])
+
+    def delete(self, user_id):
+        self.delete_many([user_id])
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Сессии в памяти процесса: теряются при перезапуске, не видны другим процессам.
+    """
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._items.get(user_id)
+
+    def put_many(self, sessions):
+        with self._lock:
+            for session in sessions:
+                self._items[session.user_id] = session
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._items.pop(user_id, None)
+
+    def evict_idle(self, older_than):
+        with self._lock:
+            idle = [user_id for user_id, session in self._items.items() if session.updated_at < older_than]
+            for user_id in idle:
+                del self._items[user_id]
+        return len(idle)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Сессии в SQLite: переживают перезапуск, несколько процессов бота на одной машине
+    работают с одним файлом (режим WAL).
+    """
+    shared = True
+
+    def __init__(self, path="mix_sessions.sqlite3"):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mix_sessions ("
+                " user_id INTEGER PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS mix_sessions_updated_at ON mix_sessions (updated_at)"
+            )
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM mix_sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return MixSession.loads(user_id, row[0], row[1]) if row else None
+
+    def put_many(self, sessions):
+        rows = [(session.user_id, session.dumps(), session.updated_at) for session in sessions]
+        with self._lock:
+            # Одна транзакция на пачку — один fsync вместо одного на каждую сессию
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO mix_sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+                    "updated_at = excluded.updated_at",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM mix_sessions WHERE user_id = ?", [(user_id,) for user_id in user_ids]
+            )
+
+    def evict_idle(self, older_than):
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM mix_sessions WHERE updated_at < ?", (older_than,)
+            ).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM mix_sessions").fetchone()[0]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Сессии в Redis (или совместимом сервере): общие для реплик бота на разных машинах.
+    client — redis.Redis или любой клиент с тем же интерфейсом (get / pipeline / delete / scan_iter).
+    Простой сессий отслеживает сам Redis: ключ живёт ttl секунд с последнего изменения.
+    """
+    shared = True
+
+    def __init__(self, client, prefix="aroma:mix:", ttl=3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f"{self.prefix}{user_id}"
+
+    def get(self, user_id):
+        data = self.client.get(self._key(user_id))
+        if data is None:
+            return None
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return MixSession.loads(user_id, data, time.time())
+
+    def put_many(self, sessions):
+        pipe = self.client.pipeline()
+        for session in sessions:
+            pipe.set(self._key(session.user_id), session.dumps(), ex=int(self.ttl))
+        pipe.execute()
+
+    def delete_many(self, user_ids):
+        keys = [self._key(user_id) for user_id in user_ids]
+        if keys:
+            self.client.delete(*keys)
+
+    def evict_idle(self, older_than):
+        return 0
+
+    def __len__(self):
+        # Полный SCAN по ключам — только для отладки, не для метрик на каждый опрос
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*"))
+
+
+class WriteBehindSessionStore(SessionStore):
+    """
+    Отложенная запись поверх любого хранилища (backend).
+
+    put/delete только отмечают сессию изменённой — обработчик не ждёт диска или сети.
+    Фоновый поток раз в flush_interval секунд пишет накопленные изменения одной пачкой
+    и удаляет сессии, простаивавшие дольше idle_timeout. Пока изменение не записано,
+    get отдаёт его из памяти (в том числе пока идёт запись пачки, в которую оно попало);
+    иначе сессия читается из backend, поэтому после перезапуска продолжается та же смесь.
+    stop() записывает всё, что осталось.
+
+    Общее хранилище (backend.shared: SQLite-файл нескольких процессов, Redis) пишется
+    сразу (write_through): каждое изменение сессии /р — переход диалога, и следующее
+    сообщение пользователя может прийти на другую реплику. С отложенной записью она
+    прочитала бы устаревшую сессию, а её запись затёрла бы ещё не записанную чужую.
+    """
+    def __init__(self, backend, flush_interval=1.0, idle_timeout=3600.0, clock=time.time, write_through=None):
+        self.backend = backend
+        self.write_through = backend.shared if write_through is None else write_through
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.evicted = 0
+        self._dirty = {}      # user_id -> MixSession (или None — удалить)
+        self._in_flight = {}  # пачка, которую flush() пишет прямо сейчас (тот же формат)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, user_id):
+        with self._lock:
+            if user_id in self._dirty:
+                return self._dirty[user_id]
+            # Пока пачка пишется, в backend ещё старая версия (или ничего)
+            if user_id in self._in_flight:
+                return self._in_flight[user_id]
+        session = self.backend.get(user_id)
+        if session is not None and session.updated_at < self.clock() - self.idle_timeout:
+            return None
+        return session
+
+    def put_many(self, sessions):
+        now = self.clock()
+        for session in sessions:
+            session.updated_at = now
+        if self.write_through:
+            self.backend.put_many(sessions)
+            return
+        with self._lock:
+            for session in sessions:
+                self._dirty[session.user_id] = session
+
+    def delete_many(self, user_ids):
+        if self.write_through:
+            self.backend.delete_many(user_ids)
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._dirty[user_id] = None
+
+    def evict_idle(self, older_than):
+        return self.backend.evict_idle(older_than)
+
+    def __len__(self):
+        return len(self.backend)
+
+    def pending(self) -> int:
+        """
+        Сколько изменений ждёт записи.
+        """
+        with self._lock:
+            return len(self._dirty.keys() | self._in_flight.keys())
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные изменения. Возвращает их количество.
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._in_flight = dirty
+            if not dirty:
+                return 0
+            sessions = [session for session in dirty.values() if session is not None]
+            deleted = [user_id for user_id, session in dirty.items() if session is None]
+            try:
+                if sessions:
+                    self.backend.put_many(sessions)
+                if deleted:
+                    self.backend.delete_many(deleted)
+            except Exception:
+                # Возвращаем изменения в очередь, если поверх них не пришли более свежие
+                with self._lock:
+                    for user_id, session in dirty.items():
+                        self._dirty.setdefault(user_id, session)
+                    self._in_flight = {}
+                raise
+            # Пачка записана — теперь get() может читать её из backend
+            with self._lock:
+                self._in_flight = {}
+            return len(dirty)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="mix-session-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _loop(self):
+        next_eviction = self.clock() + self.flush_interval
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self.clock() >= next_eviction:
+                    evicted = self.evict_idle(self.clock() - self.idle_timeout)
+                    self.evicted += evicted
+                    if evicted:
+                        log.info("Удалено простаивающих сессий /р: %d", evicted)
+                    next_eviction = self.clock() + max(self.flush_interval, self.idle_timeout / 10)
+            except Exception:
+                log.exception("Ошибка записи сессий /р")
@@ -1,67 +1,268 @@
 import os
+import logging
+import threading
+import time
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError
 from dotenv import load_dotenv
 
 # Загрузка параметров подключения из .env файла
 load_dotenv()
 
-def get_connection():
+log = logging.getLogger("aroma_bot.mysql")
+
+# Пул соединений создаётся лениво при первом запросе (размер — MYSQL_POOL_SIZE)
+_pool = None
+_pool_lock = threading.Lock()
+
+# Статистика по запросам: текст запроса -> [количество, суммарное время, максимум]
+query_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _connection_params():
+    return dict(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        port=os.getenv("MYSQL_PORT", "3306"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=os.getenv("MYSQL_DB", "test")
+    )
+
+
+def get_pool():
+    """
+    Возвращает общий пул соединений, создавая его при первом обращении.
+    Размер пула задаётся переменной MYSQL_POOL_SIZE (по умолчанию 5).
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name="aroma_bot",
+                    pool_size=int(os.getenv("MYSQL_POOL_SIZE", "5")),
+                    pool_reset_session=True,
+                    **_connection_params()
+                )
+    return _pool
+
+
+def get_connection(timeout=None):
     """
-    Устанавливает соединение с MySQL, используя параметры из переменных окружения.
-    Переменные: MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB.
+    Берёт соединение из пула и проверяет, что оно живое (ping с переподключением).
+    Переменные: MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_POOL_SIZE.
+    close() у полученного соединения возвращает его в пул, а не рвёт TCP.
+    Если все соединения пула заняты, ждёт освобождения не дольше timeout секунд
+    (по умолчанию MYSQL_POOL_TIMEOUT, 10 с), после чего возвращает None.
     """
+    if timeout is None:
+        timeout = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST", "localhost"),
-            port=os.getenv("MYSQL_PORT", "3306"),
-            user=os.getenv("MYSQL_USER", "root"),
-            password=os.getenv("MYSQL_PASSWORD", ""),
-            database=os.getenv("MYSQL_DB", "test")
-        )
+        pool = get_pool()
+    except Error as e:
+        log.error("Ошибка подключения к MySQL: %s", e)
+        return None
+
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            connection = pool.get_connection()
+            break
+        except PoolError as e:
+            # MySQLConnectionPool не ждёт сам: при исчерпанном пуле сразу PoolError
+            left = deadline - time.monotonic()
+            if left <= 0:
+                log.error("Нет свободного соединения в пуле MySQL за %.1f с: %s", timeout, e)
+                return None
+            time.sleep(min(delay, left))
+            delay = min(delay * 2, 0.2)
+        except Error as e:
+            log.error("Ошибка подключения к MySQL: %s", e)
+            return None
+
+    try:
+        connection.ping(reconnect=True, attempts=2, delay=0)
         if connection.is_connected():
             return connection
     except Error as e:
-        print(f"Ошибка подключения к MySQL: {e}")
-        return None
+        log.error("Ошибка подключения к MySQL: %s", e)
+    # Соединение не годится — возвращаем его в пул, иначе слот пула потерян навсегда
+    try:
+        connection.close()
+    except Error:
+        pass
+    return None
+
+
+def _record_timing(query, elapsed):
+    key = " ".join(query.split())[:200]
+    with _stats_lock:
+        stats = query_stats.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+
+class PartialWriteError(Exception):
+    """
+    execute_many записал часть пачек, а очередная пачка не прошла.
+    committed — сколько строк уже зафиксировано (эти пачки не откатываются).
+    """
+    def __init__(self, committed):
+        self.committed = committed
+        super().__init__(f"пакетная запись прервана, зафиксировано строк: {committed}")
+
 
-def execute_query(query, params=None):
+def _with_retries(run, query, retries, commit=False):
+    """
+    Выполняет run(connection) на соединении из пула, при commit=True затем фиксирует транзакцию.
+    При обрыве соединения (OperationalError / InterfaceError) до commit() повторяет попытку
+    до retries раз: незафиксированная транзакция на сервере откатывается, повтор безопасен.
+    Обрыв во время commit() не повторяется — сервер мог уже зафиксировать изменения,
+    и повтор записал бы их второй раз.
+    """
+    for attempt in range(retries + 1):
+        connection = get_connection()
+        if not connection:
+            return None
+        started = time.perf_counter()
+        committing = False
+        try:
+            result = run(connection)
+            if commit:
+                committing = True
+                connection.commit()
+            return result
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError) as e:
+            if committing:
+                log.error("Обрыв соединения во время commit, результат неизвестен: %s", e)
+                return None
+            log.warning("Ошибка соединения при выполнении запроса (попытка %d): %s", attempt + 1, e)
+            if attempt == retries:
+                return None
+            time.sleep(0.1 * (attempt + 1))
+        except Error as e:
+            log.error("Ошибка выполнения запроса: %s", e)
+            return None
+        finally:
+            _record_timing(query, time.perf_counter() - started)
+            connection.close()
+    return None
+
+
+def execute_query(query, params=None, retries=2):
     """
     Выполняет запрос на изменение данных (INSERT, UPDATE, DELETE).
     Возвращает идентификатор последней вставленной записи (для INSERT) или None.
     """
-    connection = get_connection()
-    if connection:
+    def run(connection):
+        cursor = connection.cursor()
         try:
-            cursor = connection.cursor()
             cursor.execute(query, params)
-            connection.commit()
             return cursor.lastrowid
-        except Error as e:
-            print(f"Ошибка выполнения запроса: {e}")
         finally:
             cursor.close()
-            connection.close()
-    return None
 
-def execute_read_query(query, params=None):
+    return _with_retries(run, query, retries, commit=True)
+
+
+def execute_many(query, rows, batch_size=1000, retries=2):
+    """
+    Пакетная вставка / upsert: rows отправляются пачками по batch_size строк
+    через cursor.executemany (для INSERT коннектор склеивает пачку в один multi-row запрос),
+    каждая пачка — одна транзакция. Возвращает количество затронутых строк.
+
+    Если не прошла первая же пачка, возвращает None (ничего не записано). Если не прошла
+    одна из следующих — выбрасывает PartialWriteError с числом уже зафиксированных строк.
+
+    Пример upsert для таблицы oils:
+    INSERT INTO oils (name, volume, price) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE volume = VALUES(volume), price = VALUES(price)
+    """
+    rows = list(rows)
+    total = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+
+        def run(connection, batch=batch):
+            cursor = connection.cursor()
+            try:
+                cursor.executemany(query, batch)
+                return cursor.rowcount
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        affected = _with_retries(run, query, retries, commit=True)
+        if affected is None:
+            if start == 0:
+                return None
+            raise PartialWriteError(total)
+        total += affected
+    return total
+
+
+def execute_read_query(query, params=None, retries=2):
     """
     Выполняет запрос на выборку данных (SELECT) и возвращает результат в виде списка словарей.
     """
-    connection = get_connection()
-    result = None
-    if connection:
+    def run(connection):
+        cursor = connection.cursor(dictionary=True)
         try:
-            cursor = connection.cursor(dictionary=True)
             cursor.execute(query, params)
-            result = cursor.fetchall()
-            return result
-        except Error as e:
-            print(f"Ошибка выполнения запроса: {e}")
+            return cursor.fetchall()
         finally:
             cursor.close()
-            connection.close()
-    return result
+
+    return _with_retries(run, query, retries)
+
+
+def stream_read_query(query, params=None, batch_size=500):
+    """
+    Генератор для больших выборок: строки (словари) читаются с сервера небуферизованным
+    курсором пачками по batch_size, весь результат в память не загружается.
+    Соединение занято, пока генератор не исчерпан или не закрыт.
+    """
+    connection = get_connection()
+    if not connection:
+        return
+    started = time.perf_counter()
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except Error as e:
+        log.error("Ошибка выполнения запроса: %s", e)
+    finally:
+        try:
+            # Дочитываем хвост, иначе соединение вернётся в пул с незавершённым результатом
+            cursor.fetchall()
+        except Error:
+            pass
+        cursor.close()
+        connection.close()
+        _record_timing(query, time.perf_counter() - started)
+
+
+def get_query_stats():
+    """
+    Снимок статистики по запросам: {запрос: {"count", "avg", "max"}} (время в секундах).
+    """
+    with _stats_lock:
+        return {
+            query: {"count": count, "avg": total / count, "max": peak}
+            for query, (count, total, peak) in query_stats.items()
+        }
+
 
 # Пример использования
 if __name__ == "__main__":
@@ -76,13 +277,23 @@ if __name__ == "__main__":
     """
     execute_query(create_table_query)
     print("Таблица 'oils' создана (если не существовала).")
-    
+
     # Пример вставки новой записи
     insert_query = "INSERT INTO oils (name, volume, price) VALUES (%s, %s, %s)"
     new_id = execute_query(insert_query, ("Лаванда", 30.0, 200.0))
     print(f"Добавлена запись с id: {new_id}")
-    
+
+    # Пример пакетной вставки
+    inserted = execute_many(insert_query, [("Лимон", 15.0, 150.0), ("Мята", 15.0, 180.0)])
+    print(f"Пакетно добавлено записей: {inserted}")
+
     # Пример выборки данных
     select_query = "SELECT * FROM oils;"
     oils = execute_read_query(select_query)
     print("Содержимое таблицы 'oils':", oils)
+
+    # Пример потокового чтения
+    for oil in stream_read_query(select_query):
+        print("Потоково:", oil)
+
+    print("Статистика запросов:", get_query_stats())
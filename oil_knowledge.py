@@ -0,0 +1,279 @@
+# oil_knowledge.py
+
+import math
+import os
+import re
+from collections import Counter
+
+from catalog import normalize_name, stem_name, stem_word
+
+MONOGRAPHS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mono_oils.txt")
+
+# Заголовок монографии: "# BASIL / БАЗИЛИК" (у пары масел без решётки)
+_HEADER = re.compile(r"^#?\s*([A-Z][A-Z' -]+?)\s*/\s*(.+?)\s*$")
+
+# Метки полей. В файле встречаются варианты «Характеристика» вместо «Качество»
+# и слитное написание заглавными («ОТРИЦАТЕЛЬНЫЕЭМОЦИИ:»), поэтому пробелы необязательны.
+_FIELDS = [
+    ("quality", ("качество", "характеристика")),
+    ("negative", ("отрицательные эмоции",)),
+    ("positive", ("положительные качества",)),
+    ("complementary", ("комплементарные масла",)),
+    ("usage", ("применение",)),
+]
+_FIELD_PATTERNS = [
+    (field, re.compile(r"^\s*" + r"\s*".join(label.split()) + r"\s*:?\s*(.*)$", re.IGNORECASE))
+    for field, labels in _FIELDS
+    for label in labels
+]
+_LIST_FIELDS = ("negative", "positive", "complementary")
+
+
+class OilMonograph:
+    """
+    Одна монография из mono_oils.txt.
+    """
+    __slots__ = ("name_en", "name_ru", "quality", "description", "negative",
+                 "positive", "complementary", "usage")
+
+    def __init__(self, name_en, name_ru):
+        self.name_en = name_en
+        self.name_ru = name_ru
+        self.quality = ""
+        self.description = []
+        self.negative = []
+        self.positive = []
+        self.complementary = []
+        self.usage = []
+
+    @property
+    def title(self) -> str:
+        return self.name_ru.capitalize()
+
+    def __repr__(self):
+        return f"OilMonograph({self.name_en!r}, {self.name_ru!r})"
+
+
+def _split_list(value):
+    return [item.strip(" .;") for item in value.split(",") if item.strip(" .;")]
+
+
+def parse_monographs(text: str) -> list:
+    """
+    Разбирает текст mono_oils.txt в список OilMonograph.
+    """
+    records = []
+    current = None
+    in_usage = False
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        header = _HEADER.match(line)
+        if header:
+            current = OilMonograph(header.group(1).strip(), header.group(2).strip())
+            records.append(current)
+            in_usage = False
+            continue
+        if current is None or not line:
+            continue
+        # Вторая строка монографии повторяет русское название
+        if line.upper() == current.name_ru.upper():
+            continue
+
+        for field, pattern in _FIELD_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                value = match.group(1).strip()
+                if field == "usage":
+                    in_usage = True
+                    if value:
+                        current.usage.append(value)
+                elif field in _LIST_FIELDS:
+                    getattr(current, field).extend(_split_list(value))
+                else:
+                    current.quality = value
+                break
+        else:
+            if in_usage:
+                current.usage.append(line.lstrip("-").strip())
+            else:
+                current.description.append(line)
+    return records
+
+
+def tokenize(text: str) -> list:
+    return [stem_word(word) for word in normalize_name(text).split() if len(word) > 1]
+
+
+class BM25Index:
+    """
+    Инвертированный индекс с ранжированием BM25 (k1, b — стандартные параметры).
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}   # терм -> [(номер документа, частота)]
+        self.lengths = []
+        for doc_id, tokens in enumerate(documents):
+            counts = Counter(tokens)
+            self.lengths.append(len(tokens))
+            for term, freq in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, freq))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        total = len(self.lengths)
+        self.idf = {
+            term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(self, tokens, limit=3):
+        """
+        Возвращает [(номер документа, оценка)] по убыванию оценки.
+        """
+        scores = {}
+        for term in set(tokens):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+# Слова вопроса, которые определяют, какое поле монографии нужно
+_INTENTS = [
+    ("complementary", ("комплементарн", "сочета", "комбинир", "смешива")),
+    ("usage", ("применен", "применя", "использова", "наносит", "нанесен")),
+    ("negative", ("эмоци", "негатив")),
+    ("quality", ("качеств", "характеристик")),
+]
+# Поиск масла по состоянию: «масло от тревожности», «что помогает при усталости»
+_SYMPTOM_MARKERS = {"от", "при", "против"}
+_STOP_WORDS = {stem_word(word) for word in (
+    "масло", "масла", "эфирное", "какое", "какие", "что", "помогает", "помогают", "поможет",
+    "от", "при", "против", "для", "мне", "посоветуй", "посоветуйте", "нужно", "есть", "лучше",
+    "как", "чем", "ли", "с", "со", "к", "и", "мое", "моей", "скажи", "подскажи", "расскажи",
+)}
+
+
+class OilKnowledgeBase:
+    """
+    Локальная справка по монографиям: прямые вопросы про конкретное масло
+    и поиск масел по эмоциональному состоянию отвечаются без обращения к ассистенту.
+    answer() возвращает None, если уверенности недостаточно — тогда вопрос уходит ассистенту.
+    """
+    def __init__(self, records, min_score=2.0, max_words=8):
+        self.records = records
+        self.min_score = min_score
+        self.max_words = max_words
+
+        # Имена: полное русское, английское и отдельные значимые слова русского имени
+        self._names = {}
+        for record in records:
+            for alias in (record.name_ru, record.name_en):
+                self._names.setdefault(stem_name(alias), record)
+        # Основы отдельных слов русских названий («лаванд», «мят») — для AnswerCache.add_topics
+        self.name_terms = set()
+        for record in records:
+            for word in normalize_name(record.name_ru).split():
+                if len(word) >= 4 and word not in ("масло",):
+                    self._names.setdefault(stem_word(word), record)
+                    self.name_terms.add(stem_word(word))
+        self._max_name_words = max(len(key.split()) for key in self._names) if self._names else 1
+
+        # Поиск по состояниям: отрицательные эмоции весят больше описания
+        self.index = BM25Index([
+            tokenize(" ".join(record.negative)) * 3
+            + tokenize(" ".join(record.positive)) * 2
+            + tokenize(record.quality) * 2
+            + tokenize(" ".join(record.description))
+            for record in records
+        ])
+
+    @classmethod
+    def from_file(cls, path=MONOGRAPHS_PATH, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls(parse_monographs(f.read()), **kwargs)
+
+    def find_oil(self, tokens):
+        """
+        Ищет упоминание масла в вопросе: сначала самые длинные словосочетания.
+        """
+        return self._match_oil(tokens)[0]
+
+    def _match_oil(self, tokens):
+        """
+        Как find_oil, но возвращает (монография, слова названия) или (None, ()).
+        """
+        for size in range(min(self._max_name_words, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                record = self._names.get(" ".join(tokens[start:start + size]))
+                if record is not None:
+                    return record, tokens[start:start + size]
+        return None, ()
+
+    def answer(self, question: str):
+        """
+        Возвращает текст ответа или None, если вопрос лучше отдать ассистенту.
+        """
+        words = normalize_name(question).split()
+        if not words or len(words) > self.max_words:
+            return None
+        tokens = [stem_word(word) for word in words]
+        intent = next(
+            (field for field, markers in _INTENTS if any(t.startswith(markers) for t in tokens)),
+            None
+        )
+        record, name = self._match_oil(tokens)
+
+        if record is not None and intent is not None:
+            # Остались содержательные слова («беременным», «противопоказания», «с лекарствами») —
+            # вопрос уже не про поле монографии, а про то, чего в ней нет
+            markers = tuple(marker for _, field_markers in _INTENTS for marker in field_markers)
+            rest = [
+                token for token in tokens
+                if token not in _STOP_WORDS and token not in name and not token.startswith(markers)
+            ]
+            if rest:
+                return None
+            return self._describe_field(record, intent)
+        if record is None and (_SYMPTOM_MARKERS & set(words) or intent == "negative"):
+            return self._search_by_state(tokens)
+        return None
+
+    def _describe_field(self, record, field):
+        if field == "complementary" and record.complementary:
+            return f"🌿 {record.title} — комплементарные масла: {', '.join(record.complementary)}."
+        if field == "usage" and record.usage:
+            return f"🌿 {record.title} — применение:\n" + "\n".join(f"- {line}" for line in record.usage)
+        if field == "negative" and record.negative:
+            return f"🌿 {record.title} помогает работать с эмоциями: {', '.join(record.negative)}."
+        if field == "quality" and (record.quality or record.positive):
+            text = f"🌿 {record.title}"
+            if record.quality:
+                text += f" — качество: {record.quality}"
+            if record.positive:
+                text += f"\nПоложительные качества: {', '.join(record.positive)}"
+            return text + "."
+        return None
+
+    def _search_by_state(self, tokens):
+        query = [token for token in tokens if token not in _STOP_WORDS]
+        if not query:
+            return None
+        results = [(doc_id, score) for doc_id, score in self.index.search(query) if score >= self.min_score]
+        # Уверенный ответ — только если все слова запроса найдены прямо в списке эмоций
+        # или качеств: «головной боли» не совпадает с маслом, у которого есть лишь «боль»
+        confident = []
+        for doc_id, _ in results:
+            record = self.records[doc_id]
+            fields = set(tokenize(" ".join(record.negative + record.positive)))
+            if set(query) <= fields:
+                confident.append(record)
+        if not confident:
+            return None
+        lines = ["🌿 Могут подойти:"]
+        for record in confident:
+            quality = f" ({record.quality})" if record.quality else ""
+            lines.append(f"- {record.title}{quality}: {', '.join(record.negative[:5])}")
+        return "\n".join(lines)
@@ -0,0 +1,212 @@
+# pricing.py
+
+import argparse
+import csv
+import os
+import re
+import sys
+
+from catalog import normalize_name
+from lazy import lazy_import
+
+# NumPy нужен только для расчёта, а не для старта бота
+np = lazy_import("numpy")
+
+# Одна позиция рецепта: «лаванда 5», «лаванда - 5 капель», «лимон: 3», «5 капель мяты»
+_ITEM_RE = re.compile(r"^(?P<name>\D+?)\s*[-—–:=]?\s*(?P<drops>\d+)\s*(?:кап\w*\.?)?$")
+_ITEM_REVERSED_RE = re.compile(r"^(?P<drops>\d+)\s*(?:кап\w*\.?)?\s+(?P<name>\D+?)$")
+_SEPARATORS_RE = re.compile(r"[,;\n]+")
+
+
+class RecipeError(ValueError):
+    """
+    Рецепт не разобрался: item — позиция, которую не удалось прочитать.
+    """
+    def __init__(self, item):
+        self.item = item
+        super().__init__(f"не удалось разобрать позицию рецепта: {item!r}")
+
+
+def parse_recipe(text: str) -> list:
+    """
+    Разбирает рецепт «лаванда 5, лимон 3, мята 2» в [(название, капли), ...].
+    Позиции разделяются запятой, точкой с запятой или переводом строки.
+    """
+    items = []
+    for part in _SEPARATORS_RE.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        match = _ITEM_RE.match(part) or _ITEM_REVERSED_RE.match(part)
+        if match is None or int(match["drops"]) <= 0:
+            raise RecipeError(part)
+        items.append((match["name"].strip(" -—–:="), int(match["drops"])))
+    if not items:
+        raise RecipeError(text)
+    return items
+
+
+class Quote:
+    """
+    Расчёт одного рецепта: items — [(масло из прайса, капли, стоимость)],
+    unknown — названия, которых нет в прайсе.
+    """
+    __slots__ = ("items", "unknown", "total")
+
+    def __init__(self, items, unknown, total):
+        self.items = items
+        self.unknown = unknown
+        self.total = total
+
+    @property
+    def complete(self) -> bool:
+        return not self.unknown
+
+    def lines(self):
+        return [f"{oil}, {drops} капель — {cost:.0f}р" for oil, drops, cost in self.items]
+
+    def __repr__(self):
+        return f"Quote({len(self.items)} масел, total={self.total:.2f}, unknown={self.unknown!r})"
+
+
+class RecipePricer:
+    """
+    Расчёт стоимости рецептов по прайсу OilCatalog.
+
+    Цены капель (Price / (Vol * 25), см. OilEntry.drop_price) лежат в одном массиве NumPy;
+    названия из рецептов сопоставляются с прайсом через OilCatalog.find (с опечатками)
+    и кешируются, поэтому пачка из тысяч рецептов считается одной операцией над массивами.
+    Прайс обновился — нужен новый RecipePricer.
+    """
+    def __init__(self, catalog, max_cached=100000):
+        self.catalog = catalog
+        self.max_cached = max_cached
+        self._positions = {id(entry): index for index, entry in enumerate(catalog.entries)}
+        # Последний элемент — NaN для масел, которых нет в прайсе
+        self.drop_prices = np.append(
+            np.array([entry.drop_price for entry in catalog.entries], dtype=np.float64), np.nan
+        )
+        self._unknown = len(catalog.entries)
+        self._resolved = {}
+
+    def resolve(self, name) -> int:
+        """
+        Индекс масла в прайсе (или индекс NaN-заглушки, если масла нет).
+        """
+        index = self._resolved.get(name)
+        if index is None:
+            # Кеш названий растёт от пользовательского ввода — ограничиваем его размер
+            if len(self._resolved) >= self.max_cached:
+                self._resolved.clear()
+            key = normalize_name(name)
+            index = self._resolved.get(key)
+            if index is None:
+                entry = self.catalog.find(key)
+                index = self._positions[id(entry)] if entry is not None else self._unknown
+                self._resolved[key] = index
+            self._resolved[name] = index
+        return index
+
+    def missing(self, items) -> list:
+        """
+        Названия из items, которых нет в прайсе.
+        """
+        return [name for name, _ in items if self.resolve(name) == self._unknown]
+
+    def quote(self, items) -> Quote:
+        """
+        Считает один рецепт: items — [(название, капли)] или текст рецепта.
+        """
+        if isinstance(items, str):
+            items = parse_recipe(items)
+        priced, unknown = [], []
+        total = 0.0
+        for name, drops in items:
+            index = self.resolve(name)
+            if index == self._unknown:
+                unknown.append(name)
+                continue
+            cost = float(self.drop_prices[index]) * drops
+            priced.append((self.catalog.entries[index].name, drops, cost))
+            total += cost
+        return Quote(priced, unknown, total)
+
+    def price_many(self, recipes):
+        """
+        Итоговая стоимость каждого рецепта из recipes ([[(название, капли)], ...]).
+        Возвращает массив NumPy; у рецептов с неизвестными маслами — NaN.
+        """
+        flat = [item for items in recipes for item in items]
+        if not flat:
+            return np.zeros(len(recipes))
+        resolve = self.resolve
+        indices = np.fromiter((resolve(name) for name, _ in flat), dtype=np.intp, count=len(flat))
+        drops = np.fromiter((count for _, count in flat), dtype=np.float64, count=len(flat))
+        owners = np.repeat(np.arange(len(recipes)), [len(items) for items in recipes])
+        return np.bincount(owners, weights=self.drop_prices[indices] * drops, minlength=len(recipes))
+
+
+def price_csv(pricer, source, target) -> dict:
+    """
+    Пересчёт рецептов из CSV: строки (id, рецепт) -> (id, рецепт, стоимость, ошибка).
+    Возвращает статистику {"recipes", "priced", "failed"}.
+    """
+    rows = [row for row in csv.reader(source) if row]
+    recipes, errors = [], []
+    for row in rows:
+        try:
+            recipes.append(parse_recipe(row[1] if len(row) > 1 else ""))
+            errors.append("")
+        except RecipeError as e:
+            recipes.append([])
+            errors.append(str(e))
+    totals = pricer.price_many(recipes)
+
+    writer = csv.writer(target)
+    failed = 0
+    for row, items, total, error in zip(rows, recipes, totals, errors):
+        if not error and np.isnan(total):
+            error = "нет в прайсе: " + ", ".join(pricer.missing(items))
+        failed += bool(error)
+        writer.writerow([row[0], row[1] if len(row) > 1 else "", "" if error else f"{total:.2f}", error])
+    return {"recipes": len(rows), "priced": len(rows) - failed, "failed": failed}
+
+
+def main(argv=None):
+    from catalog_refresher import CatalogRefresher, parse_catalog_csv
+
+    parser = argparse.ArgumentParser(
+        description="Пересчёт стоимости рецептов (CSV: id, рецепт) по текущему прайсу"
+    )
+    parser.add_argument("recipes", help="CSV с рецептами, '-' — stdin")
+    parser.add_argument("-o", "--output", default="-", help="куда писать результат, '-' — stdout")
+    parser.add_argument("--catalog", default=os.getenv("CATALOG_SNAPSHOT", "oils_snapshot.csv"),
+                        help="снимок прайса (CSV Name, Vol, Price)")
+    parser.add_argument("--url", help="скачать свежий прайс по ссылке вместо снимка")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        refresher = CatalogRefresher(args.url, snapshot_path=args.catalog)
+        if not refresher.refresh() and not refresher.load_snapshot():
+            parser.error(f"не удалось загрузить прайс: {refresher.last_error}")
+        catalog = refresher.catalog
+    else:
+        with open(args.catalog, "rb") as f:
+            catalog = parse_catalog_csv(f.read())
+    pricer = RecipePricer(catalog)
+
+    source = sys.stdin if args.recipes == "-" else open(args.recipes, encoding="utf-8-sig", newline="")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        stats = price_csv(pricer, source, target)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    print(f"Рецептов: {stats['recipes']}, посчитано: {stats['priced']}, с ошибками: {stats['failed']} "
+          f"(прайс: {len(catalog)} позиций)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# rendering.py
+
+import re
+from string import Formatter
+
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+
+# Символы, которые MarkdownV2 требует экранировать в обычном тексте
+SPECIAL_CHARS = "\\_*[]()~`>#+-=|{}.!"
+
+# Экранирование за один проход по строке предкомпилированным регулярным выражением.
+# str.translate на кириллице в разы медленнее: у него быстрый путь только для ASCII.
+_TEXT_RE = re.compile("([" + re.escape(SPECIAL_CHARS) + "])")
+# Внутри `кода` экранируются только обратная кавычка и обратный слеш
+_CODE_RE = re.compile(r"([`\\])")
+
+# Экранированный символ или маркер сущности (жирный / код) в уже отрендеренном тексте
+_MARKUP_RE = re.compile(r"\\.|[`*]", re.S)
+
+
+def escape_markdown(text: str) -> str:
+    """
+    Экранирует обычный текст для MarkdownV2. Весь текст считается литеральным:
+    разметки в нём нет, поэтому экранировать его нужно ровно один раз.
+    """
+    return _TEXT_RE.sub(r"\\\1", text)
+
+
+def escape_code(text: str) -> str:
+    """
+    Экранирует текст для вставки внутрь `кода`.
+    """
+    return _CODE_RE.sub(r"\\\1", text)
+
+
+class Template:
+    """
+    Шаблон сообщения в MarkdownV2, экранируемый один раз — при создании (на импорте модуля).
+
+    В исходнике шаблона разметкой считаются только *жирный* и `код`, всё остальное —
+    обычный текст, который экранируется автоматически. Литеральные * и ` пишутся
+    через обратный слеш (\\* и \\`). Поля {name} (с необязательным форматом {name:.0f})
+    подставляются в render() и экранируются с учётом того, стоят ли они внутри `кода`.
+    Незакрытая разметка — ошибка ValueError сразу при создании шаблона.
+    """
+    __slots__ = ("source", "_parts", "_static")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts = _compile(source)
+        # Шаблон без полей рендерится один раз
+        static = len(self._parts) == 1 and self._parts[0][1] is None
+        self._static = self._parts[0][0] if static else None
+
+    def render(self, **values) -> str:
+        if self._static is not None:
+            return self._static
+        out = []
+        for literal, field, spec, conversion, in_code in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion:
+                value = _CONVERSIONS[conversion](value)
+            value = format(value, spec)
+            out.append(escape_code(value) if in_code else escape_markdown(value))
+        return "".join(out)
+
+    def __repr__(self):
+        return f"Template({self.source!r})"
+
+
+_CONVERSIONS = {"s": str, "r": repr, "a": ascii}
+
+
+def _compile(source):
+    """
+    Разбивает исходник шаблона на [(экранированный литерал, поле, формат, преобразование, внутри_кода)].
+    """
+    parts = []
+    bold = code = False
+    for literal, field, spec, conversion in Formatter().parse(source):
+        out = []
+        i = 0
+        while i < len(literal):
+            char = literal[i]
+            if char == "\\" and i + 1 < len(literal):
+                i += 1
+                out.append(escape_code(literal[i]) if code else escape_markdown(literal[i]))
+            elif char == "`":
+                code = not code
+                out.append(char)
+            elif char == "*" and not code:
+                bold = not bold
+                out.append(char)
+            else:
+                out.append(escape_code(char) if code else escape_markdown(char))
+            i += 1
+        if field is not None and (not field or not field.isidentifier()):
+            raise ValueError(f"Поле шаблона должно быть именем: {{{field}}}")
+        parts.append(("".join(out), field, spec or "", conversion, code))
+    if bold or code:
+        raise ValueError(f"Незакрытая разметка в шаблоне: {source!r}")
+    return parts
+
+
+def _scan_entities(text, bold, code):
+    """
+    Состояние открытых сущностей (жирный, код) после отрендеренного фрагмента text.
+    """
+    for match in _MARKUP_RE.finditer(text):
+        token = match.group()
+        if token == "`":
+            code = not code
+        elif token == "*" and not code:
+            bold = not bold
+    return bold, code
+
+
+def _find_cut(text, start, end):
+    """
+    Ищет место разреза в text[start:end]: граница абзаца, строки или слова
+    (не раньше середины окна), иначе жёсткий разрез. Escape-последовательность не разрывается.
+    """
+    floor = start + (end - start) // 2
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, floor, end)
+        if position != -1:
+            cut = position + len(separator)
+            break
+    else:
+        cut = end
+    # Нечётное число обратных слешей перед разрезом — разрезали бы пару "\x"
+    backslashes = 0
+    while cut - backslashes - 1 >= start and text[cut - backslashes - 1] == "\\":
+        backslashes += 1
+    if backslashes % 2:
+        cut -= 1
+    return cut
+
+
+def split_message(rendered: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Делит уже отрендеренный MarkdownV2-текст на сообщения не длиннее limit символов.
+
+    Разрез ищется по абзацам, строкам, словам; escape-последовательности не разрываются.
+    Если на разрезе открыт *жирный* или `код`, сущность закрывается в конце сообщения
+    и снова открывается в начале следующего, так что каждая часть — валидный MarkdownV2.
+    """
+    if len(rendered) <= limit:
+        return [rendered]
+    chunks = []
+    start = 0
+    bold = code = False
+    while start < len(rendered):
+        reopen = ("*" if bold else "") + ("`" if code else "")
+        # Запас в 2 символа на закрывающие маркеры
+        budget = limit - len(reopen) - 2
+        if len(rendered) - start <= budget + 2:
+            cut = len(rendered)
+        else:
+            cut = _find_cut(rendered, start, start + budget)
+        piece = rendered[start:cut]
+        bold, code = _scan_entities(piece, bold, code)
+        close = ("`" if code else "") + ("*" if bold else "")
+        body = (reopen + piece).rstrip(" \n")
+        if body.strip(" \n*`"):
+            chunks.append(body + close)
+        start = cut
+        while start < len(rendered) and rendered[start] in " \n":
+            start += 1
+    return chunks
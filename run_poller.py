@@ -0,0 +1,231 @@
+# run_poller.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from lazy import lazy_import
+from metrics import RUN_POLL_ITERATIONS
+from admission import retry_after_of
+
+openai = lazy_import("openai")
+log = logging.getLogger("aroma_bot.run_poller")
+
+# Статусы, после которых run больше не изменится
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+
+
+class RunFailedError(Exception):
+    """
+    Run завершился не статусом 'completed' (failed, expired, cancelled, requires_action и т.п.).
+    """
+    def __init__(self, run_id, status, last_error=None):
+        self.run_id = run_id
+        self.status = status
+        self.last_error = last_error
+        super().__init__(f"run {run_id} завершился со статусом {status}: {last_error}")
+
+
+class RunTimeoutError(RunFailedError):
+    """
+    Run не успел завершиться до дедлайна и был отменён.
+    """
+    def __init__(self, run_id):
+        super().__init__(run_id, "timeout", "превышен дедлайн ожидания")
+
+
+class _PollJob:
+    __slots__ = ("thread_id", "run_id", "future", "deadline", "delay", "polls")
+
+    def __init__(self, thread_id, run_id, future, deadline, delay):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.future = future
+        self.deadline = deadline
+        self.delay = delay
+        self.polls = 0
+
+
+class RunPoller:
+    """
+    Общий планировщик опроса статусов run'ов OpenAI Threads.
+
+    Все ожидающие run'ы лежат в одной куче, отсортированной по времени следующей проверки.
+    Сам запрос runs.retrieve выполняет небольшой пул потоков, поэтому сотни одновременных
+    диалогов обслуживаются несколькими воркерами, а поток телеграм-обработчика только
+    ждёт Future. Интервал опроса растёт экспоненциально (initial_delay * backoff^n, но не
+    больше max_delay), по истечении дедлайна run отменяется.
+    """
+    def __init__(self, client=None, workers=4, initial_delay=0.5, max_delay=4.0,
+                 backoff=1.5, deadline=120.0, clock=time.monotonic, on_throttle=None):
+        self.client = client or openai
+        # on_throttle(retry_after) — куда сообщать об ответах 429 (AdmissionController.throttle)
+        self.on_throttle = on_throttle
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.deadline = deadline
+        self.clock = clock
+
+        self._heap = []  # (время следующей проверки, порядковый номер, _PollJob)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run-poller")
+        self._thread = None
+        self._stopped = False
+
+    # --- Публичный интерфейс ---
+
+    def submit(self, thread_id: str, run_id: str, deadline: float = None) -> Future:
+        """
+        Ставит run на опрос и возвращает Future, который получит финальный объект run
+        (или исключение RunFailedError / RunTimeoutError).
+        Отмена Future (future.cancel()) отменяет и сам run на стороне OpenAI.
+        """
+        future = Future()
+        now = self.clock()
+        job = _PollJob(
+            thread_id,
+            run_id,
+            future,
+            now + (deadline if deadline is not None else self.deadline),
+            self.initial_delay,
+        )
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("RunPoller остановлен")
+            self._ensure_thread()
+            heapq.heappush(self._heap, (now + self.initial_delay, next(self._seq), job))
+            self._cond.notify()
+        return future
+
+    def wait(self, thread_id: str, run_id: str, deadline: float = None):
+        """
+        Блокирующая обёртка над submit(): дожидается терминального статуса run.
+        """
+        return self.submit(thread_id, run_id, deadline).result()
+
+    def pending(self) -> int:
+        """
+        Количество run'ов, которые сейчас ожидают опроса.
+        """
+        with self._cond:
+            return len(self._heap)
+
+    def shutdown(self, cancel_runs=True):
+        """
+        Останавливает планировщик. Незавершённые run'ы по умолчанию отменяются.
+        """
+        with self._cond:
+            self._stopped = True
+            jobs = [job for _, _, job in self._heap]
+            self._heap.clear()
+            self._cond.notify_all()
+        for job in jobs:
+            if cancel_runs:
+                self._cancel_run(job)
+            self._settle(job, exception=RunFailedError(job.run_id, "cancelled", "poller остановлен"))
+        self._pool.shutdown(wait=True)
+
+    # --- Внутренняя кухня ---
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="run-poller-scheduler", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        due = self._heap[0][0] - self.clock()
+                        if due <= 0:
+                            break
+                        self._cond.wait(timeout=due)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            self._pool.submit(self._check, job)
+
+    def _reschedule(self, job):
+        job.delay = min(job.delay * self.backoff, self.max_delay)
+        due = min(self.clock() + job.delay, job.deadline)
+        with self._cond:
+            if self._stopped:
+                self._settle(job, exception=RunFailedError(job.run_id, "cancelled", "poller остановлен"))
+                return
+            heapq.heappush(self._heap, (due, next(self._seq), job))
+            self._cond.notify()
+
+    def _settle(self, job, result=None, exception=None) -> bool:
+        """
+        Передаёт итог в Future. Вызывающая сторона могла отменить Future в любой момент
+        (в том числе пока шёл runs.retrieve) — тогда set_* выбросил бы InvalidStateError
+        в потоке пула. Возвращает False, если Future уже отменён или завершён.
+        """
+        try:
+            if exception is not None:
+                job.future.set_exception(exception)
+            else:
+                job.future.set_result(result)
+            return True
+        except InvalidStateError:
+            return False
+
+    def _cancel_run(self, job):
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=job.thread_id, run_id=job.run_id)
+        except Exception as e:
+            log.warning("Не удалось отменить run %s: %s", job.run_id, e)
+
+    def _check(self, job):
+        # Вызывающая сторона перестала ждать — run больше никому не нужен
+        if job.future.cancelled():
+            self._cancel_run(job)
+            return
+
+        job.polls += 1
+        try:
+            run = self.client.beta.threads.runs.retrieve(thread_id=job.thread_id, run_id=job.run_id)
+        except Exception as e:
+            # Сетевые сбои не фатальны, пока не вышел дедлайн
+            log.warning("Ошибка опроса run %s: %s", job.run_id, e)
+            run = None
+            retry_after = retry_after_of(e)
+            if retry_after is not None and self.on_throttle is not None:
+                self.on_throttle(retry_after)
+
+        if run is not None:
+            status = run.status
+            if status in TERMINAL_STATUSES or status == "requires_action":
+                RUN_POLL_ITERATIONS.observe(job.polls, status=status)
+            if status == "completed":
+                self._settle(job, result=run)
+                return
+            if status in TERMINAL_STATUSES:
+                self._settle(job, exception=RunFailedError(job.run_id, status, getattr(run, "last_error", None)))
+                return
+            if status == "requires_action":
+                # У ассистента нет обработчиков инструментов — такой run не завершится сам
+                self._cancel_run(job)
+                self._settle(job, exception=RunFailedError(job.run_id, status, "инструменты не поддерживаются"))
+                return
+
+        if self.clock() >= job.deadline:
+            RUN_POLL_ITERATIONS.observe(job.polls, status="timeout")
+            self._cancel_run(job)
+            self._settle(job, exception=RunTimeoutError(job.run_id))
+            return
+
+        # Отменили, пока шёл запрос, — run ещё не завершён, отменяем и его
+        if job.future.cancelled():
+            self._cancel_run(job)
+            return
+
+        self._reschedule(job)
@@ -0,0 +1,130 @@
+# streaming.py
+
+import logging
+import time
+
+from rendering import escape_markdown, split_message
+
+log = logging.getLogger("aroma_bot.streaming")
+
+
+class StreamingReply:
+    """
+    Потоковый ответ в Telegram: сразу отправляет сообщение-заглушку, а затем
+    по мере поступления кусочков текста редактирует его через edit_message_text.
+
+    Правки объединяются: не чаще одной в min_interval секунд на чат
+    (Telegram ограничивает частоту редактирования). При каждой правке экранируется
+    весь накопленный текст целиком, поэтому разметка MarkdownV2 остаётся корректной
+    на любой границе кусочка — escape-последовательность не может «разрезаться».
+    Ответ длиннее лимита Telegram делится split_message: переполненное сообщение
+    остаётся как есть, продолжение уходит следующими сообщениями.
+    """
+    def __init__(self, bot, message, escape=escape_markdown, placeholder="⏳", min_interval=1.0,
+                 parse_mode="MarkdownV2", clock=time.monotonic, split=split_message):
+        self.bot = bot
+        self.message = message
+        self.escape = escape
+        self.split = split
+        self.placeholder = placeholder
+        self.min_interval = min_interval
+        self.parse_mode = parse_mode
+        self.clock = clock
+
+        self.sent = None          # сообщение-заглушка, которое потом редактируем
+        self.parts = []           # все отправленные сообщения ответа (первое — заглушка)
+        self._chunks = []
+        self._last_rendered = []  # последний отправленный текст каждого сообщения
+        self._next_edit_at = 0.0
+        self.edits = 0
+
+    @property
+    def text(self) -> str:
+        """
+        Накопленный на данный момент текст ответа (без экранирования).
+        """
+        return "".join(self._chunks).replace("\\n", "\n").strip()
+
+    def start(self):
+        """
+        Отправляет заглушку в ответ на сообщение пользователя.
+        """
+        placeholder = self.escape(self.placeholder)
+        self.sent = self.bot.reply_to(self.message, placeholder, parse_mode=self.parse_mode)
+        self.parts = [self.sent]
+        self._last_rendered = [placeholder]
+        self._next_edit_at = self.clock() + self.min_interval
+        return self.sent
+
+    def feed(self, delta: str):
+        """
+        Добавляет очередной кусочек текста; правка отправляется, только если
+        с прошлой правки прошло не меньше min_interval.
+        """
+        self._chunks.append(delta)
+        if self.clock() >= self._next_edit_at:
+            self._flush()
+
+    def finish(self, fallback: str = None):
+        """
+        Отправляет финальную версию текста. Если ассистент ничего не прислал,
+        в сообщение подставляется fallback — уже отрендеренный MarkdownV2
+        (Template.render()), поэтому он не экранируется повторно.
+        """
+        if not self.text and fallback:
+            for index, rendered in enumerate(self.split(fallback)):
+                self._send_part(index, rendered, final=True)
+            return
+        self._flush(final=True)
+
+    def _flush(self, final=False):
+        text = self.text
+        if not text:
+            return
+        for index, rendered in enumerate(self.split(self.escape(text))):
+            if not self._send_part(index, rendered, final):
+                return
+        self._next_edit_at = self.clock() + self.min_interval
+
+    def _send_part(self, index, rendered, final):
+        """
+        Доводит index-е сообщение ответа до текста rendered: правит уже отправленное
+        или отправляет новое. Возвращает False, если Telegram отказал.
+        """
+        # Telegram отвечает ошибкой на правку без изменений
+        if index < len(self._last_rendered) and rendered == self._last_rendered[index]:
+            return True
+        try:
+            if index < len(self.parts):
+                self.bot.edit_message_text(
+                    rendered,
+                    chat_id=self.sent.chat.id,
+                    message_id=self.parts[index].message_id,
+                    parse_mode=self.parse_mode
+                )
+                self._last_rendered[index] = rendered
+            else:
+                self.parts.append(self.bot.send_message(self.sent.chat.id, rendered, parse_mode=self.parse_mode))
+                self._last_rendered.append(rendered)
+            self.edits += 1
+            return True
+        except Exception as e:
+            retry_after = _retry_after(e)
+            log.warning("Не удалось отредактировать сообщение: %s", e)
+            if retry_after:
+                self._next_edit_at = self.clock() + retry_after
+            if final:
+                # Последняя правка не прошла — отправляем эту часть ответа отдельным сообщением
+                self.bot.reply_to(self.message, rendered, parse_mode=self.parse_mode)
+                return True
+            return False
+
+
+def _retry_after(error) -> float:
+    """
+    Достаёт retry_after из ответа Telegram с кодом 429 (ApiTelegramException.result_json).
+    """
+    result_json = getattr(error, "result_json", None) or {}
+    if getattr(error, "error_code", None) != 429:
+        return 0.0
+    return float(result_json.get("parameters", {}).get("retry_after", 0) or 0)
@@ -0,0 +1,275 @@
+# thread_store.py
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from admission import call_with_retries
+from lazy import lazy_import
+openai = lazy_import("openai")
+log = logging.getLogger("aroma_bot.thread_store")
+
+
+class ThreadStore:
+    """
+    Интерфейс хранилища соответствий user_id -> (thread_id, last_access).
+    """
+    def get(self, user_id):
+        """
+        Возвращает (thread_id, last_access) или None.
+        """
+        raise NotImplementedError
+
+    def put(self, user_id, thread_id, last_access):
+        raise NotImplementedError
+
+    def touch(self, user_id, last_access):
+        """
+        Обновляет время последнего обращения к треду пользователя.
+        """
+        raise NotImplementedError
+
+    def pop(self, user_id):
+        """
+        Удаляет запись и возвращает (thread_id, last_access) или None.
+        """
+        raise NotImplementedError
+
+    def pop_expired(self, older_than, limit):
+        """
+        Удаляет и возвращает до limit записей [(user_id, thread_id), ...],
+        к которым не обращались с момента older_than.
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryThreadStore(ThreadStore):
+    """
+    Хранилище в памяти процесса: LRU с ограничением max_size.
+    Записи, вытесненные по размеру, отдаются sweeper'у вместе с протухшими,
+    чтобы их треды тоже удалялись на стороне OpenAI.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._items = OrderedDict()  # user_id -> (thread_id, last_access), от старых к новым
+        self._evicted = []           # [(user_id, thread_id)] вытесненные по размеру
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._items.get(user_id)
+
+    def put(self, user_id, thread_id, last_access):
+        with self._lock:
+            self._items[user_id] = (thread_id, last_access)
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_size:
+                old_user, (old_thread, _) = self._items.popitem(last=False)
+                self._evicted.append((old_user, old_thread))
+
+    def touch(self, user_id, last_access):
+        with self._lock:
+            if user_id in self._items:
+                thread_id, _ = self._items[user_id]
+                self._items[user_id] = (thread_id, last_access)
+                self._items.move_to_end(user_id)
+
+    def pop(self, user_id):
+        with self._lock:
+            return self._items.pop(user_id, None)
+
+    def pop_expired(self, older_than, limit):
+        with self._lock:
+            batch = self._evicted[:limit]
+            del self._evicted[:limit]
+            # Порядок OrderedDict совпадает с порядком обращений: самые старые в начале
+            while len(batch) < limit and self._items:
+                user_id, (thread_id, last_access) = next(iter(self._items.items()))
+                if last_access >= older_than:
+                    break
+                self._items.popitem(last=False)
+                batch.append((user_id, thread_id))
+            return batch
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class SQLiteThreadStore(ThreadStore):
+    """
+    Хранилище в SQLite: соответствия переживают перезапуск, а несколько процессов бота
+    могут работать с одним файлом (режим WAL).
+    """
+    def __init__(self, path="threads.sqlite3"):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                " user_id INTEGER PRIMARY KEY,"
+                " thread_id TEXT NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access)")
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT thread_id, last_access FROM threads WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, user_id, thread_id, last_access):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO threads (user_id, thread_id, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET thread_id = excluded.thread_id, "
+                "last_access = excluded.last_access",
+                (user_id, thread_id, last_access)
+            )
+
+    def touch(self, user_id, last_access):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE threads SET last_access = ? WHERE user_id = ?", (last_access, user_id)
+            )
+
+    def pop(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "DELETE FROM threads WHERE user_id = ? RETURNING thread_id, last_access", (user_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def pop_expired(self, older_than, limit):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT user_id, thread_id FROM threads WHERE last_access < ? "
+                    "ORDER BY last_access LIMIT ?",
+                    (older_than, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM threads WHERE user_id = ? AND last_access < ?",
+                    [(user_id, older_than) for user_id, _ in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [tuple(row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+
+class ThreadSweeper:
+    """
+    Фоновый поток, который раз в interval секунд забирает из хранилища протухшие
+    треды пачками по batch_size и удаляет их на стороне OpenAI.
+
+    Удаление идёт через call_with_retries (429 сообщаются в on_throttle). Треды, которые
+    удалить так и не удалось, запоминаются и повторяются в следующих проходах (не больше
+    max_retry_queue штук) — запись в хранилище уже удалена, и иначе тред остался бы
+    на стороне OpenAI навсегда.
+    """
+    def __init__(self, store, time_limit, interval=60.0, batch_size=50, client=None,
+                 on_throttle=None, max_retry_queue=10000):
+        self.store = store
+        self.time_limit = time_limit
+        self.interval = interval
+        self.batch_size = batch_size
+        self.client = client or openai
+        self.on_throttle = on_throttle
+        self.deleted = 0
+        self.failed = 0
+        self._retry = deque(maxlen=max_retry_queue)  # thread_id, которые не удалось удалить
+        self._retry_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def retry_later(self, thread_id):
+        """
+        Ставит тред в очередь на удаление (например, если его не удалось удалить на месте).
+        """
+        with self._retry_lock:
+            if len(self._retry) == self._retry.maxlen:
+                log.warning("Очередь повторного удаления тредов переполнена, тред %s забыт", self._retry[0])
+            self._retry.append(thread_id)
+
+    def pending_retries(self) -> int:
+        with self._retry_lock:
+            return len(self._retry)
+
+    def _delete(self, thread_id) -> bool:
+        try:
+            call_with_retries(self.client.beta.threads.delete, thread_id=thread_id, on_throttle=self.on_throttle)
+            return True
+        except Exception as e:
+            # Тред уже удалён (например, другой репликой) — считать ошибкой нечего
+            if getattr(e, "status_code", None) == 404:
+                return True
+            log.warning("Не удалось удалить тред %s: %s", thread_id, e)
+            self.failed += 1
+            return False
+
+    def sweep(self) -> int:
+        """
+        Один проход: удаляет все протухшие треды. Возвращает их количество.
+        """
+        swept = 0
+        failed = []
+        # Сначала треды, которые не удалось удалить в прошлые проходы
+        with self._retry_lock:
+            retry, self._retry = list(self._retry), deque(maxlen=self._retry.maxlen)
+        for thread_id in retry:
+            if self._delete(thread_id):
+                swept += 1
+            else:
+                failed.append(thread_id)
+
+        older_than = time.time() - self.time_limit
+        while True:
+            batch = self.store.pop_expired(older_than, self.batch_size)
+            for _, thread_id in batch:
+                if self._delete(thread_id):
+                    swept += 1
+                else:
+                    failed.append(thread_id)
+            if len(batch) < self.batch_size:
+                break
+        for thread_id in failed:
+            self.retry_later(thread_id)
+        self.deleted += swept
+        return swept
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="thread-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                swept = self.sweep()
+                if swept:
+                    log.info("Sweeper удалил протухших тредов: %d", swept)
+            except Exception:
+                log.exception("Ошибка sweeper'а тредов")
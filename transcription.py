@@ -0,0 +1,87 @@
+# transcription.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import RateLimited
+
+log = logging.getLogger("aroma_bot.transcription")
+
+
+def plan_chunks(speech, total_ms, max_chunk_ms=30000, padding_ms=200):
+    """
+    Группирует участки речи [(start_ms, end_ms)] в куски не длиннее max_chunk_ms.
+    Куски режутся только по паузам между участками; участок длиннее max_chunk_ms
+    (монолог без пауз) режется принудительно. Каждый кусок расширяется на padding_ms,
+    чтобы не обрезать края слов.
+    """
+    chunks = []
+    for start, end in speech:
+        # Слишком длинный участок без пауз — режем по max_chunk_ms
+        while end - start > max_chunk_ms:
+            chunks.append([start, start + max_chunk_ms])
+            start += max_chunk_ms
+        if chunks and end - chunks[-1][0] <= max_chunk_ms:
+            chunks[-1][1] = end
+        else:
+            chunks.append([start, end])
+    return [(max(0, start - padding_ms), min(total_ms, end + padding_ms)) for start, end in chunks]
+
+
+class ChunkedTranscriber:
+    """
+    Распознаёт длинные голосовые сообщения по кускам параллельно.
+
+    transcribe_chunk(upload, **kwargs) -> str — функция распознавания одного куска (Whisper);
+    kwargs из transcribe() передаются ей как есть.
+    Сообщения короче min_chunked_ms уходят одним запросом, длинные режутся по паузам
+    (plan_chunks), куски распознаются на общем пуле из workers потоков с повтором
+    при ошибке (retries раз, пауза retry_delay * номер попытки), текст склеивается по порядку.
+    """
+    def __init__(self, transcribe_chunk, workers=4, retries=2, retry_delay=1.0,
+                 max_chunk_ms=30000, min_chunked_ms=45000):
+        self.transcribe_chunk = transcribe_chunk
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_chunk_ms = max_chunk_ms
+        self.min_chunked_ms = min_chunked_ms
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+
+    def transcribe(self, prepared, **kwargs) -> str:
+        """
+        prepared — audio.PreparedAudio (или объект с тем же интерфейсом:
+        segment, speech и export(segment)).
+        """
+        total_ms = len(prepared.segment)
+        if total_ms < self.min_chunked_ms:
+            return self._transcribe_with_retries(prepared.export(), kwargs)
+
+        chunks = plan_chunks(prepared.speech, total_ms, self.max_chunk_ms)
+        log.debug("Длинное сообщение (%d мс) разбито на %d кусков", total_ms, len(chunks))
+        futures = [
+            self._pool.submit(self._transcribe_piece, prepared, start, end, kwargs)
+            for start, end in chunks
+        ]
+        texts = [future.result() for future in futures]
+        return " ".join(text for text in texts if text)
+
+    def _transcribe_piece(self, prepared, start, end, kwargs):
+        return self._transcribe_with_retries(prepared.export(prepared.segment[start:end]), kwargs)
+
+    def _transcribe_with_retries(self, upload, kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                upload.seek(0)
+                return self.transcribe_chunk(upload, **kwargs).strip()
+            except RateLimited:
+                # Очередь допуска уже ждала max_wait — повтор только удлинит ожидание
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                log.warning("Ошибка распознавания куска (попытка %d): %s", attempt + 1, e)
+                time.sleep(self.retry_delay * (attempt + 1))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
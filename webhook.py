@@ -0,0 +1,304 @@
+# webhook.py
+
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import signal
+from collections import OrderedDict
+
+from dispatcher import chat_key_of
+from metrics import REGISTRY
+
+log = logging.getLogger("aroma_bot.webhook")
+
+WEBHOOK_REQUESTS = REGISTRY.counter("aroma_webhook_requests_total", "Запросы к webhook-серверу по коду ответа")
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+
+def is_loopback(host) -> bool:
+    """
+    Адрес доступен только с этой машины (127.0.0.1, ::1, localhost).
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class _HttpError(Exception):
+    def __init__(self, status):
+        self.status = status
+        super().__init__(status)
+
+
+def parse_telebot_update(data):
+    """
+    Превращает JSON обновления в telebot.types.Update.
+    """
+    from telebot.types import Update
+    return Update.de_json(data)
+
+
+class WebhookServer:
+    """
+    Лёгкий асинхронный HTTP-сервер для режима webhook (только стандартная библиотека).
+
+    POST {path} — обновление от Telegram: проверяется заголовок
+    X-Telegram-Bot-Api-Secret-Token, обновление раскладывается в ChatDispatcher
+    и сервер сразу отвечает 200 — обработчики работают в пуле диспетчера.
+    Повторная доставка того же update_id (Telegram повторяет при таймауте) игнорируется.
+    GET /healthz — процесс жив; GET /readyz — готов принимать обновления
+    (ready() истинно и сервер не останавливается). GET /metrics — метрики Prometheus,
+    только при serve_metrics=True: webhook обычно слушает публичный адрес, а метрики
+    наружу не отдаются (для них есть отдельный METRICS_PORT на 127.0.0.1).
+
+    Остановка (SIGTERM/SIGINT или stop()): /readyz и новые обновления получают 503,
+    чтобы Telegram доставил их другой реплике или повторил позже; затем сервер
+    дожидается текущих HTTP-запросов и очередей диспетчера (не дольше drain_timeout).
+    """
+    def __init__(self, dispatcher, secret_token, host="0.0.0.0", port=8080, path="/webhook",
+                 parse_update=parse_telebot_update, ready=None, max_body=1024 * 1024,
+                 idle_timeout=75.0, drain_timeout=30.0, dedup_size=10000, serve_metrics=False):
+        if not secret_token:
+            raise ValueError("Для webhook нужен секретный токен (WEBHOOK_SECRET)")
+        self.dispatcher = dispatcher
+        self.secret_token = secret_token.encode("utf-8")
+        self.host = host
+        self.port = port
+        self.path = path
+        self.parse_update = parse_update
+        self.ready = ready or (lambda: True)
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.drain_timeout = drain_timeout
+        self.dedup_size = dedup_size
+        self.serve_metrics = serve_metrics
+
+        self.draining = False
+        self.received = 0
+        self.duplicates = 0
+        self._seen = OrderedDict()  # последние принятые update_id
+        self._pending = set()       # update_id, которые сейчас разбираются и ставятся в очередь
+        self._server = None
+        self._in_flight = 0
+        self._idle = None
+        self._stopped = None
+
+    # --- Жизненный цикл ---
+
+    async def start(self):
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("Webhook-сервер слушает %s:%d%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        """
+        Плавная остановка: перестаём принимать обновления, дожидаемся текущих
+        запросов и очередей диспетчера.
+        """
+        if self.draining:
+            await self._stopped.wait()
+            return
+        self.draining = True
+        log.info("Webhook-сервер останавливается, дожидаемся текущих обновлений")
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("Не дождались %d HTTP-запросов за %.0f с", self._in_flight, self.drain_timeout)
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.run_in_executor(None, self.dispatcher.shutdown), self.drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("Очереди диспетчера не опустели за %.0f с: %d обновлений",
+                        self.drain_timeout, self.dispatcher.depth())
+        self._stopped.set()
+
+    async def serve(self):
+        """
+        Запускает сервер и работает до SIGTERM/SIGINT (или вызова stop()).
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, lambda: asyncio.ensure_future(self.stop()))
+            except (NotImplementedError, RuntimeError):
+                pass  # не главный поток или Windows — останавливаемся через stop()
+        await self._stopped.wait()
+        log.info("Webhook-сервер остановлен")
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 413, close=True)
+                    break
+                self._request_started()
+                try:
+                    keep_alive = await self._handle_request(head, reader, writer)
+                finally:
+                    self._request_finished()
+                if not keep_alive or self.draining:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _request_started(self):
+        self._in_flight += 1
+        self._idle.clear()
+
+    def _request_finished(self):
+        self._in_flight -= 1
+        if not self._in_flight:
+            self._idle.set()
+
+    async def _handle_request(self, head, reader, writer) -> bool:
+        try:
+            method, target, version, headers = _parse_head(head)
+        except ValueError:
+            await self._respond(writer, 400, close=True)
+            return False
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self._respond(writer, 400, close=True)
+            return False
+        if length > self.max_body:
+            await self._respond(writer, 413, close=True)
+            return False
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout) if length else b""
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return False
+
+        path = target.split("?", 1)[0]
+        try:
+            if path == self.path:
+                if method != "POST":
+                    raise _HttpError(405)
+                status = await self._receive_update(headers, body)
+                await self._respond(writer, status, close=not keep_alive)
+            elif (path in ("/healthz", "/readyz") or path == "/metrics" and self.serve_metrics) and method == "GET":
+                status, text, content_type = self._status_page(path)
+                await self._respond(writer, status, text, content_type, close=not keep_alive)
+            else:
+                raise _HttpError(404)
+        except _HttpError as e:
+            await self._respond(writer, e.status, close=not keep_alive)
+        return keep_alive
+
+    async def _receive_update(self, headers, body) -> int:
+        token = headers.get("x-telegram-bot-api-secret-token", "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret_token):
+            log.warning("Webhook: запрос с неверным секретным токеном")
+            raise _HttpError(401)
+        if self.draining:
+            raise _HttpError(503)
+        try:
+            data = json.loads(body)
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            raise _HttpError(400)
+        if update_id in self._seen or update_id in self._pending:
+            self.duplicates += 1
+            return 200
+        # update_id считается принятым только после разбора и постановки в очередь:
+        # если что-то сорвалось, Telegram получит ошибку и повторная доставка не отбросится
+        self._pending.add(update_id)
+        try:
+            try:
+                update = self.parse_update(data)
+            except Exception:
+                log.exception("Webhook: не удалось разобрать обновление %s", update_id)
+                raise _HttpError(400)
+            # submit может заблокироваться при переполнении очередей — не держим event loop
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.dispatcher.submit, chat_key_of(update), update
+                )
+            except Exception:
+                log.exception("Webhook: не удалось поставить обновление %s в очередь", update_id)
+                raise _HttpError(503)
+        finally:
+            self._pending.discard(update_id)
+        self.received += 1
+        self._remember(update_id)
+        return 200
+
+    def _remember(self, update_id):
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+
+    def _status_page(self, path):
+        if path == "/healthz":
+            return 200, "ok\n", "text/plain; charset=utf-8"
+        if path == "/readyz":
+            if self.draining or not self.ready():
+                return 503, "not ready\n", "text/plain; charset=utf-8"
+            return 200, "ready\n", "text/plain; charset=utf-8"
+        return 200, REGISTRY.render(), "text/plain; version=0.0.4; charset=utf-8"
+
+    async def _respond(self, writer, status, text="", content_type="text/plain; charset=utf-8", close=False):
+        WEBHOOK_REQUESTS.inc(code=str(status))
+        body = (text or f"{_REASONS.get(status, '')}\n").encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("ascii") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def _parse_head(head: bytes):
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def install_webhook(bot, url, secret_token, **kwargs):
+    """
+    Регистрирует webhook в Telegram (повторная регистрация того же адреса безопасна,
+    поэтому её может делать каждая реплика при старте). Обновления, накопленные
+    в режиме long polling, не теряются (drop_pending_updates=False).
+    """
+    return bot.set_webhook(url=url, secret_token=secret_token, drop_pending_updates=False, **kwargs)